@@ -23,8 +23,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'store.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'store.query_budget.QueryBudgetMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -32,6 +34,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'store.profiling.ProfilingMiddleware',
 ]
 
 
@@ -71,6 +74,99 @@ DATABASES = {
     }
 }
 
+# Cached responses and catalog change records (store/catalog.py) live here. With
+# several worker processes a shared backend (Redis/Memcached) lets them reuse each
+# other's work; the catalog version itself is shared through the database either way.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'store',
+    }
+}
+
+# Per-process autocomplete index (store/suggestions.py): hard cap on indexed
+# word-start keys, and how often to rebuild for fresh popularity counts
+SEARCH_SUGGESTIONS_MAX_ENTRIES = 500_000
+SEARCH_SUGGESTIONS_REBUILD_SECONDS = 60 * 60
+
+# Cache-Control max-age for catalog responses; clients revalidate with ETags after it
+CATALOG_CACHE_MAX_AGE = 60
+
+# The catalog version (store/catalog.py) lives in the database; each process
+# reads it through the cache at most this often
+CATALOG_VERSION_CACHE_SECONDS = 1
+
+# Per-process cache of encoded product JSON (store/fragments.py), LRU-evicted past this size
+PRODUCT_FRAGMENT_CACHE_BYTES = 16 * 1024 * 1024
+
+# Per-request query budgets and N+1 detection (store/query_budget.py). Budgets are
+# declared per viewset action (`query_budgets`); problems are logged, or raised
+# when QUERY_BUDGET_RAISE is set
+QUERY_BUDGET_ENABLED = DEBUG
+QUERY_BUDGET_RAISE = False
+QUERY_BUDGET_REPEAT_THRESHOLD = 5
+
+# Stock taken by an order that is still unpaid after this long is given back
+# (store/inventory.py, run the release_expired_reservations command periodically)
+STOCK_RESERVATION_MINUTES = 30
+
+# Cart pricing (store/pricing.py). Each shipping zone has a flat rate and a subtotal
+# above which shipping is free; tax is a rate on the subtotal. Countries are ISO codes,
+# '*' covers every country not listed. Identical carts are quoted from the cache for
+# CART_QUOTE_CACHE_SECONDS
+SHIPPING_ZONES = {
+    'domestic': {'countries': ['US'], 'rate': '10.00', 'free_over': '100.00'},
+    'international': {'countries': ['*'], 'rate': '25.00', 'free_over': '250.00'},
+}
+TAX_RATES = {'US': '0.08', '*': '0'}
+CART_QUOTE_CACHE_SECONDS = 60
+
+# Request-phase timing (store/metrics.py): Server-Timing headers and the
+# Prometheus /metrics endpoint, which answers these addresses and staff users
+METRICS_ENABLED = True
+METRICS_SERVER_TIMING = True
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Opt-in profiling of staff requests (store/profiling.py), listed at /admin/profiles/
+PROFILING_ENABLED = True
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_RING_SIZE = 50
+
+# Queries slower than SLOW_QUERY_MS are logged with their plan and call site
+# (store/slow_queries.py) to a rotating file, grouped at /admin/slow-queries/
+SLOW_QUERY_LOG_ENABLED = True
+SLOW_QUERY_MS = 100
+LOG_DIR = BASE_DIR / 'logs'
+# Created by the log handler when the first slow query is written
+SLOW_QUERY_LOG_FILE = LOG_DIR / 'slow_queries.log'
+
+# 'store' loggers: warnings and errors are always written, DEBUG/INFO records
+# are sampled at STORE_LOG_SAMPLE_RATE
+STORE_LOG_LEVEL = os.environ.get('STORE_LOG_LEVEL', 'INFO')
+STORE_LOG_SAMPLE_RATE = float(os.environ.get('STORE_LOG_SAMPLE_RATE', '1.0' if DEBUG else '0.1'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sampled': {'()': 'store.log.SampleFilter', 'rate': STORE_LOG_SAMPLE_RATE},
+    },
+    'handlers': {
+        'store_console': {'class': 'logging.StreamHandler', 'filters': ['sampled']},
+        'slow_queries': {
+            'class': 'store.log.LazyRotatingFileHandler',
+            'filename': SLOW_QUERY_LOG_FILE,
+            'maxBytes': 5 * 1024 * 1024,
+            'backupCount': 5,
+        },
+    },
+    'loggers': {
+        'store': {'handlers': ['store_console'], 'level': STORE_LOG_LEVEL, 'propagate': False},
+        # One JSON record per line, read back by the admin page
+        'store.slow_queries': {'handlers': ['slow_queries'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -115,7 +211,8 @@ CORS_ALLOW_ALL_ORIGINS = True
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny'],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        # TokenAuthentication, timed as the `auth` phase
+        'store.metrics.TimedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'store.pagination.CustomPagination',
     'PAGE_SIZE': 12,
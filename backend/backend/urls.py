@@ -3,7 +3,11 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from store import admin_views
+
 urlpatterns = [
+    # Diagnostics pages go before the admin site, which 404s anything it doesn't know
+    path('admin/', include(admin_views)),
     path('admin/', admin.site.urls),
     path('', include('store.urls')),  # Make sure this line exists
     # Any other paths...
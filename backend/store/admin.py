@@ -3,10 +3,11 @@ from django import forms
 from django.urls import path
 from django.utils.safestring import mark_safe
 from .models import (
-    Category, SubCategory, Product, ProductImage, 
+    Category, SubCategory, Product, ProductImage, ProductVariant,
     Order, OrderItem, Review, WishlistItem, UserProfile, Address
 )
 from . import views  # Make sure to import views here
+from .category_tree import category_tree
 
 # Product Admin with Tabbed Interface
 class ProductImageInline(admin.TabularInline):
@@ -14,6 +15,12 @@ class ProductImageInline(admin.TabularInline):
     extra = 1
     fields = ['image', 'alt_text', 'is_feature', 'display_order']
 
+class ProductVariantInline(admin.TabularInline):
+    """Stock per size/color; a product without variants isn't stock-tracked"""
+    model = ProductVariant
+    extra = 0
+    fields = ['size', 'color', 'sku', 'stock']
+
 class ProductAdminForm(forms.ModelForm):
     description = forms.CharField(widget=forms.Textarea(attrs={'rows': 5}))
     sizes = forms.CharField(
@@ -50,7 +57,7 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ('name', 'description', 'sku')
     prepopulated_fields = {'slug': ('name',)}
     readonly_fields = ('created_at', 'updated_at')
-    inlines = [ProductImageInline]
+    inlines = [ProductImageInline, ProductVariantInline]
     save_on_top = True
     
     fieldsets = (
@@ -118,12 +125,13 @@ class CategoryAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     inlines = [SubCategoryInline]
     
+    # Counts come from the cached category tree: no COUNT query per row
     def subcategory_count(self, obj):
-        return obj.subcategories.count()
+        return category_tree.counts().get(obj.id, (0, 0))[0]
     subcategory_count.short_description = 'Subcategories'
     
     def product_count(self, obj):
-        return Product.objects.filter(category=obj).count()
+        return category_tree.counts().get(obj.id, (0, 0))[1]
     product_count.short_description = 'Products'
 
 # Register other models
@@ -0,0 +1,107 @@
+"""Staff-only diagnostics pages, mounted under /admin/ in backend/urls.py"""
+import os
+import pstats
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+from django.urls import path
+
+from . import profiling, slow_queries
+from .query_budget import query_shape
+
+PROFILE_SORTS = ('cumulative', 'tottime', 'ncalls')
+
+
+def function_rows(path, sort, limit=40):
+    stats = pstats.Stats(str(path))
+    rows = []
+    for (filename, line, name), (primitive, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            'function': name,
+            'where': f'{os.path.basename(filename)}:{line}' if line else filename,
+            'path': filename,
+            'ncalls': calls if calls == primitive else f'{calls}/{primitive}',
+            'calls': calls,
+            'tottime': tottime,
+            'cumtime': cumtime,
+        })
+    key = {'cumulative': 'cumtime', 'tottime': 'tottime', 'ncalls': 'calls'}[sort]
+    rows.sort(key=lambda row: row[key], reverse=True)
+    return rows[:limit], stats.total_tt
+
+
+def query_groups(queries):
+    """Queries grouped by shape, slowest total first"""
+    groups = defaultdict(lambda: {'count': 0, 'ms': 0.0, 'sites': set()})
+    for query in queries:
+        group = groups[query_shape(query['sql'])]
+        group['count'] += 1
+        group['ms'] += query['ms']
+        group['sites'].add(query['site'])
+    return sorted(
+        ({'shape': shape, 'count': group['count'], 'ms': group['ms'], 'sites': sorted(group['sites'])}
+         for shape, group in groups.items()),
+        key=lambda group: group['ms'], reverse=True,
+    )
+
+
+def profile_list(request):
+    return render(request, 'admin/store/profiles.html', {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'captures': profiling.list_captures(),
+    })
+
+
+def profile_detail(request, capture_id):
+    capture = profiling.load_capture(capture_id)
+    path = profiling.capture_path(capture_id)
+    if capture is None or path is None:
+        raise Http404('No such profile')
+    sort = request.GET.get('sort') if request.GET.get('sort') in PROFILE_SORTS else 'cumulative'
+    functions, total = function_rows(path, sort)
+    return render(request, 'admin/store/profile_detail.html', {
+        **admin.site.each_context(request),
+        'title': f'{capture["method"]} {capture["path"]}',
+        'capture': capture,
+        'functions': functions,
+        'profiled_seconds': total,
+        'sort': sort,
+        'sorts': PROFILE_SORTS,
+        'query_groups': query_groups(capture['queries']),
+    })
+
+
+def profile_download(request, capture_id):
+    path = profiling.capture_path(capture_id)
+    if path is None:
+        raise Http404('No such profile')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{capture_id}.prof')
+
+
+def slow_query_list(request):
+    log_file = Path(getattr(settings, 'SLOW_QUERY_LOG_FILE', settings.BASE_DIR / 'logs' / 'slow_queries.log'))
+    # The current file and its rotated backups (slow_queries.log.1, .2, ...)
+    paths = sorted(log_file.parent.glob(log_file.name + '*'))
+    groups = slow_queries.group_records(slow_queries.read_records(paths))
+    if request.GET.get('full_scans'):
+        groups = [group for group in groups if group['full_scan']]
+    return render(request, 'admin/store/slow_queries.html', {
+        **admin.site.each_context(request),
+        'title': 'Slow queries',
+        'groups': groups,
+        'threshold_ms': getattr(settings, 'SLOW_QUERY_MS', slow_queries.DEFAULT_THRESHOLD_MS),
+        'full_scans_only': bool(request.GET.get('full_scans')),
+    })
+
+
+urlpatterns = [
+    path('profiles/', admin.site.admin_view(profile_list), name='store-profiles'),
+    path('profiles/<str:capture_id>/', admin.site.admin_view(profile_detail), name='store-profile'),
+    path('profiles/<str:capture_id>/download/', admin.site.admin_view(profile_download), name='store-profile-download'),
+    path('slow-queries/', admin.site.admin_view(slow_query_list), name='store-slow-queries'),
+]
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (connects the model signal handlers)
+        from django.db.backends.signals import connection_created
+        from .slow_queries import install
+        connection_created.connect(install, dispatch_uid='store.slow_queries')
@@ -0,0 +1,102 @@
+"""Size/color attributes for products.
+
+Product.sizes and Product.colors stay the display source of truth; every product
+save mirrors them into ProductAttribute rows so listings can filter through the
+(kind, value, product) index instead of LIKE-scanning the free-text columns.
+
+Sizes are normalized to 'S,M,L' when a product is saved (store.signals), so
+reading them back is a plain split; only writes go through the parser for the
+historical formats.
+"""
+import ast
+import json
+
+from .models import ProductAttribute
+
+
+def _split_values(raw):
+    """Turn a stored sizes/colors value in any historical format into a list of strings."""
+    if raw is None:
+        return []
+    if isinstance(raw, (list, tuple)):
+        values = raw
+    else:
+        raw = str(raw).strip()
+        if not raw:
+            return []
+        values = None
+        if raw.startswith('[') and raw.endswith(']'):
+            # JSON arrays from the API, Python list reprs from older bulk uploads
+            for loader in (json.loads, ast.literal_eval):
+                try:
+                    values = loader(raw)
+                    break
+                except (ValueError, SyntaxError):
+                    continue
+            if not isinstance(values, (list, tuple)):
+                values = raw[1:-1].replace('"', '').replace("'", '').split(',')
+        else:
+            values = raw.split(',')
+
+    cleaned = []
+    for value in values:
+        value = str(value).strip()
+        if value and value not in cleaned:
+            cleaned.append(value)
+    return cleaned
+
+
+def parse_sizes(stored):
+    """Product.sizes as stored, 'S,M,L' -> ['S', 'M', 'L']"""
+    return stored.split(',') if stored else []
+
+
+def parse_colors(raw):
+    return _split_values(raw)
+
+
+def format_sizes(raw):
+    """Canonical storage format for Product.sizes: 'S,M,L'"""
+    return ','.join(_split_values(raw))
+
+
+def parse_filter_values(param):
+    """'S, m,L' -> ['s', 'm', 'l'] for matching against ProductAttribute.value"""
+    return [value.strip().lower() for value in (param or '').split(',') if value.strip()]
+
+
+def attribute_pairs(product):
+    """The (kind, value) set a product should have in the attribute table"""
+    pairs = {(ProductAttribute.SIZE, size.lower()[:50]) for size in parse_sizes(product.sizes)}
+    pairs |= {(ProductAttribute.COLOR, color.lower()[:50]) for color in parse_colors(product.colors)}
+    return pairs
+
+
+def sync_product_attributes(product, previous=None):
+    """Write only the attribute rows that changed since `previous` (the pairs as loaded)"""
+    current = attribute_pairs(product)
+    if previous is None:
+        previous = set(
+            ProductAttribute.objects.filter(product=product).values_list('kind', 'value')
+        )
+    removed = previous - current
+    added = current - previous
+
+    for kind in {kind for kind, _ in removed}:
+        ProductAttribute.objects.filter(
+            product=product, kind=kind, value__in=[value for k, value in removed if k == kind]
+        ).delete()
+    if added:
+        ProductAttribute.objects.bulk_create(
+            [ProductAttribute(product=product, kind=kind, value=value) for kind, value in added],
+            ignore_conflicts=True,
+        )
+    return current
+
+
+def filter_by_attributes(queryset, kind, values):
+    """Keep products having any of `values` for `kind`, as an indexed semi-join"""
+    if not values:
+        return queryset
+    matching = ProductAttribute.objects.filter(kind=kind, value__in=values).values('product_id')
+    return queryset.filter(id__in=matching)
@@ -0,0 +1,70 @@
+"""Shared pieces of the benchmark management commands (benchmark_endpoints, benchmark_checkout)."""
+import os
+import shutil
+import statistics
+import tempfile
+from contextlib import contextmanager
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from .category_tree import category_tree
+from .fragments import product_fragments
+from .query_budget import ignore_in_call_sites
+from .spelling import spelling
+from .suggestions import suggestions
+
+ignore_in_call_sites(__file__)
+
+
+def percentiles(samples):
+    """p50/p95/p99 of a list of millisecond timings"""
+    if len(samples) == 1:
+        return {'p50': samples[0], 'p95': samples[0], 'p99': samples[0]}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
+
+
+def reset_process_caches():
+    cache.clear()
+    product_fragments.clear()
+    category_tree.tree = category_tree.version = None
+    suggestions.index = suggestions.version = None
+    spelling.index = spelling.version = None
+
+
+class QueryCounter:
+    """connection.execute_wrapper() hook counting queries"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def seeded_database(products, seed, stdout=None):
+    """
+    A throwaway test database seeded by generate_test_data, in a file (not SQLite's
+    in-memory test database) so I/O and locking behave as in production. Connections
+    opened by other threads meanwhile use it too.
+    """
+    setup_test_environment()
+    directory = tempfile.mkdtemp(prefix='store-bench-')
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(directory, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        if stdout is not None:
+            stdout.write(f'Seeding {products} products (seed {seed})...')
+        call_command('generate_test_data', str(products), '--seed', str(seed), stdout=StringIO())
+        reset_process_caches()
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        shutil.rmtree(directory, ignore_errors=True)
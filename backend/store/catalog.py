@@ -0,0 +1,134 @@
+"""Catalog change version.
+
+A counter bumped after every committed change to products, categories,
+subcategories or reviews (see store.signals). Caches built from the catalog
+(per-process indexes, cached responses, ETags) compare it against the version
+they were built from.
+
+The counters are rows of CatalogCounter, incremented atomically in the
+database, so every worker process hands out the same versions and ETags.
+Reads go through the Django cache for CATALOG_VERSION_CACHE_SECONDS: checking
+freshness is a cache read, and another process's bump is seen within that
+long (at once with a shared cache backend, or in the process that made it).
+
+Each bump also records what changed under its own cache key for a while, which
+lets those caches refresh only the touched products; when the records aren't
+there (an unshared cache, or evicted) they rebuild instead.
+
+The category tree (store.category_tree) has its own, narrower version that only
+moves when categories, subcategories or product category assignments change.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import CatalogCounter
+
+VERSION = 'catalog'
+TREE_VERSION = 'category-tree'
+COUNTERS_KEY = 'store:catalog-counters'
+CHANGE_KEY = 'store:catalog-change:{}'
+CHANGE_TTL = 60 * 60
+DEFAULT_VERSION_CACHE_SECONDS = 1
+
+
+def _read_counters():
+    """{name: (value, changed_at)} from the database, creating missing counters"""
+    counters = {
+        name: (value, changed_at)
+        for name, value, changed_at in CatalogCounter.objects.values_list('name', 'value', 'changed_at')
+    }
+    missing = [name for name in (VERSION, TREE_VERSION) if name not in counters]
+    if missing:
+        # Seeded from the clock so a reset database never hands out an old version again
+        now = time.time()
+        CatalogCounter.objects.bulk_create(
+            [CatalogCounter(name=name, value=int(now * 1000), changed_at=int(now)) for name in missing],
+            ignore_conflicts=True,
+        )
+        return _read_counters()
+    return counters
+
+
+def _remember(counters):
+    seconds = getattr(settings, 'CATALOG_VERSION_CACHE_SECONDS', DEFAULT_VERSION_CACHE_SECONDS)
+    cache.set(COUNTERS_KEY, counters, timeout=seconds)
+    return counters
+
+
+def _counters():
+    counters = cache.get(COUNTERS_KEY)
+    return counters if counters is not None else _remember(_read_counters())
+
+
+def _increment_version(name):
+    bump = {'value': F('value') + 1, 'changed_at': int(time.time())}
+    with transaction.atomic():
+        if not CatalogCounter.objects.filter(name=name).update(**bump):
+            _read_counters()
+            CatalogCounter.objects.filter(name=name).update(**bump)
+        # Still inside the bump's transaction, so this is our value even with bumps racing
+        counters = _read_counters()
+    return _remember(counters)[name][0]
+
+
+def catalog_version():
+    return _counters()[VERSION][0]
+
+
+def category_tree_version():
+    """Changes only when categories, subcategories or product category assignments do"""
+    return _counters()[TREE_VERSION][0]
+
+
+def catalog_last_modified():
+    """Unix time of the last catalog change (or of when the counter was created)"""
+    return _counters()[VERSION][1]
+
+
+def category_tree_last_modified():
+    return _counters()[TREE_VERSION][1]
+
+
+def _bump(kind, object_id):
+    version = _increment_version(VERSION)
+    cache.set(CHANGE_KEY.format(version), (kind, object_id), timeout=CHANGE_TTL)
+    return version
+
+
+def mark_catalog_changed(kind, object_id):
+    """Bump the catalog version once the current transaction commits"""
+    transaction.on_commit(lambda: _bump(kind, object_id))
+
+
+def _bump_all():
+    # No change record for this version, so changes_between() asks for a full rebuild
+    return _increment_version(VERSION)
+
+
+def mark_catalog_rebuilt():
+    """Bump the version for bulk loads that bypass the signals, invalidating every catalog cache"""
+    transaction.on_commit(_bump_all)
+
+
+def mark_category_tree_changed():
+    transaction.on_commit(lambda: _increment_version(TREE_VERSION))
+
+
+def changes_between(old_version, new_version, limit=500):
+    """
+    The (kind, object_id) changes recorded after old_version up to new_version,
+    or None when they can no longer be reconstructed and a full rebuild is needed.
+    """
+    if old_version is None or new_version is None or new_version < old_version:
+        return None
+    if new_version - old_version > limit:
+        return None
+    keys = [CHANGE_KEY.format(version) for version in range(old_version + 1, new_version + 1)]
+    found = cache.get_many(keys)
+    if len(found) != len(keys):
+        return None
+    return [found[key] for key in keys]
@@ -0,0 +1,94 @@
+"""Pre-serialized category -> subcategory tree with product counts.
+
+Built with three queries (categories, subcategories, one GROUP BY over products)
+and kept both in the shared cache and in process memory under the category
+tree version (store.catalog). Serving it is a cache-version read and no DB
+queries; it is rebuilt only after categories, subcategories or product
+category assignments change.
+"""
+import threading
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .catalog import category_tree_version
+from .models import Category, Product, SubCategory
+from .serializers import SubCategorySerializer
+
+CACHE_KEY = 'store:category-tree:{}'
+
+
+def build_category_tree():
+    counts = (
+        Product.objects.order_by().values('category_id', 'subcategory_id').annotate(n=Count('id'))
+    )
+    category_counts, subcategory_counts = {}, {}
+    for row in counts:
+        category_counts[row['category_id']] = category_counts.get(row['category_id'], 0) + row['n']
+        if row['subcategory_id'] is not None:
+            subcategory_counts[row['subcategory_id']] = (
+                subcategory_counts.get(row['subcategory_id'], 0) + row['n']
+            )
+
+    subcategories = {}
+    for subcategory in SubCategory.objects.order_by('name'):
+        data = dict(SubCategorySerializer(subcategory).data)
+        data['product_count'] = subcategory_counts.get(subcategory.id, 0)
+        subcategories.setdefault(subcategory.category_id, []).append(data)
+
+    tree = []
+    for category in Category.objects.order_by('id'):
+        children = subcategories.get(category.id, [])
+        tree.append({
+            'id': category.id,
+            'name': category.name,
+            'slug': category.slug,
+            'subcategories': children,
+            'product_count': category_counts.get(category.id, 0),
+            'subcategory_count': len(children),
+        })
+    return tree
+
+
+class CategoryTree:
+    def __init__(self):
+        self.version = None
+        self.tree = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        version = category_tree_version()
+        if self.tree is not None and self.version == version:
+            return self.tree
+        with self.lock:
+            if self.tree is None or self.version != version:
+                # Another process may already have built this version
+                tree = cache.get(CACHE_KEY.format(version))
+                if tree is None:
+                    tree = build_category_tree()
+                    cache.set(CACHE_KEY.format(version), tree, timeout=None)
+                self.tree, self.version = tree, version
+        return self.tree
+
+    def counts(self):
+        """{category id: (subcategory count, product count)} for admin listings"""
+        return {node['id']: (node['subcategory_count'], node['product_count']) for node in self.get()}
+
+
+def with_absolute_images(nodes, request):
+    """Subcategory image paths are stored relative; make them absolute like the serializers do"""
+    if request is None:
+        return nodes
+    result = []
+    for node in nodes:
+        if any(child.get('image') for child in node['subcategories']):
+            node = dict(node)
+            node['subcategories'] = [
+                dict(child, image=request.build_absolute_uri(child['image'])) if child.get('image') else child
+                for child in node['subcategories']
+            ]
+        result.append(node)
+    return result
+
+
+category_tree = CategoryTree()
@@ -0,0 +1,83 @@
+"""Conditional GET (ETag / Last-Modified) for catalog endpoints.
+
+The validators are computed from cheap sources before the view builds its
+queryset: the catalog version for lists and category data, a single indexed
+updated_at lookup plus the category tree version (for its category name) for
+a product. A matching If-None-Match / If-Modified-Since
+returns 304 without any serialization work.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .catalog import catalog_last_modified, catalog_version, category_tree_last_modified, category_tree_version
+from .models import Product
+
+
+def _etag(*parts):
+    digest = hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return quote_etag(digest)
+
+
+def conditional_get(validators):
+    """
+    Wrap a viewset method so GET/HEAD requests are answered from `validators`.
+
+    `validators(view, request, *args, **kwargs)` returns (etag, last_modified) with
+    last_modified as a Unix timestamp, or None to skip conditional handling
+    (e.g. the object does not exist and the view should produce its 404).
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return method(self, request, *args, **kwargs)
+
+            found = validators(self, request, *args, **kwargs)
+            if found is None:
+                return method(self, request, *args, **kwargs)
+            etag, last_modified = found
+            # The same URL renders differently per negotiated format (JSON vs browsable API)
+            etag = _etag(etag, getattr(request, 'accepted_media_type', ''))
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = method(self, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.headers['ETag'] = etag
+                response.headers['Last-Modified'] = http_date(last_modified)
+                patch_cache_control(
+                    response,
+                    public=True,
+                    max_age=getattr(settings, 'CATALOG_CACHE_MAX_AGE', 60),
+                )
+            return response
+        return wrapper
+    return decorator
+
+
+def catalog_validators(view, request, *args, **kwargs):
+    """Anything derived from the catalog as a whole changes with the catalog version"""
+    return (
+        ('catalog', catalog_version(), request.get_full_path()),
+        catalog_last_modified(),
+    )
+
+
+def _product_validators(request, lookup):
+    row = Product.objects.filter(**lookup).values_list('id', 'updated_at').first()
+    if row is None:
+        return None
+    product_id, updated_at = row
+    # Renaming its category doesn't touch the product row but changes its category_name
+    return (
+        ('product', product_id, updated_at.isoformat(), category_tree_version(), request.get_full_path()),
+        max(int(updated_at.timestamp()), category_tree_last_modified()),
+    )
+
+
+def product_slug_validators(view, request, slug=None, **kwargs):
+    return _product_validators(request, {'slug': slug})
@@ -0,0 +1,120 @@
+"""Facet counts for the product filter sidebar (/api/products/facets/).
+
+Counts are computed for the current filter set with two GROUP BY queries: one
+over the filtered products for category, subcategory and price bucket, one over
+their ProductAttribute rows for size and color. The result is cached per
+normalized filter signature and catalog version, so any product change
+invalidates it without explicit purging.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from .catalog import catalog_version
+from .models import ProductAttribute
+
+# (min, max) with max exclusive; None means unbounded
+PRICE_BUCKETS = [
+    (0, 25),
+    (25, 50),
+    (50, 100),
+    (100, 200),
+    (200, None),
+]
+
+# Query parameters that change the filter set (ordering/paging do not)
+FILTER_PARAMS = ('category', 'subcategory', 'size', 'color', 'featured', 'min_price', 'max_price')
+
+CACHE_TIMEOUT = 10 * 60
+
+
+def filter_signature(query_params):
+    """Stable key for the filter set: known params only, values split, trimmed and sorted"""
+    normalized = {}
+    for name in FILTER_PARAMS:
+        raw = query_params.get(name)
+        if raw:
+            values = sorted({value.strip().lower() for value in raw.split(',') if value.strip()})
+            if values:
+                normalized[name] = values
+    encoded = json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(encoded.encode()).hexdigest()
+
+
+def price_bucket_expression():
+    whens = []
+    for position, (low, high) in enumerate(PRICE_BUCKETS):
+        condition = Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        whens.append(When(condition, then=Value(position)))
+    return Case(*whens, default=Value(None), output_field=IntegerField())
+
+
+def compute_facets(queryset):
+    queryset = queryset.order_by().prefetch_related(None)
+
+    rows = (
+        queryset
+        .annotate(price_bucket=price_bucket_expression())
+        .values('category_id', 'category__name', 'category__slug',
+                'subcategory_id', 'subcategory__name', 'subcategory__slug', 'price_bucket')
+        .annotate(n=Count('id'))
+    )
+
+    total = 0
+    categories, subcategories = {}, {}
+    buckets = [0] * len(PRICE_BUCKETS)
+    for row in rows:
+        n = row['n']
+        total += n
+        category = categories.setdefault(row['category_id'], {
+            'id': row['category_id'], 'name': row['category__name'],
+            'slug': row['category__slug'], 'count': 0,
+        })
+        category['count'] += n
+        if row['subcategory_id'] is not None:
+            subcategory = subcategories.setdefault(row['subcategory_id'], {
+                'id': row['subcategory_id'], 'name': row['subcategory__name'],
+                'slug': row['subcategory__slug'], 'category': row['category_id'], 'count': 0,
+            })
+            subcategory['count'] += n
+        if row['price_bucket'] is not None:
+            buckets[row['price_bucket']] += n
+
+    attribute_counts = (
+        ProductAttribute.objects
+        .filter(product_id__in=queryset.values('id'))
+        .values('kind', 'value')
+        .annotate(n=Count('product_id'))
+        .order_by('kind', '-n', 'value')
+    )
+    sizes, colors = [], []
+    for row in attribute_counts:
+        if row['kind'] == ProductAttribute.SIZE:
+            sizes.append({'value': row['value'], 'label': row['value'].upper(), 'count': row['n']})
+        else:
+            colors.append({'value': row['value'], 'label': row['value'].title(), 'count': row['n']})
+
+    return {
+        'count': total,
+        'categories': sorted(categories.values(), key=lambda item: (-item['count'], item['name'])),
+        'subcategories': sorted(subcategories.values(), key=lambda item: (-item['count'], item['name'])),
+        'sizes': sizes,
+        'colors': colors,
+        'price_ranges': [
+            {'min': low, 'max': high, 'count': count}
+            for (low, high), count in zip(PRICE_BUCKETS, buckets)
+        ],
+    }
+
+
+def get_facets(queryset, query_params):
+    key = f'store:facets:{catalog_version()}:{filter_signature(query_params)}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset)
+        cache.set(key, facets, timeout=CACHE_TIMEOUT)
+    return facets
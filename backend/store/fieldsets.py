@@ -0,0 +1,155 @@
+"""Sparse fieldsets: ?fields= / ?omit= on API responses.
+
+    /api/products/12/?fields=id,name,price,image
+    /api/wishlist/?fields=id,product.name,product.price
+    /api/orders/?omit=items
+
+Dotted names reach into nested serializers. Fields that are left out are
+removed from the serializer before it runs, so they are never computed, and
+viewsets using SparseFieldsetViewMixin also narrow the SQL column list to what
+the remaining fields read. Only GET/HEAD requests are affected; writes always
+validate and answer with the full representation.
+"""
+from django.core.exceptions import FieldDoesNotExist
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def _names(raw):
+    return {name.strip() for name in (raw or '').split(',') if name.strip()}
+
+
+class Fieldset:
+    """A field selection: `fields` (None = everything) minus `omit`, both allowing dotted names"""
+
+    def __init__(self, fields=None, omit=()):
+        self.fields = set(fields) if fields is not None else None
+        self.omit = set(omit)
+
+    @classmethod
+    def from_request(cls, request):
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return cls()
+        params = request.query_params
+        fields = _names(params.get(FIELDS_PARAM)) if params.get(FIELDS_PARAM) else None
+        return cls(fields, _names(params.get(OMIT_PARAM)))
+
+    def __bool__(self):
+        return self.fields is not None or bool(self.omit)
+
+    def includes(self, name):
+        if name in self.omit:
+            return False
+        if self.fields is None:
+            return True
+        return name in self.fields or any(field.startswith(name + '.') for field in self.fields)
+
+    def nested(self, name):
+        """The selection inside field `name` (product.name -> name)"""
+        prefix = name + '.'
+        fields = None
+        if self.fields is not None and name not in self.fields:
+            fields = {field[len(prefix):] for field in self.fields if field.startswith(prefix)}
+        omit = {field[len(prefix):] for field in self.omit if field.startswith(prefix)}
+        return Fieldset(fields, omit)
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin that drops the fields the request did not ask for.
+
+    The selection comes from the `fieldset` argument or, for top-level
+    serializers, from the request in the context. Nested serializers using the
+    mixin are narrowed by their parent. `Meta.sparse_sources` names the model
+    columns read by fields that are not plain model attributes (method fields,
+    properties), e.g. {'category_name': ['category__name']}.
+    """
+
+    def __init__(self, *args, fieldset=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fieldset is None:
+            fieldset = Fieldset.from_request(self.context.get('request'))
+        if fieldset:
+            self.restrict(fieldset)
+
+    def restrict(self, fieldset):
+        for name in list(self.fields):
+            if not fieldset.includes(name):
+                self.fields.pop(name)
+        for name, field in self.fields.items():
+            child = getattr(field, 'child', field)
+            selection = fieldset.nested(name)
+            if selection and isinstance(child, SparseFieldsetMixin):
+                child.restrict(selection)
+        return self
+
+    def selected_columns(self, prefix=''):
+        """
+        The `.only()` paths this serializer's remaining fields read, or None when
+        some field reads something we can't see into (then nothing is trimmed).
+        """
+        model = self.Meta.model
+        sources = getattr(self.Meta, 'sparse_sources', {})
+        columns = {prefix + model._meta.pk.name}
+
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if name in sources:
+                columns.update(prefix + column for column in sources[name])
+                continue
+            if field.source == '*':
+                return None
+            try:
+                model_field = model._meta.get_field(field.source_attrs[0])
+            except FieldDoesNotExist:
+                return None
+
+            if not model_field.concrete:
+                # Reverse relations are loaded by their own queries and only need our pk
+                continue
+            if not model_field.is_relation:
+                columns.add(prefix + model_field.name)
+                continue
+
+            child = getattr(field, 'child', field)
+            if isinstance(child, SparseFieldsetMixin):
+                nested = child.selected_columns(prefix + model_field.name + '__')
+                if nested is None:
+                    return None
+                columns.update(nested)
+            elif len(field.source_attrs) > 1:
+                columns.add(prefix + '__'.join(field.source_attrs))
+            else:
+                columns.add(prefix + model_field.name)
+        return columns
+
+
+def trim_queryset(queryset, serializer):
+    """Load only the columns `serializer` reads, joining the relations it follows"""
+    columns = serializer.selected_columns() if isinstance(serializer, SparseFieldsetMixin) else None
+    if columns is None:
+        return queryset
+    relations = set()
+    for column in columns:
+        parts = column.split('__')[:-1]
+        for depth in range(1, len(parts) + 1):
+            relations.add('__'.join(parts[:depth]))
+    # A deferred foreign key can't be followed with select_related, so join exactly what's read
+    queryset = queryset.select_related(None)
+    if relations:
+        queryset = queryset.select_related(*sorted(relations))
+    return queryset.only(*columns)
+
+
+class SparseFieldsetViewMixin:
+    """Viewset mixin: narrow the queryset's columns to the requested fieldset on reads"""
+
+    def filter_queryset(self, queryset):
+        return self.trim_to_fieldset(super().filter_queryset(queryset))
+
+    def trim_to_fieldset(self, queryset):
+        if Fieldset.from_request(self.request):
+            queryset = trim_queryset(queryset, self.get_serializer())
+        return queryset
@@ -0,0 +1,181 @@
+"""Pre-encoded product JSON fragments.
+
+Product list, search and wishlist responses are assembled from per-product
+JSON bytes instead of re-serializing every product on every request. The list
+query only pages through (id, updated_at) keys; products whose fragment is
+cached are spliced in as-is and only the misses are loaded and serialized, in
+one query.
+
+A fragment is keyed by the product id and updated_at (saves and review changes
+move it, see store.ratings), ProductListSerializer.VERSION, the selected
+fields, the host used for absolute image URLs, and the category tree version
+(a category rename changes category_name). Stale fragments are never looked up
+again and age out of the LRU, which is bounded by PRODUCT_FRAGMENT_CACHE_BYTES.
+
+FragmentJSONRenderer writes the fragments into the response verbatim.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from .catalog import category_tree_version
+from .fieldsets import Fieldset
+from .metrics import register_cache
+from .models import Product
+from .serializers import ProductListSerializer
+
+
+class Encoded(bytes):
+    """A JSON value that is already encoded; FragmentJSONRenderer writes it out unchanged"""
+
+
+def encode(data):
+    # Same settings the JSON renderer uses for API responses
+    return Encoded(JSONRenderer().render(data))
+
+
+def extend_fragment(fragment, extra):
+    """Add the keys of `extra` to an encoded JSON object"""
+    if not extra:
+        return fragment
+    encoded = JSONRenderer().render(extra)
+    separator = b',' if len(fragment) > 2 else b''
+    return Encoded(fragment[:-1] + separator + encoded[1:])
+
+
+class ProductFragmentCache:
+    """Size-bounded LRU of encoded product JSON, with hit/miss counters"""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self.lock:
+            for key in keys:
+                fragment = self.entries.get(key)
+                if fragment is not None:
+                    self.entries.move_to_end(key)
+                    found[key] = fragment
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, fragments):
+        max_bytes = self.max_bytes or getattr(settings, 'PRODUCT_FRAGMENT_CACHE_BYTES', 16 * 1024 * 1024)
+        with self.lock:
+            for key, fragment in fragments.items():
+                previous = self.entries.pop(key, None)
+                if previous is not None:
+                    self.size -= len(previous)
+                self.entries[key] = fragment
+                self.size += len(fragment)
+            while self.size > max_bytes and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def render(self, key_rows, request=None, fieldset=None, extra=None):
+        """
+        Encoded products for `key_rows` (dicts with id and updated_at, e.g. from
+        fragment_keys()) in the same order. `extra(row)` may return keys to add
+        per row, like search highlights. Products deleted since the keys were
+        read are left out.
+        """
+        fragments = self.render_aligned(key_rows, request, fieldset, extra)
+        return [fragment for fragment in fragments if fragment is not None]
+
+    def render_aligned(self, key_rows, request=None, fieldset=None, extra=None):
+        """Like render(), but with None in place of products that no longer exist"""
+        key_rows = list(key_rows)
+        if fieldset is None:
+            fieldset = Fieldset.from_request(request)
+        field_names = tuple(ProductListSerializer(None, fieldset=fieldset).field_names)
+        base_url = request.build_absolute_uri('/') if request is not None else ''
+        tree_version = category_tree_version()
+        keys = [
+            (row['id'], row['updated_at'], ProductListSerializer.VERSION, field_names, base_url, tree_version)
+            for row in key_rows
+        ]
+
+        found = self.get_many(keys)
+        missing = {key[0]: key for key in keys if key not in found}
+        if missing:
+            rows = list(ProductListSerializer.rows(Product.objects.filter(id__in=missing), fieldset=fieldset))
+            data = ProductListSerializer(rows, context={'request': request}, fieldset=fieldset).data
+            fresh = {missing[row['id']]: encode(item) for row, item in zip(rows, data)}
+            self.set_many(fresh)
+            found.update(fresh)
+
+        fragments = []
+        for key, row in zip(keys, key_rows):
+            fragment = found.get(key)
+            if fragment is not None and extra:
+                fragment = extend_fragment(fragment, extra(row))
+            fragments.append(fragment)
+        return fragments
+
+
+def fragment_keys(queryset, *extra):
+    """The queryset as (id, updated_at) rows, plus its ordering columns for keyset cursors and any `extra`"""
+    columns = ['id', 'updated_at', *ProductListSerializer.ordering_columns(queryset, exclude=extra)]
+    return queryset.values(*dict.fromkeys(columns), *extra)
+
+
+class FragmentJSONRenderer(JSONRenderer):
+    """JSON renderer that writes Encoded values into the output verbatim"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        fragments = {}
+        marker = uuid.uuid4().hex
+
+        def substitute(value):
+            if isinstance(value, Encoded):
+                token = f'{marker}:{len(fragments)}'
+                fragments[token] = bytes(value)
+                return token
+            if isinstance(value, list) and value and all(isinstance(item, Encoded) for item in value):
+                # A whole list of fragments is spliced in one piece
+                token = f'{marker}:{len(fragments)}'
+                fragments[token] = b'[' + b','.join(value) + b']'
+                return token
+            if isinstance(value, dict):
+                return {key: substitute(item) for key, item in value.items()}
+            if isinstance(value, list):
+                return [substitute(item) for item in value]
+            return value
+
+        rendered = super().render(substitute(data), accepted_media_type, renderer_context)
+        for token, fragment in fragments.items():
+            rendered = rendered.replace(b'"' + token.encode() + b'"', fragment, 1)
+        return rendered
+
+
+product_fragments = ProductFragmentCache()
+register_cache('product_fragments', product_fragments.stats)
@@ -0,0 +1,190 @@
+"""Per-variant stock.
+
+A product with ProductVariant rows tracks stock per size/color; a product
+without any is untracked and always sellable, as every product was before
+variants existed. Product.in_stock stays the listing flag and follows the
+variants: it turns off when the last one sells out and back on when stock
+returns.
+
+Checkout reserves the stock of every line with one conditional UPDATE,
+
+    UPDATE store_productvariant SET stock = stock - <qty> WHERE id IN (...) AND stock >= <qty>
+
+(plus a NOT EXISTS that leaves every row alone while any line is short) inside
+the order's transaction, so there is no read-then-write window and two
+checkouts can never both take the last unit; an order whose lines aren't all
+covered is rolled back. Orders still pending after
+STOCK_RESERVATION_MINUTES are cancelled and their units returned by the
+release_expired_reservations command, which also cancels their Stripe
+PaymentIntent so they can't be paid afterwards. A payment that still gets
+through (the Stripe webhook) takes the stock again, or is refunded when it's
+gone.
+"""
+import logging
+from collections import Counter, defaultdict
+
+import stripe
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Value, When
+from django.db.models.functions import Now
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .catalog import mark_catalog_changed
+from .metrics import phase
+from .models import Order, OrderItem, Product, ProductVariant
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESERVATION_MINUTES = 30
+
+
+class OutOfStock(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Not enough stock.'
+    default_code = 'out_of_stock'
+
+
+def reservation_minutes():
+    return getattr(settings, 'STOCK_RESERVATION_MINUTES', DEFAULT_RESERVATION_MINUTES)
+
+
+def load_variants(product_ids):
+    """{product_id: [variants]} for the given products, in one query"""
+    variants = defaultdict(list)
+    for variant in ProductVariant.objects.filter(product_id__in=product_ids):
+        variants[variant.product_id].append(variant)
+    return variants
+
+
+def match_variant(variants, size, color):
+    """
+    The variant a cart line means, None when the product doesn't track stock.
+    A blank size or color matches any, as long as that leaves one variant.
+    """
+    if not variants:
+        return None
+    size, color = (size or '').lower(), (color or '').lower()
+    matches = [
+        variant for variant in variants
+        if (not size or variant.size.lower() == size) and (not color or variant.color.lower() == color)
+    ]
+    if len(matches) == 1:
+        return matches[0]
+    if matches:
+        raise ValueError('Choose a size and color.')
+    raise ValueError('Not available in this size and color.')
+
+
+def reserve(lines):
+    """
+    Take stock for [(variant, quantity)] in one conditional UPDATE. Must run inside the
+    order's transaction; raises OutOfStock listing the lines that couldn't be covered.
+    """
+    quantities, variants = Counter(), {}
+    for variant, quantity in lines:
+        quantities[variant.pk] += quantity
+        variants[variant.pk] = variant
+    if not quantities:
+        return
+    wanted = Case(*(When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()))
+    short = ProductVariant.objects.filter(pk__in=quantities, stock__lt=wanted)
+    # All or nothing: no row is touched while any line is short. The per-row condition
+    # still holds on its own when the NOT EXISTS was evaluated against an older snapshot.
+    taken = (
+        ProductVariant.objects.filter(pk__in=quantities, stock__gte=wanted).exclude(Exists(short))
+        .update(stock=F('stock') - wanted)
+    )
+    if taken != len(quantities):
+        raise OutOfStock('Not enough stock for ' + ', '.join(
+            f'product {variants[pk].product_id} ({variants[pk].size or "-"}/{variants[pk].color or "-"})'
+            for pk in sorted(short.values_list('pk', flat=True))
+        ) + '.')
+    sync_in_stock({variant.product_id for variant in variants.values()})
+
+
+def reserve_again(order_id):
+    """Take the stock of a cancelled order's lines again; same rules as reserve()"""
+    items = OrderItem.objects.filter(order_id=order_id, variant__isnull=False).select_related('variant')
+    reserve([(item.variant, item.quantity) for item in items])
+
+
+def release(order_ids):
+    """Give back the stock reserved by these orders' lines (callers make sure it happens once)"""
+    returned = (
+        OrderItem.objects.filter(order_id__in=order_ids, variant__isnull=False)
+        .values_list('variant_id', 'variant__product_id', 'quantity')
+    )
+    quantities, product_ids = Counter(), set()
+    for variant_id, product_id, quantity in returned:
+        quantities[variant_id] += quantity
+        product_ids.add(product_id)
+    if quantities:
+        returned = Case(*(When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()))
+        ProductVariant.objects.filter(pk__in=quantities).update(stock=F('stock') + returned)
+    sync_in_stock(product_ids)
+    return sum(quantities.values())
+
+
+def expired_orders(cutoff):
+    """Orders still pending (unpaid) since before `cutoff`, oldest first"""
+    return Order.objects.filter(status='pending', created_at__lt=cutoff).order_by('created_at', 'id')
+
+
+def cancel_payment(payment_details):
+    """
+    Cancel the Stripe PaymentIntent recorded on an order, if any. Raises StripeError
+    when it can't be (it has just succeeded); one already cancelled is fine.
+    """
+    intent_id = (payment_details or {}).get('payment_intent')
+    if not intent_id:
+        return
+    with phase('stripe'):
+        try:
+            stripe.PaymentIntent.cancel(intent_id)
+        except stripe.error.InvalidRequestError:
+            if stripe.PaymentIntent.retrieve(intent_id).status != 'canceled':
+                raise
+
+
+def release_expired(cutoff):
+    """Cancel orders still pending since before `cutoff` and return their stock. Returns (orders, units)."""
+    orders = units = 0
+    for order_id, payment_details in expired_orders(cutoff).values_list('id', 'payment_details').iterator():
+        try:
+            with transaction.atomic():
+                # Claimed with a conditional UPDATE as well: an order paid (or released by
+                # another sweeper) since the SELECT is no longer pending and is left alone
+                if not Order.objects.filter(pk=order_id, status='pending').update(status='cancelled', updated_at=Now()):
+                    continue
+                released = release([order_id])
+                # Last, so nothing after it can roll the claim back once the payment is gone
+                cancel_payment(payment_details)
+        except stripe.error.StripeError:
+            # Left pending: the payment is going through, or Stripe can be asked next time
+            logger.warning('Could not cancel the payment of expired order %s', order_id, exc_info=True)
+            continue
+        units += released
+        orders += 1
+    return orders, units
+
+
+def sync_in_stock(product_ids):
+    """Point Product.in_stock of these (stock-tracking) products at whether any variant has stock"""
+    if not product_ids:
+        return
+    has_stock = Exists(ProductVariant.objects.filter(product=OuterRef('pk'), stock__gt=0))
+    tracked = Exists(ProductVariant.objects.filter(product=OuterRef('pk')))
+    rows = (
+        Product.objects.filter(pk__in=product_ids).alias(tracked=tracked).filter(tracked=True)
+        .annotate(has_stock=has_stock).values_list('id', 'in_stock', 'has_stock')
+    )
+    for in_stock in (True, False):
+        ids = [pk for pk, current, has_stock in rows if has_stock == in_stock and current != in_stock]
+        if ids:
+            # updated_at moves so cached product fragments and ETags change with it
+            Product.objects.filter(pk__in=ids).update(in_stock=in_stock, updated_at=Now())
+            for pk in ids:
+                mark_catalog_changed('product', pk)
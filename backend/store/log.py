@@ -0,0 +1,39 @@
+"""Logging helpers.
+
+SampleFilter lets a fraction of chatty records (DEBUG/INFO from request
+handling) through while always keeping warnings and errors, so the 'store'
+loggers can stay at INFO in production without flooding the output. It is
+wired into LOGGING in settings:
+
+    'filters': {'sampled': {'()': 'store.log.SampleFilter', 'rate': 0.1}}
+
+LazyRotatingFileHandler is a RotatingFileHandler that creates its log
+directory when it first writes, instead of settings creating it on import.
+"""
+import logging
+import os
+import random
+from logging.handlers import RotatingFileHandler
+
+
+class SampleFilter(logging.Filter):
+    def __init__(self, rate=1.0, always_level=logging.WARNING):
+        super().__init__()
+        self.rate = float(rate)
+        self.always_level = logging._checkLevel(always_level)
+
+    def filter(self, record):
+        if record.levelno >= self.always_level or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class LazyRotatingFileHandler(RotatingFileHandler):
+    def __init__(self, filename, *args, **kwargs):
+        # Nothing touches the disk until the first record
+        kwargs['delay'] = True
+        super().__init__(filename, *args, **kwargs)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
@@ -0,0 +1,157 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from store.fragments import fragment_keys
+from store.inventory import expired_orders, reservation_minutes
+from store.models import Category, Order, Product, Review, WishlistItem
+from store.slow_queries import is_full_scan, query_plan, uses_temp_sort
+from store.views import OrderViewSet, ProductViewSet, ReviewViewSet, WishlistViewSet
+
+
+def list_view(viewset_class, params=None, user=None):
+    """A viewset instance set up for a GET list request, as the router would"""
+    request = APIRequestFactory().get('/', params or {})
+    if user is not None:
+        force_authenticate(request, user)
+    view = viewset_class(action_map={'get': 'list'}, format_kwarg=None, args=(), kwargs={})
+    view.request = view.initialize_request(request)
+    return view
+
+
+def list_page(viewset_class, params=None, user=None, keys=None):
+    """A function fetching the first list page like the viewset does (`keys` maps the queryset first)"""
+    def run():
+        view = list_view(viewset_class, params, user)
+        queryset = view.filter_queryset(view.get_queryset())
+        view.paginate_queryset(keys(queryset) if keys else queryset)
+    return run
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay the query shapes the API viewsets produce, EXPLAIN each one and report '
+        'full table scans and temp B-tree sorts, with the index that covers the shape'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help='Run ANALYZE first so the planner sees real row counts')
+        parser.add_argument('--check', action='store_true', help='Exit with an error when any shape scans or sorts')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the plan and SQL of every shape, not just the problems')
+
+    def shapes(self):
+        """(name, index that should serve it as (model, fields), function running the shape)"""
+        category = Category.objects.annotate(n=Count('products')).order_by('-n').first()
+        product = Product.objects.order_by('-review_count', 'id').first()
+        customer = (Order.objects.values('user').annotate(n=Count('id')).order_by('-n').first() or {}).get('user')
+        wisher = (WishlistItem.objects.values('user').annotate(n=Count('id')).order_by('-n').first() or {}).get('user')
+        User = Order._meta.get_field('user').related_model
+
+        def products(params):
+            # ProductViewSet.list pages through fragment keys
+            return list_page(ProductViewSet, params, keys=fragment_keys)
+
+        shapes = [
+            ('products: newest', (Product, ['created_at', 'id']), products({})),
+            ('products: newest, keyset page', (Product, ['created_at', 'id']), products({'cursor': ''})),
+            ('products: price ascending', (Product, ['price', 'id']), products({'sort_by': 'price_asc'})),
+            ('products: price descending', (Product, ['price', 'id']), products({'sort_by': 'price_desc'})),
+            ('products: featured, newest', (Product, ['featured', 'created_at', 'id']), products({'featured': 'true'})),
+            # The server-rendered storefront (views.product_list). Nearly everything is in
+            # stock, so walking the created_at index and skipping the rest is cheap
+            ('products: in stock, newest', (Product, ['created_at', 'id']),
+             lambda: list(Product.objects.filter(in_stock=True).order_by('-created_at', '-id')[:12])),
+            # release_expired_reservations
+            ('orders: expired reservations', (Order, ['status', 'created_at', 'id']),
+             lambda: list(expired_orders(timezone.now() - timedelta(minutes=reservation_minutes())).values_list('id', flat=True))),
+        ]
+        if category is not None:
+            shapes += [
+                ('products: category, newest', (Product, ['category', 'created_at', 'id']),
+                 products({'category': category.pk})),
+                ('products: category, price', (Product, ['category', 'price', 'id']),
+                 products({'category': category.pk, 'sort_by': 'price_asc'})),
+            ]
+        if product is not None:
+            shapes.append(('reviews: product, newest', (Review, ['product', 'created_at']),
+                           list_page(ReviewViewSet, {'product': product.pk})))
+        if customer is not None:
+            shapes.append(('orders: user, newest', (Order, ['user', 'created_at', 'id']),
+                           list_page(OrderViewSet, user=User.objects.get(pk=customer))))
+        if wisher is not None:
+            # Not paginated: the wishlist list returns every item
+            wishlist_user = User.objects.get(pk=wisher)
+            shapes.append(('wishlist: user, newest', (WishlistItem, ['user', 'added_at']),
+                           lambda: list(list_view(WishlistViewSet, user=wishlist_user).get_queryset())))
+        return shapes
+
+    def handle(self, *args, **options):
+        if not Product.objects.exists():
+            raise CommandError('No products to query - run generate_test_data first')
+        if options['analyze']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        problems = []
+        for name, (model, fields), run in self.shapes():
+            queries = []
+
+            def capture(execute, sql, params, many, context):
+                queries.append((sql, params))
+                return execute(sql, params, many, context)
+
+            started = time.perf_counter()
+            with connection.execute_wrapper(capture):
+                run()
+            elapsed = (time.perf_counter() - started) * 1000
+
+            flagged = []
+            for sql, params in queries:
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                plan = query_plan(connection, sql, params)
+                issues = [issue for issue, found in (('full scan', is_full_scan(plan)), ('temp sort', uses_temp_sort(plan))) if found]
+                if issues:
+                    flagged.append((sql, plan, issues))
+                elif options['verbose_plans']:
+                    self.stdout.write(f'    {sql[:200]}\n      ' + '\n      '.join(plan))
+
+            if not flagged:
+                self.stdout.write(self.style.SUCCESS(f'OK    {name}') + f'  ({len(queries)} queries, {elapsed:.1f} ms)')
+                continue
+            problems.append(name)
+            self.stdout.write(self.style.ERROR(f'FIX   {name}') + f'  ({len(queries)} queries, {elapsed:.1f} ms)')
+            for sql, plan, issues in flagged:
+                self.stdout.write(f'    {", ".join(issues)}: {sql[:200]}')
+                self.stdout.write('      ' + '\n      '.join(plan))
+            if any(f'FROM "{model._meta.db_table}"' in sql for sql, _, _ in flagged):
+                existing = self.index_on(model, fields)
+                advice = f'exists as {existing}, but the planner did not use it' if existing else 'missing'
+                self.stdout.write(self.style.WARNING(
+                    f'    index: {model.__name__} models.Index(fields={fields!r}) - {advice}'
+                ))
+            else:
+                self.stdout.write(self.style.WARNING('    a related lookup is not indexed, see the plan above'))
+
+        if problems:
+            message = f'{len(problems)} query shape(s) scan or sort: {", ".join(problems)}'
+            if options['check']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('Every query shape is served by an index'))
+
+    def index_on(self, model, fields):
+        """Name of an index whose leading columns are `fields`, or None"""
+        columns = [model._meta.get_field(field).column for field in fields]
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        for name, constraint in constraints.items():
+            if constraint['index'] and constraint['columns'][:len(columns)] == columns:
+                return name
+        return None
@@ -0,0 +1,109 @@
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from store.benchmarks import QueryCounter, percentiles, seeded_database
+from store.models import Order, Product, ProductVariant
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database and place orders through POST /api/orders/ from several '
+        'threads at once; report checkout throughput, latency and queries per order'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000, help='Products in the seeded dataset')
+        parser.add_argument('--seed', type=int, default=42, help='Seed for generate_test_data and the carts')
+        parser.add_argument('--orders', type=int, default=200, help='Orders to place in total')
+        parser.add_argument('--concurrency', type=int, default=8, help='Threads placing orders at the same time')
+        parser.add_argument('--lines', type=int, default=20, help='Distinct products per order')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['lines'] < 1:
+            raise CommandError('--concurrency and --lines must be at least 1')
+        with seeded_database(options['products'], options['seed'], self.stdout):
+            with override_settings(QUERY_BUDGET_ENABLED=False):
+                self.run(options)
+
+    def run(self, options):
+        # What can be put in a cart: a variant with stock of a stock-tracked product, or an
+        # untracked product in stock
+        options_by_product = defaultdict(list)
+        for product_id, size, color in (
+            ProductVariant.objects.filter(stock__gt=0).order_by('id').values_list('product_id', 'size', 'color')
+        ):
+            options_by_product[product_id].append((size, color))
+        for product_id in Product.objects.filter(in_stock=True, variants__isnull=True).order_by('id').values_list('id', flat=True):
+            options_by_product[product_id].append(('', ''))
+        product_ids = sorted(options_by_product)
+        if len(product_ids) < options['lines']:
+            raise CommandError(f'Only {len(product_ids)} products in stock for {options["lines"]}-line orders')
+        shoppers = list(User.objects.order_by('id')[:options['concurrency']])
+        tokens = [Token.objects.get_or_create(user=user)[0].key for user in shoppers]
+        orders_before = Order.objects.count()
+        # Close this thread's connection before the workers open theirs
+        connection.close()
+
+        remaining = [options['orders']]
+        lock = threading.Lock()
+        timings, queries, statuses = [], [], Counter()
+
+        def worker(number):
+            rng = random.Random(options['seed'] * 1000 + number)
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {tokens[number % len(tokens)]}')
+            try:
+                while True:
+                    with lock:
+                        if not remaining[0]:
+                            return
+                        remaining[0] -= 1
+                    body = {'items': [
+                        dict(zip(('product_id', 'quantity', 'size', 'color'), (
+                            product_id, rng.choice((1, 1, 1, 2)), *rng.choice(options_by_product[product_id]),
+                        )))
+                        for product_id in rng.sample(product_ids, options['lines'])
+                    ]}
+                    counter = QueryCounter()
+                    with connection.execute_wrapper(counter):
+                        started = time.perf_counter()
+                        response = client.post('/api/orders/', body, format='json')
+                        elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        timings.append(elapsed)
+                        queries.append(counter.count)
+                        statuses[response.status_code] += 1
+            finally:
+                connection.close()
+
+        self.stdout.write(
+            f'Placing {options["orders"]} orders of {options["lines"]} lines from {options["concurrency"]} threads...'
+        )
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(options['concurrency'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        placed = Order.objects.count() - orders_before
+        latency = percentiles(timings)
+        self.stdout.write(
+            f'latency ms   p50 {latency["p50"]:.1f}   p95 {latency["p95"]:.1f}   p99 {latency["p99"]:.1f}\n'
+            f'queries/order  {min(queries)}-{max(queries)}\n'
+            f'statuses     {", ".join(f"{status}: {count}" for status, count in sorted(statuses.items()))}'
+        )
+        self.stdout.write(self.style.SUCCESS(f'{placed} orders in {elapsed:.2f} s = {placed / elapsed:.1f} orders/s'))
+        # 409 is a variant selling out during the run, which real checkouts hit too
+        if statuses.keys() - {201, 409}:
+            raise CommandError('Some checkouts failed, see the statuses above')
@@ -0,0 +1,200 @@
+import gc
+import json
+import platform
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from store.benchmarks import QueryCounter, percentiles, reset_process_caches, seeded_database
+from store.models import Category, Order, Product, ProductVariant, SubCategory, WishlistItem
+
+# Latency differences smaller than this are noise, whatever the tolerance says
+LATENCY_SLACK_MS = 1.0
+
+
+def compare(baseline, results, tolerance):
+    """Regressions of `results` against `baseline` ({route: stats} each), as messages"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['status'] != base['status']:
+            regressions.append(f'{name}: status {base["status"]} -> {result["status"]}')
+        if result['queries'] > base['queries']:
+            regressions.append(f'{name}: {base["queries"]} -> {result["queries"]} queries')
+        if result['bytes'] > base['bytes'] * (1 + tolerance):
+            regressions.append(f'{name}: {base["bytes"]} -> {result["bytes"]} bytes')
+        # p99 of a few dozen requests is mostly noise: it is reported, not gated
+        for key in ('p50', 'p95'):
+            limit = max(base[key] * (1 + tolerance), base[key] + LATENCY_SLACK_MS)
+            if result[key] > limit:
+                regressions.append(f'{name}: {key} {base[key]:.2f} -> {result[key]:.2f} ms')
+    return regressions
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database with a fixed dataset, drive the API routes in-process and '
+        'record p50/p95/p99 latency, queries and bytes per route; compare against a JSON baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000, help='Products in the seeded dataset')
+        parser.add_argument('--seed', type=int, default=42, help='Seed for generate_test_data')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per route')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per route first')
+        parser.add_argument('--cold', action='store_true', help='Clear the caches before every request')
+        parser.add_argument('--only', default='', help='Only routes whose name contains this text')
+        parser.add_argument(
+            '--baseline', default=str(settings.BASE_DIR / 'benchmarks' / 'endpoints.json'),
+            help='Baseline JSON file to compare with (and write with --save)',
+        )
+        parser.add_argument('--save', action='store_true', help='Write this run as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed growth of latency and bytes (0.5 = 50%%)')
+
+    def handle(self, *args, **options):
+        baseline_path = Path(options['baseline'])
+        baseline = None
+        if not options['save']:
+            try:
+                baseline = json.loads(baseline_path.read_text())
+            except FileNotFoundError:
+                self.stdout.write(self.style.WARNING(f'No baseline at {baseline_path}; run with --save to write one'))
+            if baseline and baseline['dataset'] != self.dataset(options):
+                raise CommandError(f'The baseline was recorded with other settings: {baseline["dataset"]}')
+
+        with seeded_database(options['products'], options['seed'], self.stdout):
+            # As in production: the query-budget checks are a DEBUG aid with their own overhead
+            with override_settings(QUERY_BUDGET_ENABLED=False):
+                results = self.run_routes(options)
+
+        self.report(results, baseline['routes'] if baseline else {})
+        if options['save']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps({
+                'dataset': self.dataset(options),
+                'machine': f'{platform.machine()} {platform.python_implementation()} {platform.python_version()}',
+                'recorded': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'routes': results,
+            }, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {baseline_path}'))
+            return
+        if baseline:
+            regressions = compare(baseline['routes'], results, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(self.style.SUCCESS(f'No regressions (tolerance {options["tolerance"]:.0%})'))
+
+    def dataset(self, options):
+        return {'products': options['products'], 'seed': options['seed'], 'cold': options['cold']}
+
+    def routes(self):
+        """(name, method, path, body, client) for every benchmarked route"""
+        product = Product.objects.order_by('-review_count', 'id').first()
+        category = Category.objects.annotate(n=Count('products')).order_by('-n', 'id').first()
+        subcategory = SubCategory.objects.annotate(n=Count('products')).order_by('-n', 'id').first()
+        # The best-stocked variants, so the repeated order doesn't sell them out mid-run
+        cart = ProductVariant.objects.order_by('-stock', 'id').values_list('product_id', 'size', 'color')[:3]
+        order = Order.objects.filter(user=self.shopper).order_by('-created_at').first()
+        wished = WishlistItem.objects.filter(user=self.shopper).values_list('product_id', flat=True).first()
+        products = '/api/products/'
+        return [
+            ('products: default', 'get', products, None, 'anonymous'),
+            ('products: newest', 'get', f'{products}?sort_by=newest', None, 'anonymous'),
+            ('products: price ascending', 'get', f'{products}?sort_by=price_asc', None, 'anonymous'),
+            ('products: price descending', 'get', f'{products}?sort_by=price_desc', None, 'anonymous'),
+            ('products: featured', 'get', f'{products}?featured=true', None, 'anonymous'),
+            ('products: category', 'get', f'{products}?category={category.pk}', None, 'anonymous'),
+            ('products: subcategory', 'get', f'{products}?subcategory={subcategory.pk}', None, 'anonymous'),
+            ('products: size', 'get', f'{products}?size=m', None, 'anonymous'),
+            ('products: color', 'get', f'{products}?color=black,navy', None, 'anonymous'),
+            ('products: price range', 'get', f'{products}?min_price=20&max_price=60', None, 'anonymous'),
+            ('products: combined filters', 'get', f'{products}?category={category.pk}&size=m&color=black&sort_by=price_asc', None, 'anonymous'),
+            ('products: page 20', 'get', f'{products}?page=20', None, 'anonymous'),
+            ('products: keyset page', 'get', f'{products}?cursor=&sort_by=price_asc', None, 'anonymous'),
+            ('products: sparse fields', 'get', f'{products}?fields=id,name,price', None, 'anonymous'),
+            ('products: facets', 'get', f'{products}facets/', None, 'anonymous'),
+            ('search', 'get', f'{products}search/?q=linen', None, 'anonymous'),
+            ('search: filtered', 'get', f'{products}search/?q=cotton&category={category.pk}', None, 'anonymous'),
+            ('search: did you mean', 'get', f'{products}search/?q=linnen', None, 'anonymous'),
+            ('suggestions', 'get', f'{products}search-suggestions/?q=li', None, 'anonymous'),
+            ('product detail', 'get', f'{products}{product.slug}/', None, 'anonymous'),
+            ('product bundle', 'get', f'{products}{product.slug}/bundle/', None, 'anonymous'),
+            ('reviews: product', 'get', f'/api/reviews/?product={product.pk}', None, 'anonymous'),
+            ('categories', 'get', '/api/categories/', None, 'anonymous'),
+            ('category detail', 'get', f'/api/categories/{category.pk}/', None, 'anonymous'),
+            ('subcategories', 'get', '/api/subcategories/', None, 'anonymous'),
+            ('wishlist', 'get', '/api/wishlist/', None, 'shopper'),
+            ('wishlist: check', 'get', f'/api/wishlist/check/{wished or product.pk}/', None, 'shopper'),
+            ('order history', 'get', '/api/orders/', None, 'shopper'),
+            ('order detail', 'get', f'/api/orders/{order.pk}/', None, 'shopper'),
+            ('order create', 'post', '/api/orders/', {
+                'items': [
+                    {'product_id': pk, 'quantity': 1, 'size': size, 'color': color} for pk, size, color in cart
+                ],
+                'shipping_address': '1 Main Street', 'shipping_city': 'London',
+                'shipping_postal_code': '10001', 'shipping_country': 'United Kingdom',
+            }, 'buyer'),
+        ]
+
+    def run_routes(self, options):
+        # The busiest shopper, so history and wishlist have something to show, and
+        # another one placing the orders, so the history doesn't grow during the run
+        busiest = Order.objects.values('user').annotate(n=Count('id')).order_by('-n', 'user')
+        self.shopper, buyer = (User.objects.get(pk=row['user']) for row in busiest[:2])
+        clients = {'anonymous': APIClient()}
+        for name, user in (('shopper', self.shopper), ('buyer', buyer)):
+            token, _ = Token.objects.get_or_create(user=user)
+            clients[name] = APIClient()
+            clients[name].credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        routes = [route for route in self.routes() if options['only'] in route[0]]
+        samples = {name: {'timings': [], 'queries': [], 'sizes': []} for name, *_ in routes}
+        statuses = {}
+        gc.collect()
+        # Round-robin over the routes, so a burst of machine noise lands on all of them
+        # instead of whichever route happened to be running
+        for round_number in range(options['warmup'] + options['requests']):
+            for name, method, path, body, client in routes:
+                send = getattr(clients[client], method)
+                if options['cold']:
+                    reset_process_caches()
+                counter = QueryCounter()
+                with connection.execute_wrapper(counter):
+                    started = time.perf_counter()
+                    response = send(path, body, format='json') if body is not None else send(path)
+                    elapsed = (time.perf_counter() - started) * 1000
+                if round_number < options['warmup']:
+                    continue
+                samples[name]['timings'].append(elapsed)
+                samples[name]['queries'].append(counter.count)
+                samples[name]['sizes'].append(len(response.content))
+                statuses[name] = response.status_code
+
+        return {
+            name: {
+                'method': method.upper(), 'path': path, 'status': statuses[name],
+                **{key: round(value, 3) for key, value in percentiles(samples[name]['timings']).items()},
+                'queries': max(samples[name]['queries']), 'bytes': round(statistics.mean(samples[name]['sizes'])),
+            }
+            for name, method, path, *_ in routes
+        }
+
+    def report(self, results, baseline):
+        self.stdout.write(f'\n{"route":<30}{"status":>7}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"bytes":>9}  vs baseline p95')
+        for name, result in results.items():
+            base = baseline.get(name)
+            change = f'{(result["p95"] / base["p95"] - 1) * 100:+.0f}%' if base and base['p95'] else ''
+            self.stdout.write(
+                f'{name:<30}{result["status"]:>7}{result["p50"]:>9.2f}{result["p95"]:>9.2f}{result["p99"]:>9.2f}'
+                f'{result["queries"]:>9}{result["bytes"]:>9}  {change}'
+            )
@@ -0,0 +1,55 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from store.models import Product
+from store.serializers import ProductListSerializer, ProductSerializer
+
+class Command(BaseCommand):
+    help = 'Compare ProductSerializer with the lean ProductListSerializer on product list pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=48, help='Products per page (48 is the API maximum)')
+        parser.add_argument('--repeat', type=int, default=50, help='Pages serialized per serializer')
+
+    def handle(self, *args, **options):
+        page_size, repeat = options['page_size'], options['repeat']
+        request = APIRequestFactory().get('/api/products/')
+        context = {'request': request}
+        queryset = Product.objects.select_related('category').order_by('-created_at', '-id')
+
+        if not queryset.exists():
+            raise CommandError('No products to serialize - run generate_test_data first')
+
+        def full():
+            return ProductSerializer(list(queryset[:page_size]), many=True, context=context).data
+
+        def lean():
+            rows = list(ProductListSerializer.rows(queryset)[:page_size])
+            return ProductListSerializer(rows, context=context).data
+
+        # Both must render the same JSON or the comparison means nothing
+        expected, actual = json.dumps(full(), default=str), json.dumps(lean(), default=str)
+        if expected != actual:
+            raise CommandError('ProductListSerializer output differs from ProductSerializer')
+
+        results = {}
+        for name, serialize in (('ProductSerializer', full), ('ProductListSerializer', lean)):
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    serialize()
+                elapsed = time.perf_counter() - started
+            results[name] = elapsed / repeat
+            self.stdout.write(
+                f'{name:<22} {elapsed / repeat * 1000:8.2f} ms/page  '
+                f'{len(queries) // repeat} queries/page'
+            )
+
+        speedup = results['ProductSerializer'] / results['ProductListSerializer']
+        self.stdout.write(self.style.SUCCESS(f'Identical output, lean path {speedup:.1f}x faster ({page_size} products/page)'))
@@ -1,49 +1,483 @@
-from django.core.management.base import BaseCommand
-from store.models import Product, Category
 import random
-from django.utils.text import slugify
+import time
+from array import array
+from bisect import bisect
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+
+from store.attributes import attribute_pairs, format_sizes
+from store.catalog import mark_catalog_rebuilt, mark_category_tree_changed
+from store.countries import country_code
+from store.models import (
+    Address, Category, Order, OrderItem, Product, ProductAttribute, ProductImage, ProductVariant, Review,
+    ReviewImage,
+    ShippingAddress, SubCategory, UserProfile, WishlistItem,
+)
+from store.ratings import STARS, histogram_field, summarize
+from store.search import rebuild_search_index
+
+PASSWORD = 'shopper-password'
+
+# Popularity follows a Zipf law: the product (or shopper) of rank r gets weight r ** -ZIPF_EXPONENT
+ZIPF_EXPONENT = 0.8
+# J-shaped, like most stores: mostly five stars, a bump at one star
+RATING_WEIGHTS = {1: 8, 2: 4, 3: 9, 4: 22, 5: 57}
+QUANTITY_WEIGHTS = {1: 85, 2: 10, 3: 4, 4: 1}
+# Share of products tracking stock per size/color variant; the rest are untracked (always sellable)
+TRACKED_SHARE = 0.3
+SOLD_OUT_SHARE = 0.12
+
+SIZE_RUNS = [
+    ['XS', 'S', 'M', 'L', 'XL'], ['S', 'M', 'L'], ['M', 'L', 'XL', 'XXL'],
+    ['28', '30', '32', '34', '36'], ['2-3Y', '4-5Y', '6-7Y', '8-9Y'], ['One Size'],
+]
+COLORS = ['Black', 'White', 'Navy', 'Grey', 'Beige', 'Red', 'Olive', 'Blue', 'Pink', 'Brown', 'Green', 'Yellow']
+ADJECTIVES = ['Classic', 'Relaxed', 'Slim', 'Oversized', 'Essential', 'Vintage', 'Cropped', 'Tailored',
+              'Lightweight', 'Cosy', 'Everyday', 'Premium', 'Washed', 'Ribbed', 'Quilted', 'Stretch']
+MATERIALS = ['Cotton', 'Linen', 'Denim', 'Wool', 'Jersey', 'Fleece', 'Silk', 'Corduroy', 'Twill', 'Knit']
+SENTENCES = [
+    'Cut for an easy fit that works from morning to evening.',
+    'Made from soft, breathable fabric that keeps its shape wash after wash.',
+    'Finished with reinforced seams and a clean hem.',
+    'Pairs well with the rest of the collection.',
+    'Machine washable at 30 degrees.',
+    'Responsibly sourced and produced in small batches.',
+    'A wardrobe staple in a palette of seasonal colours.',
+    'Designed with a little stretch for comfort.',
+]
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn',
+               'Maria', 'Wei', 'Amara', 'Luca', 'Noor', 'Kenji', 'Sofia', 'Omar', 'Ines', 'Tomas']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Okafor', 'Rossi', 'Kowalski', 'Nguyen', 'Silva', 'Haddad', 'Berg']
+CITIES = [('London', 'United Kingdom'), ('Manchester', 'United Kingdom'), ('Dublin', 'Ireland'),
+          ('Berlin', 'Germany'), ('Paris', 'France'), ('Madrid', 'Spain'), ('New York', 'United States'),
+          ('Toronto', 'Canada'), ('Sydney', 'Australia'), ('Amsterdam', 'Netherlands')]
+REVIEW_TITLES = {1: 'Disappointed', 2: 'Not great', 3: 'It is okay', 4: 'Really nice', 5: 'Love it'}
+
+
+class Timestamps:
+    """Lets bulk_create store the given created/updated values instead of now (auto_now/auto_now_add are switched off)"""
+
+    def __init__(self, *models):
+        self.fields = [
+            field for model in models for field in model._meta.concrete_fields
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+        ]
+
+    def __enter__(self):
+        self.saved = [(field, field.auto_now, field.auto_now_add) for field in self.fields]
+        for field in self.fields:
+            field.auto_now = field.auto_now_add = False
+
+    def __exit__(self, *exc_info):
+        for field, auto_now, auto_now_add in self.saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Writer:
+    """bulk_create in committed batches, counting rows and insert time per model"""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.rows = Counter()
+        self.seconds = Counter()
+
+    def insert(self, model, objects):
+        if not objects:
+            return objects
+        started = time.perf_counter()
+        with transaction.atomic():
+            model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self.seconds[model.__name__] += time.perf_counter() - started
+        self.rows[model.__name__] += len(objects)
+        return objects
+
+
+def zipf_weights(rng, count):
+    """Zipf weights for `count` items in random rank order, and their total"""
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    weights = [rank ** -ZIPF_EXPONENT for rank in ranks]
+    return weights, sum(weights)
+
+
+def spread(rng, expected):
+    """`expected` rounded up or down at random so the totals come out right on average"""
+    whole = int(expected)
+    return whole + (rng.random() < expected - whole)
+
+
+def geometric(rng, p, cap):
+    """1, 2, 3... with each further step taken with probability p"""
+    n = 1
+    while n < cap and rng.random() < p:
+        n += 1
+    return n
+
 
 class Command(BaseCommand):
-    help = 'Generate test products'
+    help = (
+        'Generate a realistic catalog for benchmarking: shoppers, products with images, sizes and '
+        'colors, reviews, orders and wishlists, with popularity skewed like a real store'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument('count', type=int, help='Number of products to generate')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed generates the same data')
+        parser.add_argument('--users', type=int, help='Shoppers to create (default: one per 10 products, at least 20)')
+        parser.add_argument('--reviews-per-product', type=float, default=2.0, help='Average reviews per product')
+        parser.add_argument('--orders-per-user', type=float, default=3.0, help='Average orders per shopper')
+        parser.add_argument('--wishlist-per-user', type=float, default=2.0, help='Average wishlist items per shopper')
+        parser.add_argument('--days', type=int, default=730, help='How far back creation dates go')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk_create and commit')
 
     def handle(self, *args, **options):
         count = options['count']
-        
-        # Make sure we have categories
-        categories = list(Category.objects.all())
-        if not categories:
-            self.stdout.write('Creating test categories...')
-            categories = []
-            for i in range(5):
-                name = f"Test Category {i+1}"
-                category = Category.objects.create(
-                    name=name,
-                    slug=slugify(name)
+        n_users = options['users'] if options['users'] is not None else max(20, count // 10)
+        if count < 1 or n_users < 1:
+            raise CommandError('Need at least one product and one shopper')
+        self.rng = random.Random(options['seed'])
+        self.writer = Writer(options['batch_size'])
+        self.now = timezone.now()
+        self.days = options['days']
+        started = time.perf_counter()
+
+        subcategories = self.categories()
+        with Timestamps(Product, ProductImage, Review, ReviewImage, Order, ShippingAddress, WishlistItem):
+            self.users(n_users)
+            self.products(count, subcategories, options['reviews_per_product'])
+            self.reviews()
+            self.orders(round(n_users * options['orders_per_user']))
+            self.wishlists(options['wishlist_per_user'])
+
+        # bulk_create skips the signals that keep these in step
+        self.stdout.write('Rebuilding the search index...')
+        rebuild_search_index()
+        mark_catalog_rebuilt()
+        mark_category_tree_changed()
+
+        self.report(time.perf_counter() - started)
+        self.stdout.write(f'Shoppers log in as shopper<N> with password {PASSWORD!r}')
+
+    def categories(self):
+        if not Category.objects.exists():
+            call_command('setup_categories', stdout=self.stdout)
+        subcategories = list(SubCategory.objects.select_related('category').order_by('id'))
+        if subcategories:
+            return subcategories
+        # Categories without subcategories: products go straight into a category
+        return [SubCategory(category=category) for category in Category.objects.order_by('id')]
+
+    def pick_date(self, after=None, recent_bias=1.0):
+        """A moment between `after` (default: --days ago) and now; bias > 1 favours recent dates"""
+        start = after or self.now - timedelta(days=self.days)
+        return self.now - (self.now - start) * (self.rng.random() ** recent_bias)
+
+    def users(self, n_users):
+        self.stdout.write(f'Generating {n_users} shoppers...')
+        rng, writer = self.rng, self.writer
+        first = (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        password = make_password(PASSWORD)  # hashing once, not per user, is most of the speed
+        self.user_ids = array('q')
+        for offset in range(0, n_users, writer.batch_size):
+            users = []
+            for n in range(first + offset, first + min(offset + writer.batch_size, n_users)):
+                first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                users.append(User(
+                    username=f'shopper{n}', email=f'shopper{n}@example.com', password=password,
+                    first_name=first_name, last_name=last_name,
+                    date_joined=self.pick_date(recent_bias=1.5),
+                ))
+            writer.insert(User, users)
+            self.user_ids.extend(user.pk for user in users)
+
+            profiles, addresses, shipping = [], [], []
+            for user in users:
+                profiles.append(UserProfile(user_id=user.pk, phone_number=f'+44 7{rng.randrange(10 ** 9):09d}'))
+                for position in range(geometric(rng, 0.3, 3)):
+                    city, country = rng.choice(CITIES)
+                    street = f'{rng.randrange(1, 300)} {rng.choice(LAST_NAMES)} Street'
+                    postal_code = f'{rng.randrange(10000, 99999)}'
+                    addresses.append(Address(
+                        user_id=user.pk, address_line1=street, city=city, postal_code=postal_code,
+                        country=country, is_default=position == 0,
+                    ))
+                    shipping.append(ShippingAddress(
+                        user_id=user.pk, first_name=user.first_name, last_name=user.last_name, address=street,
+                        city=city, postal_code=postal_code, country=country, is_default=position == 0,
+                        created_at=self.pick_date(after=user.date_joined),
+                    ))
+            writer.insert(UserProfile, profiles)
+            writer.insert(Address, addresses)
+            writer.insert(ShippingAddress, shipping)
+        self.user_weights = list(accumulate(zipf_weights(rng, n_users)[0]))
+
+    def attribute_profiles(self):
+        """A fixed set of (sizes, colors, attribute pairs) combinations products draw from"""
+        profiles = []
+        for _ in range(64):
+            sizes = format_sizes(self.rng.choice(SIZE_RUNS))
+            colors = self.rng.sample(COLORS, geometric(self.rng, 0.45, 4))
+            profiles.append((sizes, colors, sorted(attribute_pairs(Product(sizes=sizes, colors=colors)))))
+        return profiles
+
+    def products(self, count, subcategories, reviews_per_product):
+        self.stdout.write(f'Generating {count} products...')
+        rng, writer = self.rng, self.writer
+        first = (Product.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        profiles = self.attribute_profiles()
+        subcategory_weights = list(accumulate(zipf_weights(rng, len(subcategories))[0]))
+        weights, total_weight = zipf_weights(rng, count)
+        max_reviews = max(1, len(self.user_ids) // 2)
+
+        # Per product, by generation order: what the later phases need without re-reading the table
+        self.product_ids = array('q')
+        self.product_created = array('d')
+        self.product_cents = array('q')
+        self.product_profile = array('B')
+        self.product_snapshots = []
+        self.product_weights = list(accumulate(weights))
+        self.product_ratings = {star: array('l') for star in STARS}
+        # Variant ids, product by product and size by size, colors within, with their stock;
+        # and per product 1 + the position of its first variant there, 0 when it's untracked
+        self.variant_ids = array('q')
+        self.variant_stock = array('q')
+        self.product_variant = array('q')
+        self.profiles = profiles
+
+        for offset in range(0, count, writer.batch_size):
+            products, chosen = [], []
+            for index in range(offset, min(offset + writer.batch_size, count)):
+                n = first + index
+                subcategory = subcategories[bisect(subcategory_weights, rng.random() * subcategory_weights[-1])]
+                kind = subcategory.name or subcategory.category.name
+                name = f'{rng.choice(ADJECTIVES)} {rng.choice(MATERIALS)} {kind}'
+                # Log-normal prices around 35 with a long tail, as x.99
+                cents = min(max(int(rng.lognormvariate(3.5, 0.6)), 4), 499) * 100 + 99
+                sale_cents = int(cents * rng.uniform(0.5, 0.9)) // 100 * 100 + 99 if rng.random() < 0.15 else None
+                profile = rng.randrange(len(profiles))
+                sizes, colors, _ = profiles[profile]
+
+                # Reviews follow popularity; their aggregates are stored with the product
+                # now instead of being rebuilt from the reviews afterwards
+                review_count = min(spread(rng, count * reviews_per_product * weights[index] / total_weight), max_reviews)
+                ratings = Counter(rng.choices(list(RATING_WEIGHTS), weights=list(RATING_WEIGHTS.values()), k=review_count))
+                review_count, average = summarize(ratings)
+
+                # Heavy-tailed stock per variant, some sold out; in_stock follows the variants
+                stock = None
+                if rng.random() < TRACKED_SHARE:
+                    stock = [
+                        0 if rng.random() < SOLD_OUT_SHARE else min(int(rng.paretovariate(1.2) * 5), 500)
+                        for _ in range(len(sizes.split(',')) * len(colors))
+                    ]
+                in_stock = any(stock) if stock is not None else rng.random() < 0.95
+
+                created = self.pick_date(recent_bias=1.5)
+                product = Product(
+                    name=name, slug=f'{slugify(name)}-{n}',
+                    description=' '.join(rng.sample(SENTENCES, rng.randint(2, 5))),
+                    price=Decimal(cents) / 100, sale_price=Decimal(sale_cents) / 100 if sale_cents else None,
+                    colors=colors, sizes=sizes, sku=f'SKU-{n:08d}', featured=rng.random() < 0.02,
+                    in_stock=in_stock, image=f'products/generated/{n}-0.jpg',
+                    category_id=subcategory.category_id, subcategory_id=subcategory.pk,
+                    created_at=created, updated_at=created,
+                    review_count=review_count, average_rating=average,
+                    **{histogram_field(star): ratings[star] for star in STARS},
                 )
-                categories.append(category)
-        
-        # Generate products
-        self.stdout.write(f'Generating {count} test products...')
-        for i in range(count):
-            name = f"Test Product {i+1}"
-            price = Decimal(str(round(random.uniform(9.99, 99.99), 2)))
-            category = random.choice(categories)
-            
-            Product.objects.create(
-                name=name,
-                slug=slugify(name),
-                description=f"This is a test product description for {name}",
-                price=price,
-                category=category,
-                # Don't include image as it's required in your model but we don't have test images
-                # Adjust any other required fields based on your model
+                products.append(product)
+                chosen.append((n, profile, sale_cents or cents, ratings, stock))
+            writer.insert(Product, products)
+
+            images, attributes, variants = [], [], []
+            for product, (n, profile, cents, ratings, stock) in zip(products, chosen):
+                self.product_ids.append(product.pk)
+                self.product_created.append(product.created_at.timestamp())
+                self.product_cents.append(cents)
+                self.product_profile.append(profile)
+                self.product_snapshots.append((product.name, product.image.name))
+                for star in STARS:
+                    self.product_ratings[star].append(ratings[star])
+                for position in range(geometric(rng, 0.5, 6)):
+                    images.append(ProductImage(
+                        product_id=product.pk, image=f'products/generated/{n}-{position}.jpg',
+                        alt_text=product.name[:100], is_feature=position == 0, display_order=position,
+                        created_at=product.created_at,
+                    ))
+                attributes.extend(
+                    ProductAttribute(product_id=product.pk, kind=kind, value=value) for kind, value in profiles[profile][2]
+                )
+                if stock is not None:
+                    sizes, colors, _ = profiles[profile]
+                    variants.append([
+                        ProductVariant(product_id=product.pk, size=size, color=color, sku=f'{product.sku}-{number}', stock=units)
+                        for number, ((size, color), units) in enumerate(zip(
+                            ((size, color) for size in sizes.split(',') for color in colors), stock
+                        ))
+                    ])
+            writer.insert(ProductImage, images)
+            writer.insert(ProductAttribute, attributes)
+            writer.insert(ProductVariant, [variant for group in variants for variant in group])
+            groups = iter(variants)
+            for *_, stock in chosen:
+                if stock is None:
+                    self.product_variant.append(0)
+                    continue
+                self.product_variant.append(len(self.variant_ids) + 1)
+                self.variant_ids.extend(variant.pk for variant in next(groups))
+                self.variant_stock.extend(stock)
+
+    def reviews(self):
+        self.stdout.write('Generating reviews...')
+        rng, writer = self.rng, self.writer
+        reviews = []
+        for index, product_id in enumerate(self.product_ids):
+            ratings = [star for star in STARS for _ in range(self.product_ratings[star][index])]
+            if not ratings:
+                continue
+            rng.shuffle(ratings)
+            created = self.product_created[index]
+            authors = rng.sample(range(len(self.user_ids)), len(ratings))
+            for author, rating in zip(authors, ratings):
+                reviews.append(Review(
+                    product_id=product_id, user_id=self.user_ids[author], rating=rating,
+                    title=REVIEW_TITLES[rating], content=' '.join(rng.sample(SENTENCES, rng.randint(1, 3))),
+                    is_verified_purchase=rng.random() < 0.4,
+                    created_at=self.pick_date(after=datetime.fromtimestamp(created, tz=dt_timezone.utc)),
+                ))
+            if len(reviews) >= writer.batch_size:
+                self.write_reviews(reviews)
+                reviews = []
+        self.write_reviews(reviews)
+
+    def write_reviews(self, reviews):
+        self.writer.insert(Review, reviews)
+        self.writer.insert(ReviewImage, [
+            ReviewImage(review_id=review.pk, image=f'review_images/generated/{review.pk}.jpg', uploaded_at=review.created_at)
+            for review in reviews if self.rng.random() < 0.03
+        ])
+
+    def pick_product(self):
+        return bisect(self.product_weights, self.rng.random() * self.product_weights[-1])
+
+    def pick_user(self):
+        return bisect(self.user_weights, self.rng.random() * self.user_weights[-1])
+
+    def orders(self, n_orders):
+        self.stdout.write(f'Generating {n_orders} orders...')
+        rng, writer = self.rng, self.writer
+        quantities, quantity_weights = list(QUANTITY_WEIGHTS), list(QUANTITY_WEIGHTS.values())
+        reserved = set()
+        for offset in range(0, n_orders, writer.batch_size):
+            orders, lines = [], []
+            for _ in range(min(writer.batch_size, n_orders - offset)):
+                created = self.pick_date(recent_bias=1.3)
+                age = self.now - created
+                if age > timedelta(days=14):
+                    status = 'cancelled' if rng.random() < 0.04 else 'delivered'
+                elif age > timedelta(days=3):
+                    status = 'shipped'
+                elif age > timedelta(days=1):
+                    status = 'processing'
+                else:
+                    status = 'pending'
+                city, country = rng.choice(CITIES)
+
+                # Mostly one or two products, a few big baskets
+                items, subtotal = [], 0
+                for index in {self.pick_product() for _ in range(geometric(rng, 0.45, 8))}:
+                    sizes, colors, _ = self.profiles[self.product_profile[index]]
+                    sizes = sizes.split(',')
+                    size, color = rng.randrange(len(sizes)), rng.randrange(len(colors))
+                    quantity = rng.choices(quantities, weights=quantity_weights)[0]
+                    cents = self.product_cents[index]
+                    subtotal += cents * quantity
+                    variant = self.product_variant[index]
+                    variant = variant - 1 + size * len(colors) + color if variant else None
+                    if variant is not None and status == 'pending':
+                        # Unpaid orders hold their units, as at checkout, so releasing them later
+                        # gives back only what they took; a line the shelf can't cover is left
+                        # untracked, like lines from before stock was tracked
+                        if self.variant_stock[variant] >= quantity:
+                            self.variant_stock[variant] -= quantity
+                            reserved.add(variant)
+                        else:
+                            variant = None
+                    name, image = self.product_snapshots[index]
+                    items.append(dict(
+                        product_id=self.product_ids[index], quantity=quantity, price=Decimal(cents) / 100,
+                        size=sizes[size], color=colors[color],
+                        product_name=name, product_image=image,
+                        variant_id=self.variant_ids[variant] if variant is not None else None,
+                    ))
+                orders.append(Order(
+                    user_id=self.user_ids[self.pick_user()], status=status,
+                    tracking_number=f'TRK{rng.randrange(10 ** 10):010d}' if status in ('shipped', 'delivered') else '',
+                    shipping_address=f'{rng.randrange(1, 300)} {rng.choice(LAST_NAMES)} Street',
+                    shipping_city=city, shipping_postal_code=f'{rng.randrange(10000, 99999)}',
+                    shipping_country=country_code(country), payment_method='paypal' if rng.random() < 0.2 else 'credit_card',
+                    subtotal=Decimal(subtotal) / 100, total=Decimal(subtotal) / 100,
+                    created_at=created, updated_at=created,
+                ))
+                lines.append(items)
+            writer.insert(Order, orders)
+            writer.insert(OrderItem, [
+                OrderItem(order_id=order.pk, **item) for order, items in zip(orders, lines) for item in items
+            ])
+        self.write_reservations(reserved)
+
+    def write_reservations(self, reserved):
+        """Store the stock left after pending orders' reservations, and in_stock with it"""
+        if not reserved:
+            return
+        with transaction.atomic():
+            ProductVariant.objects.bulk_update(
+                [ProductVariant(pk=self.variant_ids[index], stock=self.variant_stock[index]) for index in sorted(reserved)],
+                ['stock'], batch_size=self.writer.batch_size,
             )
-            
-            if (i+1) % 100 == 0:
-                self.stdout.write(f'Created {i+1} products...')
-        
-        self.stdout.write(self.style.SUCCESS(f'Successfully generated {count} test products'))
\ No newline at end of file
+            sold_out = []
+            for index, first in enumerate(self.product_variant):
+                if not first:
+                    continue
+                sizes, colors, _ = self.profiles[self.product_profile[index]]
+                variants = range(first - 1, first - 1 + len(sizes.split(',')) * len(colors))
+                if not reserved.isdisjoint(variants) and not any(self.variant_stock[variant] for variant in variants):
+                    sold_out.append(self.product_ids[index])
+            for offset in range(0, len(sold_out), self.writer.batch_size):
+                Product.objects.filter(pk__in=sold_out[offset:offset + self.writer.batch_size]).update(in_stock=False)
+
+    def wishlists(self, per_user):
+        self.stdout.write('Generating wishlists...')
+        rng, writer = self.rng, self.writer
+        items = []
+        for user_id in self.user_ids:
+            picks = {self.pick_product() for _ in range(spread(rng, rng.expovariate(1 / per_user)))} if per_user else ()
+            items.extend(
+                WishlistItem(user_id=user_id, product_id=self.product_ids[index], added_at=self.pick_date(recent_bias=2))
+                for index in picks
+            )
+            if len(items) >= writer.batch_size:
+                writer.insert(WishlistItem, items)
+                items = []
+        writer.insert(WishlistItem, items)
+
+    def report(self, elapsed):
+        writer = self.writer
+        self.stdout.write(f'\n{"model":<18}{"rows":>12}{"seconds":>10}{"rows/s":>12}')
+        for name, rows in writer.rows.most_common():
+            seconds = writer.seconds[name]
+            self.stdout.write(f'{name:<18}{rows:>12}{seconds:>10.1f}{rows / seconds if seconds else 0:>12.0f}')
+        total = sum(writer.rows.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {total} rows in {elapsed:.1f} s ({total / elapsed:.0f} rows/s overall)'
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from store.ratings import rebuild_rating_aggregates
+
+class Command(BaseCommand):
+    help = 'Recompute stored product rating aggregates (average, count, per-star histogram) from reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products written per bulk_update')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding product rating aggregates...')
+        updated = rebuild_rating_aggregates(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Updated aggregates for {updated} reviewed products'))
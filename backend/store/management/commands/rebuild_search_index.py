@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from store.search import fts_available, rebuild_search_index
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index from the catalog'
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            self.stdout.write(self.style.WARNING('Full-text search needs SQLite FTS5; nothing to rebuild'))
+            return
+        self.stdout.write('Rebuilding product search index...')
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} products'))
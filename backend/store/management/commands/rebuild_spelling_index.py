@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from store.search import fts_available
+from store.spelling import CREATE_VOCAB_SQL, DROP_VOCAB_SQL, spelling
+
+class Command(BaseCommand):
+    help = 'Recreate the search vocabulary used for "did you mean" corrections and report its size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', nargs='*', default=[], help='Misspelled queries to try against the rebuilt index')
+
+    def handle(self, *args, **options):
+        if fts_available():
+            self.stdout.write('Recreating search vocabulary table...')
+            with connection.cursor() as cursor:
+                cursor.execute(DROP_VOCAB_SQL)
+                cursor.execute(CREATE_VOCAB_SQL)
+
+        started = time.perf_counter()
+        index = spelling.rebuild()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Spelling index has {len(index.terms)} terms ({elapsed * 1000:.0f} ms to build)'
+        ))
+
+        for query in options['check']:
+            started = time.perf_counter()
+            corrected, matches = index.correct(query)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'  {query!r} -> {corrected!r} {matches} ({elapsed * 1000:.2f} ms)')
@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store.inventory import expired_orders, release_expired, reservation_minutes
+
+
+class Command(BaseCommand):
+    help = 'Cancel orders left unpaid past the reservation window and give their stock back'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--minutes', type=int, default=None,
+            help='Reservation window (defaults to the STOCK_RESERVATION_MINUTES setting)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only count the expired orders')
+
+    def handle(self, *args, **options):
+        minutes = options['minutes'] if options['minutes'] is not None else reservation_minutes()
+        cutoff = timezone.now() - timedelta(minutes=minutes)
+        if options['dry_run']:
+            expired = expired_orders(cutoff).count()
+            self.stdout.write(f'{expired} pending orders older than {minutes} minutes')
+            return
+        orders, units = release_expired(cutoff)
+        self.stdout.write(self.style.SUCCESS(f'Cancelled {orders} expired orders and released {units} units'))
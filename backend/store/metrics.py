@@ -0,0 +1,269 @@
+"""Request-phase timing, the Server-Timing header and Prometheus metrics.
+
+MetricsMiddleware times each request by phase:
+
+  auth    DRF authentication (TimedTokenAuthentication)
+  view    view code, including building serializer data
+  db      every SQL query, wherever it runs
+  render  rendering the response body
+  stripe  outbound Stripe API calls (wrapped in phase('stripe'))
+
+Phases are exclusive: time spent in queries or Stripe calls made while another
+phase is open counts towards db/stripe only, so the phases add up to roughly
+the total. They are sent back in a Server-Timing header and aggregated per
+route (the URL pattern, not the path) into latency and query-count histograms.
+Cache sizes and hit ratios come from the caches registered with
+register_cache(). /metrics (store.views.metrics_view) serves everything in the
+Prometheus text format.
+
+The registry is per process: with several workers, each one reports its own
+numbers. Recording costs two perf_counter() calls per query and one locked
+update per request.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.authentication import TokenAuthentication
+
+from .query_budget import ignore_in_call_sites
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+PHASES = ('auth', 'view', 'db', 'render', 'stripe')
+
+_timings = ContextVar('store_request_timings', default=None)
+
+ignore_in_call_sites(__file__)
+
+
+class RequestTimings:
+    """Exclusive seconds per phase for one request"""
+
+    def __init__(self):
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self.stack = []  # [name, started, seconds spent in nested phases]
+
+    def start(self, name):
+        self.stack.append([name, time.perf_counter(), 0.0])
+
+    def stop(self, name=None):
+        """Close phase `name` and any phases still open inside it (all of them when None)"""
+        if name is not None and not any(frame[0] == name for frame in self.stack):
+            return
+        now = time.perf_counter()
+        while self.stack:
+            frame_name, started, nested = self.stack.pop()
+            elapsed = now - started
+            self.durations[frame_name] = self.durations.get(frame_name, 0.0) + elapsed - nested
+            if self.stack:
+                self.stack[-1][2] += elapsed
+            if frame_name == name:
+                return
+
+    def server_timing(self, total):
+        entries = []
+        for name, seconds in self.durations.items():
+            if name == 'db' and self.queries:
+                entries.append(f'db;dur={seconds * 1000:.1f};desc="{self.queries} queries"')
+            elif seconds:
+                entries.append(f'{name};dur={seconds * 1000:.1f}')
+        entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+
+@contextmanager
+def phase(name):
+    """Count the block towards phase `name` of the current request (no-op outside one)"""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    timings.start(name)
+    try:
+        yield
+    finally:
+        timings.stop(name)
+
+
+def _time_query(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    timings.queries += 1
+    timings.start('db')
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.stop('db')
+
+
+class TimedTokenAuthentication(TokenAuthentication):
+    def authenticate(self, request):
+        with phase('auth'):
+            return super().authenticate(request)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def _labels(**labels):
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.caches = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = defaultdict(int)  # (route, method, status)
+            self.latency = {}  # (route, method) -> Histogram
+            self.queries = {}  # route -> Histogram
+            self.phase_seconds = defaultdict(float)  # (route, phase)
+
+    def register_cache(self, name, stats):
+        """`stats()` returns a dict with hits, misses and optionally evictions, entries, bytes"""
+        self.caches[name] = stats
+
+    def observe(self, route, method, status, total, timings):
+        with self.lock:
+            self.requests[route, method, status] += 1
+            latency = self.latency.get((route, method))
+            if latency is None:
+                latency = self.latency[route, method] = Histogram(LATENCY_BUCKETS)
+            latency.observe(total)
+            queries = self.queries.get(route)
+            if queries is None:
+                queries = self.queries[route] = Histogram(QUERY_BUCKETS)
+            queries.observe(timings.queries)
+            for name, seconds in timings.durations.items():
+                if seconds:
+                    self.phase_seconds[route, name] += seconds
+
+    def render(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(samples)
+
+        def histogram_samples(name, histogram, **labels):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                bucket = _labels(**labels, le=bound if bound == '+Inf' else _number(float(bound)))
+                yield f'{name}_bucket{bucket} {cumulative}'
+            yield f'{name}_sum{_labels(**labels)} {_number(histogram.sum)}'
+            yield f'{name}_count{_labels(**labels)} {cumulative}'
+
+        with self.lock:
+            metric('store_http_requests_total', 'counter', 'Requests handled, by route, method and status.', [
+                f'store_http_requests_total{_labels(route=route, method=method, status=status)} {count}'
+                for (route, method, status), count in sorted(self.requests.items())
+            ])
+            metric('store_http_request_duration_seconds', 'histogram', 'Request latency by route.', [
+                sample
+                for (route, method), histogram in sorted(self.latency.items())
+                for sample in histogram_samples('store_http_request_duration_seconds', histogram, route=route, method=method)
+            ])
+            metric('store_http_request_phase_seconds_total', 'counter', 'Time spent per request phase, by route.', [
+                f'store_http_request_phase_seconds_total{_labels(route=route, phase=name)} {_number(seconds)}'
+                for (route, name), seconds in sorted(self.phase_seconds.items())
+            ])
+            metric('store_db_queries_per_request', 'histogram', 'SQL queries per request, by route.', [
+                sample
+                for route, histogram in sorted(self.queries.items())
+                for sample in histogram_samples('store_db_queries_per_request', histogram, route=route)
+            ])
+
+        cache_stats = {name: stats() for name, stats in sorted(self.caches.items())}
+        for key, kind, help_text in (
+            ('hits', 'counter', 'Cache lookups that found an entry.'),
+            ('misses', 'counter', 'Cache lookups that found nothing.'),
+            ('evictions', 'counter', 'Entries evicted to stay within the size bound.'),
+            ('entries', 'gauge', 'Entries currently cached.'),
+            ('bytes', 'gauge', 'Bytes currently cached.'),
+        ):
+            name = f'store_cache_{key}' + ('_total' if kind == 'counter' else '')
+            metric(name, kind, help_text, [
+                f'{name}{_labels(cache=cache)} {stats[key]}' for cache, stats in cache_stats.items() if key in stats
+            ])
+        metric('store_cache_hit_ratio', 'gauge', 'Hits over lookups since the process started.', [
+            f'store_cache_hit_ratio{_labels(cache=cache)} '
+            f'{_number(stats["hits"] / ((stats["hits"] + stats["misses"]) or 1))}'
+            for cache, stats in cache_stats.items()
+        ])
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+register_cache = registry.register_cache
+
+
+class MetricsMiddleware:
+    """Outermost middleware: times the request and records it in the registry"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(_time_query):
+                response = self.get_response(request)
+            timings.stop()
+        finally:
+            _timings.reset(token)
+        total = time.perf_counter() - started
+
+        match = request.resolver_match
+        route = match.route if match is not None else '<unmatched>'
+        registry.observe(route, request.method, response.status_code, total, timings)
+        if getattr(settings, 'METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = timings.server_timing(total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = _timings.get()
+        if timings is not None:
+            timings.start('view')
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook runs
+        timings = _timings.get()
+        if timings is not None:
+            timings.stop('view')
+            timings.start('render')
+        return response
+
@@ -0,0 +1,68 @@
+# Generated by Django 4.2 on 2026-10-17 19:20
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Review = apps.get_model('store', 'Review')
+    rows = (
+        Review.objects.order_by()
+        .values('product_id')
+        .annotate(**{f'rating_{star}_count': Count('id', filter=Q(rating=star)) for star in range(1, 6)})
+    )
+    for row in rows:
+        product_id = row.pop('product_id')
+        review_count = sum(row.values())
+        total = sum(star * row[f'rating_{star}_count'] for star in range(1, 6))
+        average = (Decimal(total) / review_count).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        Product.objects.filter(pk=product_id).update(review_count=review_count, average_rating=average, **row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_alter_order_shipping_address_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='average_rating',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-17 19:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAttribute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('size', 'Size'), ('color', 'Color')], max_length=10)),
+                ('value', models.CharField(max_length=50)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attributes', to='store.product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='productattribute',
+            index=models.Index(fields=['kind', 'value', 'product'], name='store_attr_lookup_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productattribute',
+            unique_together={('product', 'kind', 'value')},
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Rewrites Product.sizes into the canonical "S,M,L" form and fills ProductAttribute
+# from the mixed formats that exist in the wild: comma lists, JSON arrays and the
+# Python list reprs written by older bulk uploads.
+
+import ast
+import json
+
+from django.db import migrations
+
+
+def split_values(raw):
+    if raw is None:
+        return []
+    if isinstance(raw, (list, tuple)):
+        values = raw
+    else:
+        raw = str(raw).strip()
+        if not raw:
+            return []
+        values = None
+        if raw.startswith('[') and raw.endswith(']'):
+            for loader in (json.loads, ast.literal_eval):
+                try:
+                    values = loader(raw)
+                    break
+                except (ValueError, SyntaxError):
+                    continue
+            if not isinstance(values, (list, tuple)):
+                values = raw[1:-1].replace('"', '').replace("'", '').split(',')
+        else:
+            values = raw.split(',')
+
+    cleaned = []
+    for value in values:
+        value = str(value).strip()
+        if value and value not in cleaned:
+            cleaned.append(value)
+    return cleaned
+
+
+def normalize_attributes(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductAttribute = apps.get_model('store', 'ProductAttribute')
+
+    batch = []
+    for product in Product.objects.only('id', 'sizes', 'colors').iterator(chunk_size=2000):
+        sizes = split_values(product.sizes)
+        canonical = ','.join(sizes)
+        if (product.sizes or '') != canonical:
+            Product.objects.filter(pk=product.pk).update(sizes=canonical)
+
+        pairs = {('size', size.lower()) for size in sizes}
+        pairs |= {('color', color.lower()) for color in split_values(product.colors)}
+        batch.extend(ProductAttribute(product_id=product.pk, kind=kind, value=value[:50]) for kind, value in pairs)
+        if len(batch) >= 5000:
+            ProductAttribute.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        ProductAttribute.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_productattribute'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_attributes, migrations.RunPython.noop),
+    ]
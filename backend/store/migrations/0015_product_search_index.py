@@ -0,0 +1,41 @@
+# Creates the SQLite FTS5 product search index (see store/search.py) and fills it
+# from the existing catalog. Other database backends skip this and search with
+# icontains instead.
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS store_product_fts USING fts5(
+            name, description, category,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    schema_editor.execute("""
+        INSERT INTO store_product_fts (rowid, name, description, category)
+        SELECT p.id, p.name, p.description, c.name || ' ' || COALESCE(s.name, '')
+        FROM store_product p
+        JOIN store_category c ON c.id = p.category_id
+        LEFT JOIN store_subcategory s ON s.id = p.subcategory_id
+    """)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS store_product_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,29 @@
+# Exposes the FTS5 index vocabulary as a table for spelling corrections
+# (see store/spelling.py). SQLite only, like the index itself.
+
+from django.db import migrations
+
+
+def create_vocabulary(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS store_product_fts_vocab USING fts5vocab(store_product_fts, 'col')"
+    )
+
+
+def drop_vocabulary(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS store_product_fts_vocab')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_product_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_vocabulary, drop_vocabulary),
+    ]
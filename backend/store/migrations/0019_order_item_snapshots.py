@@ -0,0 +1,44 @@
+# Generated by Django 4.2 on 2026-10-17 20:17
+
+from django.db import migrations, models
+from django.db.models import Case, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+
+def snapshot_existing_lines(apps, schema_editor):
+    # Older lines never stored what was bought: the product as it is now is the best there is,
+    # which is what the history showed for them until now
+    OrderItem = apps.get_model('store', 'OrderItem')
+    Product = apps.get_model('store', 'Product')
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    OrderItem.objects.update(
+        product_name=Subquery(product.values('name')[:1]),
+        product_image=Coalesce(Subquery(product.values('image')[:1]), Value('')),
+    )
+    # Lines from before orders were priced from the catalog may hold the 0 default
+    OrderItem.objects.filter(price=0).update(
+        price=Subquery(product.annotate(
+            paid=Case(When(sale_price__isnull=False, then=F('sale_price')), default=F('price'))
+        ).values('paid')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_product_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_image',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.RunPython(snapshot_existing_lines, migrations.RunPython.noop),
+    ]
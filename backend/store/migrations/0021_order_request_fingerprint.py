@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='request_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
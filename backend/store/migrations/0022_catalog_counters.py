@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-17 20:40
+
+import time
+
+from django.db import migrations, models
+
+
+def create_counters(apps, schema_editor):
+    # Seeded from the clock so versions never repeat ones handed out from the old cache counters
+    CatalogCounter = apps.get_model('store', 'CatalogCounter')
+    now = time.time()
+    CatalogCounter.objects.bulk_create([
+        CatalogCounter(name=name, value=int(now * 1000), changed_at=int(now)) for name in ('catalog', 'category-tree')
+    ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_order_request_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField()),
+                ('changed_at', models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(create_counters, migrations.RunPython.noop),
+    ]
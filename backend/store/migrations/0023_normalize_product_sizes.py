@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-17 22:10
+
+from django.db import migrations
+
+from store.attributes import format_sizes
+
+
+def normalize_sizes(apps, schema_editor):
+    # Rows written before sizes were normalized on save; reads no longer parse the old formats
+    Product = apps.get_model('store', 'Product')
+    changed = []
+    for product in Product.objects.exclude(sizes__isnull=True).exclude(sizes='').only('id', 'sizes').iterator():
+        sizes = format_sizes(product.sizes)
+        if sizes != product.sizes:
+            product.sizes = sizes
+            changed.append(product)
+    Product.objects.bulk_update(changed, ['sizes'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_catalog_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_sizes, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.conf import settings # For User model
 
@@ -49,20 +49,89 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)  # Auto-updates on save
     average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
     review_count = models.IntegerField(default=0)
+    # Per-star histogram, kept in step with average_rating/review_count by store.ratings
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return self.name
     
-    @property
-    def average_rating(self):
-        reviews = self.reviews.all()
-        if reviews.count() > 0:
-            return sum(review.rating for review in reviews) / reviews.count()
-        return 0
+    class Meta:
+        indexes = [
+            # One index per listing sort order (see ProductViewSet.get_queryset), with the
+            # id tie-breaker so keyset pagination can seek straight to the next page
+            models.Index(fields=['created_at', 'id'], name='store_prod_created_idx'),
+            models.Index(fields=['price', 'id'], name='store_prod_price_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='store_prod_cat_created_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='store_prod_cat_price_idx'),
+            models.Index(fields=['featured', 'created_at', 'id'], name='store_prod_featured_idx'),
+        ]
     
     @property
-    def review_count(self):
-        return self.reviews.count()
+    def rating_histogram(self):
+        return {str(star): getattr(self, f'rating_{star}_count') for star in range(1, 6)}
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the post_save handler skip the attribute sync when sizes/colors didn't change
+        if 'sizes' in field_names and 'colors' in field_names:
+            instance._loaded_attributes = (instance.sizes, instance.colors)
+        # ...and the category tree rebuild when the product stayed where it was
+        if 'category_id' in field_names and 'subcategory_id' in field_names:
+            instance._loaded_categories = (instance.category_id, instance.subcategory_id)
+        return instance
+
+class ProductAttribute(models.Model):
+    """Normalized size/color values of a product, mirrored from Product.sizes/colors for indexed filtering"""
+    SIZE = 'size'
+    COLOR = 'color'
+    KIND_CHOICES = (
+        (SIZE, 'Size'),
+        (COLOR, 'Color'),
+    )
+    
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='attributes')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    value = models.CharField(max_length=50)  # Lower-cased for case-insensitive matching
+    
+    def __str__(self):
+        return f"{self.product_id} {self.kind}={self.value}"
+    
+    class Meta:
+        unique_together = ('product', 'kind', 'value')
+        indexes = [
+            # Covers "products with kind=value" lookups without touching the table
+            models.Index(fields=['kind', 'value', 'product'], name='store_attr_lookup_idx'),
+        ]
+
+class ProductVariant(models.Model):
+    """Stock of one size/color of a product. Products without variants don't track stock (see store.inventory)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='variants')
+    size = models.CharField(max_length=20, blank=True)
+    color = models.CharField(max_length=30, blank=True)
+    sku = models.CharField(max_length=100, blank=True)
+    # Units that can still be sold: checkouts take from it, expired reservations give back
+    stock = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.product_id} {self.size}/{self.color}: {self.stock}"
+    
+    class Meta:
+        unique_together = ('product', 'size', 'color')
+
+class CatalogCounter(models.Model):
+    """A catalog version (see store.catalog), kept in the database so every worker process shares it"""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField()
+    # Unix time of the last bump, the catalog's Last-Modified
+    changed_at = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
@@ -107,12 +176,29 @@ class Order(models.Model):
     shipping_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     tax = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Idempotency-Key of the /api/checkout/ request that placed the order: a retry
+    # with the same key gets this order back instead of placing another
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True)
+    # SHA-256 of that request's body: reusing the key for a different cart is refused
+    request_fingerprint = models.CharField(max_length=64, blank=True, default='')
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='store_order_user_idempotency_key'),
+        ]
+        indexes = [
+            # A user's order history, newest first (OrderViewSet)
+            models.Index(fields=['user', 'created_at', 'id'], name='store_order_user_created_idx'),
+            # Unpaid orders past the stock reservation window (store.inventory.expired_orders)
+            models.Index(fields=['status', 'created_at', 'id'], name='store_order_status_created_idx'),
+        ]
     
     def __str__(self):
         return f"Order {self.id} - {self.user.username}"
     
     @property
     def total_price(self):
+        # From the lines' snapshotted prices: uses prefetch_related('items') when there is one
         return sum(item.total_price for item in self.items.all())
 
 class OrderItem(models.Model):
@@ -122,13 +208,19 @@ class OrderItem(models.Model):
     size = models.CharField(max_length=20, blank=True)
     color = models.CharField(max_length=30, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # <-- Set default=0
+    # Snapshot of the product at purchase, with `price` as the unit price paid: order
+    # history reads these instead of the live product, which may have changed since
+    product_name = models.CharField(max_length=200, blank=True)
+    product_image = models.CharField(max_length=255, blank=True)
+    # The variant whose stock this line reserved, None for products that don't track stock
+    variant = models.ForeignKey(ProductVariant, on_delete=models.SET_NULL, null=True, blank=True, related_name='order_items')
 
     def __str__(self):
-        return f"{self.product.name} x {self.quantity}"
+        return f"{self.product_name} x {self.quantity}"
     
     @property
     def total_price(self):
-        return self.product.price * self.quantity
+        return self.price * self.quantity
 
 class Review(models.Model):
     RATING_CHOICES = (
@@ -150,9 +242,27 @@ class Review(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ('user', 'product')  # One review per product per user
+        indexes = [
+            # A product's reviews, newest first
+            models.Index(fields=['product', 'created_at'], name='store_review_product_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username}'s review for {self.product.name}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the product aggregates currently count for this review
+        if 'product_id' in field_names and 'rating' in field_names:
+            instance._loaded_rating = (instance.product_id, instance.rating)
+        return instance
+    
+    def save(self, *args, **kwargs):
+        # The post_save handler updates the product's rating aggregates, so both
+        # writes have to land in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
 class ReviewImage(models.Model):
     review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name='images')
@@ -188,6 +298,9 @@ class WishlistItem(models.Model):
     class Meta:
         unique_together = ('user', 'product') # A user can add a product to wishlist only once
         ordering = ['-added_at']
+        indexes = [
+            models.Index(fields=['user', 'added_at'], name='store_wishlist_user_added_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s wishlist: {self.product.name}"
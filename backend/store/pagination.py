@@ -1,12 +1,67 @@
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.lookups import Exact, GreaterThan, GreaterThanOrEqual, LessThan, LessThanOrEqual
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
 class CustomPagination(PageNumberPagination):
+    """
+    Page-number pagination, plus an opt-in keyset mode for infinite scroll.
+
+    Sending ?cursor= (empty for the first page) switches to keyset pagination:
+    rows are fetched with a WHERE on the sort key instead of OFFSET and no
+    COUNT(*) is run, so every page costs the same no matter how deep it is.
+    """
     page_size = 12
     page_size_query_param = 'limit'
     max_page_size = 48
-    
+    cursor_query_param = 'cursor'
+    # Subclasses set this to page by keyset whether or not ?cursor= is sent
+    keyset_only = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Keyset mode needs a queryset to seek in; plain lists always use page numbers
+        self.keyset = (
+            (self.keyset_only or self.cursor_query_param in request.query_params) and hasattr(queryset, 'query')
+        )
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        self.request = request
+        self.ordering = keyset_ordering(queryset)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            position = decode_cursor(cursor, self.ordering)
+            queryset = queryset.filter(keyset_filter(queryset, self.ordering, position))
+
+        # One extra row tells us whether there is a next page without counting
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page_rows = rows[:page_size]
+        return self.page_rows
+
     def get_paginated_response(self, data):
+        if self.keyset:
+            next_cursor = None
+            if self.has_next:
+                next_cursor = encode_cursor(self.page_rows[-1], self.ordering)
+            return Response({
+                'results': data,
+                'next_cursor': next_cursor,
+                'has_next': self.has_next,
+            })
+
         return Response({
             'count': self.page.paginator.count,
             'total_pages': self.page.paginator.num_pages,
@@ -14,4 +69,96 @@ class CustomPagination(PageNumberPagination):
             'results': data,
             'has_next': self.page.has_next(),
             'has_previous': self.page.has_previous(),
-        })
\ No newline at end of file
+        })
+
+
+def keyset_ordering(queryset):
+    """The queryset's ordering with the primary key appended as a tie-breaker"""
+    ordering = [
+        field for field in (queryset.query.order_by or queryset.model._meta.ordering)
+        if isinstance(field, str) and field != '?'
+    ]
+    if not ordering:
+        return ['-id']
+    if 'id' not in [_field_name(field) for field in ordering]:
+        descending = ordering[-1].startswith('-')
+        ordering.append('-id' if descending else 'id')
+    return ordering
+
+
+def _field_name(field):
+    name = field.lstrip('-')
+    return 'id' if name == 'pk' else name
+
+
+def encode_cursor(row, ordering):
+    values = []
+    for field in ordering:
+        name = _field_name(field)
+        # Model instances or values() rows
+        value = row[name] if isinstance(row, dict) else getattr(row, name)
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+    payload = json.dumps({'o': ordering, 'v': values}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ordering):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = list(payload['v'])
+        issued_for = payload['o']
+    except (ValueError, KeyError, TypeError):
+        raise NotFound('Invalid cursor.')
+    # A cursor is only meaningful for the sort order it was issued for
+    if issued_for != ordering or len(values) != len(ordering):
+        raise NotFound('Cursor does not match the requested ordering.')
+    return values
+
+
+def keyset_filter(queryset, ordering, values):
+    """
+    Rows strictly after `values` in `ordering`, e.g. for ('-price', '-id'):
+    price <= p AND (price < p OR (price = p AND id < i))
+
+    The redundant leading bound lets SQLite seek the (price, id) index instead
+    of evaluating the OR over every row. Ordering keys that are extra() selects
+    rather than model fields (search_rank) are compared as floats on their SQL.
+    """
+    parsed = []
+    for field, value in zip(ordering, values):
+        name = _field_name(field)
+        try:
+            if name in queryset.query.extra:
+                sql, params = queryset.query.extra[name]
+                key, value = RawSQL(sql, params, output_field=FloatField()), float(value)
+            else:
+                key, value = name, queryset.model._meta.get_field(name).to_python(value)
+        except (FieldDoesNotExist, ValidationError, ValueError, TypeError):
+            raise NotFound('Invalid cursor.')
+        parsed.append((key, field.startswith('-'), value))
+
+    condition = Q()
+    for index, (key, descending, value) in enumerate(parsed):
+        step = _compare(key, LessThan if descending else GreaterThan, value)
+        for earlier_key, _, earlier_value in parsed[:index]:
+            step &= _compare(earlier_key, Exact, earlier_value)
+        condition |= step
+
+    first_key, first_descending, first_value = parsed[0]
+    return _compare(first_key, LessThanOrEqual if first_descending else GreaterThanOrEqual, first_value) & condition
+
+
+def _compare(key, lookup, value):
+    """Q(key__<lookup>=value) for a field name, or the lookup itself for an SQL expression"""
+    if isinstance(key, str):
+        return Q(**{f'{key}__{lookup.lookup_name}': value})
+    return Q(lookup(key, value))
+
+
+class OrderHistoryPagination(CustomPagination):
+    """
+    Keyset pages of a user's orders, newest first: each page is one seek on
+    store_order_user_created_idx, with no COUNT(*) however many orders there are.
+    """
+    keyset_only = True
@@ -0,0 +1,149 @@
+"""Cart pricing.
+
+One engine prices carts for the /api/cart/quote/ endpoint, for order creation
+and for Stripe payment intents, so the three can't disagree. Amounts are
+Decimal throughout: a line's unit price is the product's sale_price when it
+has one, else its price; shipping comes from the destination country's zone
+(a flat rate, free above a subtotal) and tax from the country's rate on the
+subtotal. SHIPPING_ZONES and TAX_RATES are compiled once into per-country
+lookup tables, so pricing a cart is one IN query for its products and a few
+dict lookups.
+
+Quotes for the same cart are memoized in the shared cache for
+CART_QUOTE_CACHE_SECONDS under the catalog version (store.catalog), so a
+price change is never quoted stale.
+"""
+import hashlib
+import threading
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .catalog import catalog_version
+from .models import Product
+
+CENT = Decimal('0.01')
+CURRENCY = 'usd'
+# Key for the zone or tax rate of countries not listed anywhere else
+ANY_COUNTRY = '*'
+QUOTE_CACHE_KEY = 'store:cart-quote:{}:{}'
+DEFAULT_QUOTE_CACHE_SECONDS = 60
+
+DEFAULT_SHIPPING_ZONES = {
+    'domestic': {'countries': ['US'], 'rate': '10.00', 'free_over': '100.00'},
+    'international': {'countries': [ANY_COUNTRY], 'rate': '25.00', 'free_over': '250.00'},
+}
+DEFAULT_TAX_RATES = {'US': '0.08', ANY_COUNTRY: '0'}
+
+
+def unit_price(product):
+    return product.sale_price if product.sale_price else product.price
+
+
+def load_products(product_ids):
+    """{id: product} with only what pricing and order line snapshots need, in one query"""
+    return Product.objects.only('id', 'name', 'image', 'price', 'sale_price').in_bulk(set(product_ids))
+
+
+class PricingRules:
+    """SHIPPING_ZONES and TAX_RATES as per-country lookup tables, recompiled when the settings change"""
+
+    def __init__(self):
+        self.source = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        source = (
+            getattr(settings, 'SHIPPING_ZONES', DEFAULT_SHIPPING_ZONES),
+            getattr(settings, 'TAX_RATES', DEFAULT_TAX_RATES),
+        )
+        if source != self.source:
+            with self.lock:
+                if source != self.source:
+                    self.compile(*source)
+                    self.source = source
+        return self
+
+    def compile(self, zones, tax_rates):
+        self.zones = {}
+        for name, zone in zones.items():
+            free_over = zone.get('free_over')
+            rule = (name, Decimal(zone['rate']), Decimal(free_over) if free_over is not None else None)
+            for country in zone['countries']:
+                self.zones[country.upper()] = rule
+        self.tax_rates = {country.upper(): Decimal(rate) for country, rate in tax_rates.items()}
+        # Part of the quote cache key, so changed rules are never answered from old quotes
+        tables = repr((sorted(self.zones.items()), sorted(self.tax_rates.items())))
+        self.digest = hashlib.sha1(tables.encode()).hexdigest()[:12]
+
+    def shipping(self, country, subtotal):
+        """(zone name, shipping cost) for a cart with this subtotal going to `country`"""
+        name, rate, free_over = self.zones.get(country) or self.zones.get(ANY_COUNTRY) or ('', Decimal('0'), None)
+        if not subtotal or (free_over is not None and subtotal > free_over):
+            return name, Decimal('0.00')
+        return name, rate
+
+    def tax(self, country, amount):
+        rate = self.tax_rates.get(country, self.tax_rates.get(ANY_COUNTRY, Decimal('0')))
+        return (amount * rate).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+pricing_rules = PricingRules()
+
+
+def price_lines(lines, products, country=''):
+    """
+    Price [{'product_id', 'quantity'}] lines against loaded `products` ({id: product}).
+    Lines of products that aren't there are left out and listed under 'missing'.
+    """
+    rules = pricing_rules.get()
+    country = (country or '').strip().upper()
+    priced, missing, subtotal = [], [], Decimal('0')
+    for line in lines:
+        product = products.get(line['product_id'])
+        if product is None:
+            missing.append(line['product_id'])
+            continue
+        price = unit_price(product)
+        line_total = price * line['quantity']
+        priced.append({
+            'product_id': product.pk, 'quantity': line['quantity'],
+            'unit_price': price, 'line_total': line_total,
+        })
+        subtotal += line_total
+    zone, shipping = rules.shipping(country, subtotal)
+    tax = rules.tax(country, subtotal)
+    return {
+        'lines': priced, 'missing': sorted(set(missing)),
+        'subtotal': subtotal, 'shipping': shipping, 'tax': tax, 'total': subtotal + shipping + tax,
+        'currency': CURRENCY, 'country': country, 'shipping_zone': zone,
+    }
+
+
+def quote_cart(lines, country=''):
+    """price_lines() for a cart loaded in one query, memoized for identical carts (lines come back by product id)"""
+    rules = pricing_rules.get()
+    cart = sorted((line['product_id'], line['quantity']) for line in lines)
+    digest = hashlib.sha1(repr((cart, (country or '').strip().upper(), rules.digest)).encode()).hexdigest()
+    key = QUOTE_CACHE_KEY.format(catalog_version(), digest)
+    quote = cache.get(key)
+    if quote is None:
+        products = load_products(product_id for product_id, _ in cart)
+        quote = price_lines([{'product_id': pk, 'quantity': quantity} for pk, quantity in cart], products, country)
+        cache.set(key, quote, timeout=getattr(settings, 'CART_QUOTE_CACHE_SECONDS', DEFAULT_QUOTE_CACHE_SECONDS))
+    return quote
+
+
+def quote_data(quote):
+    """A quote with its amounts as 2-decimal strings, for JSON responses"""
+    def amount(value):
+        return str(value.quantize(CENT))
+    return {
+        **quote,
+        'lines': [
+            {**line, 'unit_price': amount(line['unit_price']), 'line_total': amount(line['line_total'])}
+            for line in quote['lines']
+        ],
+        **{key: amount(quote[key]) for key in ('subtotal', 'shipping', 'tax', 'total')},
+    }
@@ -0,0 +1,91 @@
+"""Everything the product detail page needs in one response.
+
+The public part (product, gallery, rating summary, first page of reviews,
+related products) is the same for every visitor and is cached under the
+product slug, the catalog version and the site's base URL (image URLs are
+absolute), so any product/review/category change makes a fresh one and each
+host or scheme gets its own URLs. The viewer part (wishlist state) is computed per request.
+
+Query budget: 4 queries to build the public part (product + category, gallery,
+reviews, related products), 0 when cached; 1 for the viewer part.
+"""
+from django.core.cache import cache
+
+from .catalog import catalog_version
+from .fieldsets import Fieldset
+from .models import Product, ProductImage, Review, WishlistItem
+from .serializers import ProductSerializer, ReviewSerializer
+
+REVIEWS_PAGE_SIZE = 5
+RELATED_LIMIT = 4
+CACHE_TIMEOUT = 10 * 60
+CACHE_KEY = 'store:product-bundle:{slug}:{version}:{base_url}'
+
+
+def build_public_bundle(product, request=None):
+    context = {'request': request}
+    # Always the full representation: the cached bundle is shared by every ?fields= variant
+    full = Fieldset()
+
+    gallery = [
+        {
+            'id': image.id,
+            'image': request.build_absolute_uri(image.image.url) if request else image.image.url,
+            'alt_text': image.alt_text,
+            'is_feature': image.is_feature,
+        }
+        for image in ProductImage.objects.filter(product=product).order_by('display_order', 'created_at', 'id')
+    ]
+
+    # One extra row says whether there are more reviews, without a COUNT
+    reviews = list(
+        Review.objects.filter(product=product).select_related('user')
+        .order_by('-created_at', '-id')[:REVIEWS_PAGE_SIZE + 1]
+    )
+
+    related = (
+        Product.objects.filter(category_id=product.category_id).exclude(pk=product.pk)
+        .select_related('category').order_by('-created_at', '-id')[:RELATED_LIMIT]
+    )
+
+    return {
+        'product': ProductSerializer(product, context=context, fieldset=full).data,
+        'images': gallery,
+        'rating_summary': {
+            'average_rating': float(product.average_rating),
+            'review_count': product.review_count,
+            'histogram': product.rating_histogram,
+        },
+        'reviews': {
+            'results': ReviewSerializer(reviews[:REVIEWS_PAGE_SIZE], many=True, context=context, fieldset=full).data,
+            'count': product.review_count,
+            'has_next': len(reviews) > REVIEWS_PAGE_SIZE,
+        },
+        'related_products': ProductSerializer(related, many=True, context=context, fieldset=full).data,
+    }
+
+
+def get_public_bundle(slug, request=None):
+    """The cached public bundle for `slug`, or None if there is no such product"""
+    base_url = request.build_absolute_uri('/') if request is not None else ''
+    key = CACHE_KEY.format(slug=slug, version=catalog_version(), base_url=base_url)
+    bundle = cache.get(key)
+    if bundle is None:
+        product = Product.objects.select_related('category').filter(slug=slug).first()
+        if product is None:
+            return None
+        bundle = build_public_bundle(product, request)
+        cache.set(key, bundle, timeout=CACHE_TIMEOUT)
+    return bundle
+
+
+def get_viewer_state(product_id, user):
+    if not user or not user.is_authenticated:
+        return None
+    wishlist_item_id = (
+        WishlistItem.objects.filter(user=user, product_id=product_id).values_list('id', flat=True).first()
+    )
+    return {
+        'in_wishlist': wishlist_item_id is not None,
+        'wishlist_item_id': wishlist_item_id,
+    }
@@ -0,0 +1,219 @@
+"""Opt-in request profiling for staff.
+
+A staff user (admin session or API token) adds `X-Profile: 1` or `?profile=1`
+to any request and it runs under cProfile; `memory` instead of `1` also traces
+allocations with tracemalloc. The profile (a pstats file), the SQL the request
+ran and the top allocations are written to PROFILE_DIR, which keeps the last
+PROFILE_RING_SIZE captures. The response carries the capture id in
+X-Profile-Id, and /admin/profiles/ lists the captures.
+
+Other requests only pay for the flag check. Only one request is profiled at a
+time per process; a concurrent request asking for it runs normally and gets
+`X-Profile-Id: busy`.
+"""
+import cProfile
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from .query_budget import call_site, ignore_in_call_sites
+
+ignore_in_call_sites(__file__)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = 'profile'
+MEMORY = 'memory'
+MAX_QUERIES = 1000
+TOP_ALLOCATIONS = 30
+
+_CAPTURE_ID = re.compile(r'^\d{8}-\d{6}-[0-9a-f]{8}$')
+_lock = threading.Lock()
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def requested_mode(request):
+    """'cpu', 'memory' or None for a request"""
+    flag = request.META.get(PROFILE_HEADER) or request.GET.get(PROFILE_PARAM)
+    if not flag or flag.lower() in ('0', 'false', 'off'):
+        return None
+    return MEMORY if flag.lower() == MEMORY else 'cpu'
+
+
+def staff_user(request):
+    """The staff user behind the session or API token, or None"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        auth = get_authorization_header(request).split()
+        if len(auth) != 2 or auth[0].lower() != b'token':
+            return None
+        try:
+            user, _ = TokenAuthentication().authenticate_credentials(auth[1].decode())
+        except (AuthenticationFailed, UnicodeError):
+            return None
+    return user if user.is_staff else None
+
+
+class SQLTrace:
+    """connection.execute_wrapper() hook keeping the SQL, parameters, time and call site of each query"""
+
+    def __init__(self):
+        self.queries = []
+        self.dropped = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append({
+                    'sql': sql,
+                    'params': repr(params)[:200],
+                    'ms': round((time.perf_counter() - started) * 1000, 3),
+                    'site': call_site(),
+                })
+            else:
+                self.dropped += 1
+
+
+def save_capture(profiler, meta):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    capture_id = time.strftime('%Y%m%d-%H%M%S') + '-' + uuid.uuid4().hex[:8]
+    profiler.dump_stats(directory / f'{capture_id}.prof')
+    with open(directory / f'{capture_id}.json', 'w') as f:
+        json.dump(meta, f)
+    prune(directory)
+    return capture_id
+
+
+def _oldest_first(directory):
+    paths = []
+    for path in directory.glob('*.json'):
+        try:
+            if _CAPTURE_ID.match(path.stem):
+                paths.append((path.stat().st_mtime_ns, path))
+        except FileNotFoundError:
+            pass  # pruned by another worker
+    return [path for _, path in sorted(paths)]
+
+
+def prune(directory):
+    """Keep the newest PROFILE_RING_SIZE captures"""
+    keep = getattr(settings, 'PROFILE_RING_SIZE', 50)
+    captures = [path.stem for path in _oldest_first(directory)]
+    for capture_id in captures[:-keep] if keep else captures:
+        for suffix in ('.json', '.prof'):
+            try:
+                os.remove(directory / f'{capture_id}{suffix}')
+            except FileNotFoundError:
+                pass
+
+
+def list_captures():
+    """Capture metadata, newest first"""
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    captures = []
+    for path in reversed(_oldest_first(directory)):
+        meta = load_capture(path.stem)
+        if meta is not None:
+            captures.append(meta)
+    return captures
+
+
+def load_capture(capture_id):
+    if not _CAPTURE_ID.match(capture_id):
+        return None
+    try:
+        with open(profile_dir() / f'{capture_id}.json') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    meta['id'] = capture_id
+    return meta
+
+
+def capture_path(capture_id):
+    """The pstats file of a capture, or None"""
+    if not _CAPTURE_ID.match(capture_id):
+        return None
+    path = profile_dir() / f'{capture_id}.prof'
+    return path if path.is_file() else None
+
+
+class ProfilingMiddleware:
+    """Goes after AuthenticationMiddleware, so admin sessions count as staff"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = requested_mode(request) if getattr(settings, 'PROFILING_ENABLED', True) else None
+        user = staff_user(request) if mode is not None else None
+        if user is None:
+            return self.get_response(request)
+        if not _lock.acquire(blocking=False):
+            response = self.get_response(request)
+            response['X-Profile-Id'] = 'busy'
+            return response
+        try:
+            return self.profile(request, mode, user)
+        finally:
+            _lock.release()
+
+    def profile(self, request, mode, user):
+        trace = SQLTrace()
+        profiler = cProfile.Profile()
+        started_tracemalloc = mode == MEMORY and not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(trace):
+                profiler.enable()
+                try:
+                    # Innermost middleware: this includes rendering the response
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+            elapsed = time.perf_counter() - started
+            allocations = []
+            if mode == MEMORY:
+                snapshot = tracemalloc.take_snapshot()
+                allocations = [
+                    {'where': str(stat.traceback), 'kib': round(stat.size / 1024, 1), 'count': stat.count}
+                    for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+                ]
+        finally:
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+        capture_id = save_capture(profiler, {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'user': user.get_username(),
+            'status': response.status_code,
+            'mode': mode,
+            'ms': round(elapsed * 1000, 1),
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'queries': trace.queries,
+            'dropped_queries': trace.dropped,
+            'allocations': allocations,
+        })
+        response['X-Profile-Id'] = capture_id
+        return response
@@ -0,0 +1,176 @@
+"""Per-request SQL query budgets and N+1 detection.
+
+QueryBudgetMiddleware records every query a request runs, with its shape (the
+SQL template, IN lists collapsed) and the call site in our code that issued it.
+After the response it checks two things:
+
+  * the budget declared for the view: viewsets list them per action,
+        query_budgets = {'list': 3, 'retrieve': 2}
+  * N+1 patterns: the same query shape issued QUERY_BUDGET_REPEAT_THRESHOLD or
+    more times from the same call site.
+
+Problems are logged to the 'store.queries' logger, or raised as
+QueryBudgetExceeded when QUERY_BUDGET_RAISE is set (the test suite does). The
+middleware is on when QUERY_BUDGET_ENABLED is (defaults to DEBUG); recording
+walks the stack for each query, which is fine for development but not free.
+
+expect_queries() applies the same checks around any block of code in tests.
+"""
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('store.queries')
+
+DEFAULT_REPEAT_THRESHOLD = 5
+
+RecordedQuery = namedtuple('RecordedQuery', 'shape site duration')
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+# Modules with execute wrappers; their frames are never a query's call site
+_WRAPPER_FILES = {os.path.abspath(__file__)}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_shape(sql):
+    """The SQL template with IN lists collapsed, so `IN (%s, %s)` and `IN (%s)` match"""
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+def _describe(frame, project):
+    filename = frame.f_code.co_filename
+    if 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    elif filename.startswith(project):
+        filename = os.path.relpath(filename, project)
+    return f'{filename}:{frame.f_lineno} in {frame.f_code.co_name}'
+
+
+def ignore_in_call_sites(filename):
+    """Leave the frames of `filename` (a module with an execute wrapper) out of call sites"""
+    _WRAPPER_FILES.add(os.path.abspath(filename))
+
+
+def call_site():
+    """
+    Where a query came from: the innermost frame outside the ORM and the execute
+    wrappers, plus the innermost frame of project code when that is further out,
+    e.g. "rest_framework/fields.py:97 in get_attribute (via store/views.py:120 in list)"
+    """
+    project = str(settings.BASE_DIR)
+    trigger = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename not in _WRAPPER_FILES and os.sep.join(('django', 'db', '')) not in filename:
+            in_project = filename.startswith(project) and 'site-packages' not in filename
+            if trigger is None:
+                trigger = _describe(frame, project)
+                if in_project:
+                    return trigger
+            elif in_project:
+                return f'{trigger} (via {_describe(frame, project)})'
+        frame = frame.f_back
+    return trigger or '<unknown>'
+
+
+class QueryRecorder:
+    """connection.execute_wrapper() hook that records query shapes and call sites"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(RecordedQuery(query_shape(sql), call_site(), time.perf_counter() - started))
+
+    def __len__(self):
+        return len(self.queries)
+
+    def repeated(self, threshold=None):
+        """[(shape, site, count)] for shapes issued `threshold` or more times from one call site"""
+        if threshold is None:
+            threshold = getattr(settings, 'QUERY_BUDGET_REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD)
+        counts = Counter((query.shape, query.site) for query in self.queries)
+        return [(shape, site, count) for (shape, site), count in counts.most_common() if count >= threshold]
+
+    def problems(self, budget=None, exact=None, threshold=None):
+        found = []
+        if exact is not None and len(self) != exact:
+            found.append(f'{len(self)} queries, expected exactly {exact}')
+        if budget is not None and len(self) > budget:
+            found.append(f'{len(self)} queries, over the budget of {budget}')
+        for shape, site, count in self.repeated(threshold):
+            found.append(f'possible N+1: {count}x from {site}: {shape[:200]}')
+        return found
+
+    def report(self):
+        lines = [f'{len(self)} queries:']
+        for number, query in enumerate(self.queries, 1):
+            lines.append(f'  {number}. [{query.duration * 1000:.1f} ms] {query.site}: {query.shape[:200]}')
+        return '\n'.join(lines)
+
+
+def budget_for(view_func, request):
+    """(action name, declared budget or None) for a resolved view"""
+    view_class = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None)
+    action = actions.get(request.method.lower()) if actions else request.method.lower()
+    budgets = getattr(view_class, 'query_budgets', None) or {}
+    return action, budgets.get(action)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', settings.DEBUG):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        action, budget = getattr(request, '_query_budget', (None, None))
+        problems = recorder.problems(budget=budget)
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(len(recorder))
+        if problems:
+            label = f'{request.method} {request.path}' + (f' ({action})' if action else '')
+            message = f'{label}: ' + '; '.join(problems) + '\n' + recorder.report()
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = budget_for(view_func, request)
+
+
+@contextmanager
+def expect_queries(exact=None, budget=None, threshold=None):
+    """
+    Test helper: fail if the block runs a different number of queries than
+    `exact`, more than `budget`, or repeats a query shape from one call site
+    `threshold` times (QUERY_BUDGET_REPEAT_THRESHOLD by default).
+    """
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        yield recorder
+    problems = recorder.problems(budget=budget, exact=exact, threshold=threshold)
+    if problems:
+        raise AssertionError('; '.join(problems) + '\n' + recorder.report())
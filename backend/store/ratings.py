@@ -0,0 +1,102 @@
+"""Stored rating aggregates for products.
+
+Product.average_rating, review_count and the rating_<star>_count histogram are
+denormalized from Review rows so product listings never have to touch the
+reviews table. Review writes shift them by a delta (see store.signals) and
+rebuild_rating_aggregates() recomputes everything from scratch.
+"""
+from collections import Counter
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, FloatField, Q, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, Now, NullIf, Round
+
+from .models import Product, Review
+
+STARS = range(1, 6)
+
+
+def histogram_field(star):
+    return f'rating_{star}_count'
+
+
+def summarize(counts):
+    """Return (review_count, average_rating) for a {star: count} mapping."""
+    review_count = sum(counts.get(star, 0) for star in STARS)
+    if not review_count:
+        return 0, Decimal('0')
+    total = sum(star * counts.get(star, 0) for star in STARS)
+    average = (Decimal(total) / review_count).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    return review_count, average
+
+
+def apply_rating_delta(product_id, added=(), removed=()):
+    """
+    Shift a product's aggregates by the given ratings with a single UPDATE.
+
+    Every SET expression is computed from the row's current values, so concurrent
+    review writes never read-then-write stale counts.
+    """
+    delta = Counter(added)
+    delta.subtract(removed)
+    if not any(delta.values()):
+        return
+
+    counts = {}
+    for star in STARS:
+        change = delta.get(star, 0)
+        expression = F(histogram_field(star)) + change
+        if change < 0:
+            # Never let drift push a column below zero; rebuild fixes it properly
+            expression = Greatest(expression, Value(0))
+        counts[star] = expression
+
+    review_count = sum(counts.values(), Value(0))
+    weighted_total = sum((star * counts[star] for star in STARS), Value(0))
+    # NULLIF turns "no reviews left" into a NULL quotient, which COALESCE maps to 0
+    average = Coalesce(
+        Round(Cast(weighted_total, FloatField()) / NullIf(Cast(review_count, FloatField()), Value(0.0)), 2),
+        Value(0.0),
+        output_field=DecimalField(max_digits=3, decimal_places=2),
+    )
+
+    Product.objects.filter(pk=product_id).update(
+        review_count=review_count,
+        average_rating=average,
+        # The product's representation changed, so its ETag/fragment keys must too
+        updated_at=Now(),
+        **{histogram_field(star): counts[star] for star in STARS},
+    )
+
+
+def rebuild_rating_aggregates(batch_size=1000):
+    """Recompute every product's aggregates from the reviews table. Returns products with reviews."""
+    rows = (
+        Review.objects.order_by()
+        .values('product_id')
+        .annotate(**{histogram_field(star): Count('id', filter=Q(rating=star)) for star in STARS})
+    )
+    fields = ['review_count', 'average_rating'] + [histogram_field(star) for star in STARS]
+    updated = 0
+
+    with transaction.atomic():
+        Product.objects.update(**{field: 0 for field in fields})
+
+        batch = []
+        for row in rows.iterator():
+            counts = {star: row[histogram_field(star)] for star in STARS}
+            review_count, average = summarize(counts)
+            product = Product(pk=row['product_id'], review_count=review_count, average_rating=average)
+            for star in STARS:
+                setattr(product, histogram_field(star), counts[star])
+            batch.append(product)
+            if len(batch) >= batch_size:
+                Product.objects.bulk_update(batch, fields)
+                updated += len(batch)
+                batch = []
+        if batch:
+            Product.objects.bulk_update(batch, fields)
+            updated += len(batch)
+
+    return updated
@@ -0,0 +1,128 @@
+"""SQLite FTS5 full-text index over products.
+
+store_product_fts holds one row per product (rowid = product id) with the name,
+description and category/subcategory names. It is kept in step by the signal
+handlers in store.signals and can be rebuilt with `manage.py rebuild_search_index`.
+On other database backends search falls back to icontains filtering.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+FTS_TABLE = 'store_product_fts'
+
+# bm25() weights per FTS column: name, description, category
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+CATEGORY_WEIGHT = 3.0
+
+CREATE_TABLE_SQL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description, category,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+# Category text is pulled in SQL so indexing never needs extra ORM queries
+_INDEX_SELECT_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, name, description, category)
+    SELECT p.id, p.name, p.description, c.name || ' ' || COALESCE(s.name, '')
+    FROM store_product p
+    JOIN store_category c ON c.id = p.category_id
+    LEFT JOIN store_subcategory s ON s.id = p.subcategory_id
+"""
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """
+    Turn free user input into a safe FTS5 query: every word becomes a quoted
+    prefix term ("shir"* matches shirt, shirts...) and all terms must match.
+    """
+    terms = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_products(queryset, text):
+    """
+    Restrict `queryset` to products matching `text`, ranked by BM25 with name
+    matches weighted above category and description matches.
+
+    Each row gets `search_rank` (lower is better), `search_highlight` (the name
+    with <mark> tags) and `search_snippet` (a description excerpt).
+    """
+    match = build_match_query(text)
+    if not match:
+        return queryset.none()
+
+    if not fts_available():
+        return queryset.filter(
+            Q(name__icontains=text) |
+            Q(description__icontains=text) |
+            Q(category__name__icontains=text)
+        )
+
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = store_product.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+        select={
+            'search_rank': f'bm25({FTS_TABLE}, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT}, {CATEGORY_WEIGHT})',
+            'search_highlight': f"highlight({FTS_TABLE}, 0, '<mark>', '</mark>')",
+            'search_snippet': f"snippet({FTS_TABLE}, 1, '<mark>', '</mark>', '…', 16)",
+        },
+    ).order_by('search_rank', '-id')
+
+
+def index_products(category_id=None, subcategory_id=None, product_ids=None):
+    """(Re)index the selected products, or every product when no filter is given"""
+    if not fts_available():
+        return
+
+    conditions, params = [], []
+    if product_ids is not None:
+        if not product_ids:
+            return
+        conditions.append(f"p.id IN ({', '.join(['%s'] * len(product_ids))})")
+        params.extend(product_ids)
+    if category_id is not None:
+        conditions.append('p.category_id = %s')
+        params.append(category_id)
+    if subcategory_id is not None:
+        conditions.append('p.subcategory_id = %s')
+        params.append(subcategory_id)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    with connection.cursor() as cursor:
+        if conditions:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT p.id FROM store_product p{where})',
+                params,
+            )
+        else:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(_INDEX_SELECT_SQL + where, params)
+
+
+def unindex_product(product_id):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+
+def rebuild_search_index():
+    """Drop and refill the whole index in one INSERT ... SELECT. Returns the row count."""
+    if not fts_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_TABLE_SQL)
+        index_products()
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
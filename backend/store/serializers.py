@@ -1,5 +1,12 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
 from rest_framework import serializers, viewsets
 from .models import Category, SubCategory, Product, Order, OrderItem, Review, ProductImage, ShippingAddress, WishlistItem, ReviewImage, UserProfile, Address
+from .attributes import parse_sizes
+from .countries import country_code
+from .fieldsets import Fieldset, SparseFieldsetMixin
+from .inventory import load_variants, match_variant, reserve
+from .pricing import load_products, price_lines
 
 # Serializers
 class SubCategorySerializer(serializers.ModelSerializer):
@@ -19,53 +26,21 @@ class ProductImageSerializer(serializers.ModelSerializer):
         model = ProductImage
         fields = ['id', 'image']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     average_rating = serializers.FloatField(read_only=True)
     review_count = serializers.IntegerField(read_only=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
     # Add category name for easier debugging
     category_name = serializers.SerializerMethodField()
     
     def get_category_name(self, obj):
         return obj.category.name if obj.category else None
     
-    # Add robust error handling to the to_representation method
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        
-        # Handle sizes field with better error handling
-        try:
-            # Ensure sizes is always an array
-            if 'sizes' in data:
-                if data['sizes'] is None:
-                    data['sizes'] = []  # Handle None values
-                elif isinstance(data['sizes'], str):
-                    # If sizes is stored as a string, convert to array
-                    if data['sizes'].strip():  # Check if string is not empty
-                        if (data['sizes'].strip().startswith('[') and 
-                            data['sizes'].strip().endswith(']')):
-                            try:
-                                # If it's already JSON formatted
-                                import json
-                                data['sizes'] = json.loads(data['sizes'])
-                            except Exception:
-                                # Fallback to comma splitting
-                                data['sizes'] = [size.strip() for size in data['sizes'].split(',')]
-                        else:
-                            # Simple comma splitting
-                            data['sizes'] = [size.strip() for size in data['sizes'].split(',')]
-                    else:
-                        data['sizes'] = []  # Handle empty strings
-                elif not isinstance(data['sizes'], list):
-                    # Convert any other type to a list with a single item
-                    data['sizes'] = [str(data['sizes'])]
-            else:
-                # If sizes field doesn't exist, add it as an empty array
-                data['sizes'] = []
-        except Exception as e:
-            # Fallback to empty array if any error occurs during conversion
-            print(f"Error processing sizes for product {instance.id if hasattr(instance, 'id') else 'unknown'}: {str(e)}")
-            data['sizes'] = []
-        
+        # Always a list, whichever format the sizes were stored in
+        if 'sizes' in data:
+            data['sizes'] = parse_sizes(instance.sizes)
         return data
     
     class Meta:
@@ -73,36 +48,188 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'slug', 'description', 'price', 'sale_price',
             'category', 'subcategory', 'in_stock', 'sizes', 'colors',
-            'image', 'featured', 'average_rating', 'review_count',
+            'image', 'featured', 'average_rating', 'review_count', 'rating_histogram',
             'created_at', 'updated_at', 'sku', 'category_name'
         ]
+        # Columns behind the non-model fields, for ?fields= column trimming
+        sparse_sources = {
+            'rating_histogram': [f'rating_{star}_count' for star in range(1, 6)],
+            'category_name': ['category__name'],
+        }
+
+class ProductListSerializer:
+    """
+    Read-only fast path for product list endpoints.
+    
+    Produces the same JSON as ProductSerializer but from `.values()` rows (see
+    `rows()`), with the category name joined in and none of the per-field
+    ModelSerializer machinery. Use it for grids; use ProductSerializer for writes
+    and single-product views. Honors ?fields= / ?omit= like the other serializers.
+    """
+    # Part of the product fragment cache key (store.fragments): bump when the output changes
+    VERSION = 1
+    
+    # Output field -> the values() columns it is rendered from, in ProductSerializer order
+    COLUMNS = {
+        'id': ('id',),
+        'name': ('name',),
+        'slug': ('slug',),
+        'description': ('description',),
+        'price': ('price',),
+        'sale_price': ('sale_price',),
+        'category': ('category_id',),
+        'subcategory': ('subcategory_id',),
+        'in_stock': ('in_stock',),
+        'sizes': ('sizes',),
+        'colors': ('colors',),
+        'image': ('image',),
+        'featured': ('featured',),
+        'average_rating': ('average_rating',),
+        'review_count': ('review_count',),
+        'rating_histogram': tuple(f'rating_{star}_count' for star in range(1, 6)),
+        'created_at': ('created_at',),
+        'updated_at': ('updated_at',),
+        'sku': ('sku',),
+        'category_name': ('category__name',),
+    }
+    
+    _decimal = serializers.DecimalField(max_digits=10, decimal_places=2)
+    _datetime = serializers.DateTimeField()
+    
+    def __init__(self, rows, context=None, fieldset=None):
+        self.rows_ = rows
+        self.context = context or {}
+        if fieldset is None:
+            fieldset = Fieldset.from_request(self.context.get('request'))
+        self.field_names = [name for name in self.COLUMNS if fieldset.includes(name)]
+    
+    @classmethod
+    def rows(cls, queryset, *extra, fieldset=None):
+        """
+        The queryset as the dict rows this serializer reads (plus any `extra`
+        columns), limited to the columns of the selected fields. The id and the
+        ordering columns are always kept for keyset cursors.
+        """
+        fieldset = fieldset or Fieldset()
+        columns = ['id']
+        for name, sources in cls.COLUMNS.items():
+            if fieldset.includes(name):
+                columns.extend(sources)
+        columns.extend(cls.ordering_columns(queryset, exclude=extra))
+        return queryset.values(*dict.fromkeys(columns), *extra)
+    
+    @staticmethod
+    def ordering_columns(queryset, exclude=()):
+        """The plain columns the queryset is ordered by"""
+        columns = []
+        for field in queryset.query.order_by:
+            if isinstance(field, str) and field.lstrip('-') not in exclude:
+                name = field.lstrip('-')
+                columns.append('id' if name == 'pk' else name)
+        return columns
+    
+    def renderers(self):
+        request = self.context.get('request')
+        storage = Product._meta.get_field('image').storage
+        decimal = self._decimal.to_representation
+        datetime = self._datetime.to_representation
+        
+        def image(row):
+            if not row['image']:
+                return None
+            url = storage.url(row['image'])
+            return request.build_absolute_uri(url) if request is not None else url
+        
+        def column(name):
+            return lambda row: row[name]
+        
+        return {
+            'id': column('id'),
+            'name': column('name'),
+            'slug': column('slug'),
+            'description': column('description'),
+            'price': lambda row: decimal(row['price']),
+            'sale_price': lambda row: None if row['sale_price'] is None else decimal(row['sale_price']),
+            'category': column('category_id'),
+            'subcategory': column('subcategory_id'),
+            'in_stock': column('in_stock'),
+            'sizes': lambda row: parse_sizes(row['sizes']),
+            'colors': column('colors'),
+            'image': image,
+            'featured': column('featured'),
+            'average_rating': lambda row: float(row['average_rating']),
+            'review_count': column('review_count'),
+            'rating_histogram': lambda row: {str(star): row[f'rating_{star}_count'] for star in range(1, 6)},
+            'created_at': lambda row: datetime(row['created_at']),
+            'updated_at': lambda row: datetime(row['updated_at']),
+            'sku': column('sku'),
+            'category_name': column('category__name'),
+        }
+    
+    @property
+    def data(self):
+        renderers = self.renderers()
+        selected = [(name, renderers[name]) for name in self.field_names]
+        return [{name: render(row) for name, render in selected} for row in self.rows_]
 
-class OrderItemSerializer(serializers.Serializer):
+class OrderItemSerializer(SparseFieldsetMixin, serializers.Serializer):
     product_id = serializers.IntegerField()
     quantity = serializers.IntegerField()
     size = serializers.CharField(allow_blank=True, required=False)
     color = serializers.CharField(allow_blank=True, required=False)
-    # Add these fields:
-    product_name = serializers.SerializerMethodField()
+    # From the line's purchase-time snapshot, so listing orders never touches the products
+    product_name = serializers.CharField(read_only=True)
     product_image = serializers.SerializerMethodField()
-    product_price = serializers.SerializerMethodField()
-
-    def get_product_name(self, obj):
-        return obj.product.name if obj.product else ""
+    product_price = serializers.DecimalField(source='price', max_digits=10, decimal_places=2, read_only=True)
 
     def get_product_image(self, obj):
-        return obj.product.image.url if obj.product and obj.product.image else ""
-
-    def get_product_price(self, obj):
-        return str(obj.product.price) if obj.product else ""
+        return default_storage.url(obj.product_image) if obj.product_image else ""
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
 
     class Meta:
         model = Order
         fields = '__all__'
-        read_only_fields = ['user']  # Make user read-only
+        # The amounts are priced from the catalog, never taken from the client
+        read_only_fields = ['user', 'subtotal', 'shipping_cost', 'tax', 'total', 'idempotency_key', 'request_fingerprint']
+
+    def validate_items(self, items):
+        """Check every line up front and load all the products with one IN query"""
+        if not items:
+            raise serializers.ValidationError("An order needs at least one item.")
+        lines = set()
+        for item in items:
+            if item['quantity'] < 1:
+                raise serializers.ValidationError(f"Quantity for product {item['product_id']} must be at least 1.")
+            line = (item['product_id'], item.get('size', ''), item.get('color', ''))
+            if line in lines:
+                raise serializers.ValidationError(
+                    f"Product {item['product_id']} appears twice with the same size and color; combine the quantities."
+                )
+            lines.add(line)
+
+        # Only what pricing and the line snapshots need
+        self._products = load_products(item['product_id'] for item in items)
+        missing = sorted({item['product_id'] for item in items} - self._products.keys())
+        if missing:
+            raise serializers.ValidationError(f"Unknown product ids: {', '.join(map(str, missing))}.")
+
+        # Resolve every line of a stock-tracking product to its variant (one more IN query)
+        variants = load_variants(self._products.keys())
+        for item in items:
+            try:
+                item['variant'] = match_variant(variants.get(item['product_id']), item.get('size'), item.get('color'))
+            except ValueError as error:
+                raise serializers.ValidationError(f"Product {item['product_id']}: {error}")
+        return items
+
+    def validate_shipping_country(self, value):
+        """Stored as the ISO code shipping zones and tax rates are keyed by"""
+        try:
+            return country_code(value)
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
 
     def create(self, validated_data):
         request = self.context.get('request')
@@ -120,34 +247,58 @@ class OrderSerializer(serializers.ModelSerializer):
             validated_data['shipping_postal_code'] = shipping_address_data.get('zip_code', '')
             validated_data['shipping_country'] = shipping_address_data.get('country', '')
 
-        # Set the user here!
-        validated_data['user'] = user
-
-        order = Order.objects.create(**validated_data)
-
-        subtotal = 0
-        for item_data in items_data:
-            product_id = item_data.get('product_id') or item_data.get('product')
-            if not product_id:
-                raise serializers.ValidationError("Each item must have a product_id.")
-            product = Product.objects.get(id=product_id)
-            price = product.sale_price if product.sale_price else product.price
-
-            OrderItem.objects.create(
-                order=order,
+        # Price every line in memory first (store.pricing, as quotes and payment intents are),
+        # so the write transaction is just the stock reservation and the two INSERTs
+        quote = price_lines(items_data, self._products, validated_data.get('shipping_country'))
+        items = []
+        for item_data, line in zip(items_data, quote['lines']):
+            product = self._products[item_data['product_id']]
+            items.append(OrderItem(
                 product=product,
                 quantity=item_data['quantity'],
                 size=item_data.get('size', ''),
                 color=item_data.get('color', ''),
-                price=price
+                price=line['unit_price'],
+                variant=item_data['variant'],
+                product_name=product.name,
+                product_image=product.image.name or '',
+            ))
+
+        validated_data['user'] = user
+        with transaction.atomic():
+            # Raises OutOfStock (409) before anything is written when a line can't be covered
+            reserve([(item.variant, item.quantity) for item in items if item.variant])
+            order = Order.objects.create(
+                **validated_data,
+                subtotal=quote['subtotal'], shipping_cost=quote['shipping'], tax=quote['tax'], total=quote['total'],
             )
-            subtotal += price * item_data['quantity']
+            for item in items:
+                item.order = order
+            OrderItem.objects.bulk_create(items)
+
+        # The response lists the items with their products: hand it these instead of re-reading them
+        prefetched = order.items.all()
+        prefetched._result_cache = items
+        prefetched._prefetch_done = True
+        order._prefetched_objects_cache = {'items': prefetched}
+        return order
+class CartLineSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=1000)
+
+
+class CartQuoteSerializer(serializers.Serializer):
+    """A cart to price with store.pricing (POST /api/cart/quote/, payment intents)"""
+    items = CartLineSerializer(many=True, allow_empty=False)
+    country = serializers.CharField(required=False, allow_blank=True, default='', max_length=100)
+
+    def validate_country(self, value):
+        try:
+            return country_code(value)
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
 
-        order.subtotal = subtotal
-        order.total = subtotal
-        order.save()
 
-        return order
 from django.contrib.auth.models import User
 from rest_framework import serializers
 
@@ -173,7 +324,7 @@ class ReviewImageSerializer(serializers.ModelSerializer):
         model = ReviewImage
         fields = ['id', 'image']
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     # user_name will be serialized for GET requests, but not expected in POST/PUT data.
     user_name = serializers.CharField(source='user.username', read_only=True)
     
@@ -205,7 +356,7 @@ class ShippingAddressSerializer(serializers.ModelSerializer):
                   'postal_code', 'country', 'is_default', 'created_at']
         read_only_fields = ['created_at']
 
-class WishlistItemSerializer(serializers.ModelSerializer):
+class WishlistItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True) # Product details for GET, read-only for input
     
     class Meta:
@@ -0,0 +1,137 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .attributes import format_sizes, sync_product_attributes
+from .catalog import mark_catalog_changed, mark_category_tree_changed
+from .inventory import sync_in_stock
+from .models import Category, Product, ProductImage, ProductVariant, Review, SubCategory
+from .ratings import apply_rating_delta
+from .search import index_products, unindex_product
+
+
+@receiver(pre_save, sender=Product)
+def normalize_sizes_on_product_save(sender, instance, **kwargs):
+    """Store sizes as 'S,M,L' whatever the writer sent (JSON arrays, list reprs, spaces), fixtures included"""
+    if instance.sizes:
+        instance.sizes = format_sizes(instance.sizes)
+
+
+@receiver(post_save, sender=Product)
+def sync_attributes_on_product_save(sender, instance, created, raw=False, **kwargs):
+    """Mirror sizes/colors into ProductAttribute rows"""
+    if raw:
+        return
+
+    current = (instance.sizes, instance.colors)
+    if created:
+        sync_product_attributes(instance, previous=set())
+    elif getattr(instance, '_loaded_attributes', None) != current:
+        sync_product_attributes(instance)
+    instance._loaded_attributes = current
+
+
+@receiver(post_save, sender=Review)
+def update_ratings_on_review_save(sender, instance, created, raw=False, **kwargs):
+    """Move the review's rating into (or between) the product aggregates"""
+    if raw:
+        return
+
+    previous = getattr(instance, '_loaded_rating', None)
+    current = (instance.product_id, instance.rating)
+    if previous == current:
+        return
+
+    if previous and previous[0] == current[0]:
+        apply_rating_delta(current[0], added=[current[1]], removed=[previous[1]])
+    else:
+        if previous:
+            apply_rating_delta(previous[0], removed=[previous[1]])
+        apply_rating_delta(current[0], added=[current[1]])
+    instance._loaded_rating = current
+
+
+@receiver(post_delete, sender=Review)
+def update_ratings_on_review_delete(sender, instance, **kwargs):
+    """Take the review back out of its product's aggregates (also runs on cascades)"""
+    product_id, rating = getattr(instance, '_loaded_rating', (instance.product_id, instance.rating))
+    apply_rating_delta(product_id, removed=[rating])
+
+
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, raw=False, **kwargs):
+    """Refresh the product's full-text search row"""
+    if raw:
+        return
+    index_products(product_ids=[instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product_on_delete(sender, instance, **kwargs):
+    unindex_product(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, raw=False, **kwargs):
+    """Category names are part of the search text of every product in it"""
+    if raw or created:
+        return
+    index_products(category_id=instance.pk)
+
+
+@receiver(post_save, sender=SubCategory)
+def reindex_subcategory_products(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    index_products(subcategory_id=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        mark_catalog_changed('product', instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=ProductImage)
+def product_related_changed(sender, instance, raw=False, **kwargs):
+    """Reviews and images are part of what clients see for their product"""
+    if not raw:
+        mark_catalog_changed('product', instance.product_id)
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def variant_stock_changed(sender, instance, raw=False, **kwargs):
+    """Restocking or removing a variant in the admin can flip the product's in_stock"""
+    if not raw:
+        sync_in_stock([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        mark_catalog_changed('category', instance.pk)
+
+
+@receiver([post_save, post_delete], sender=SubCategory)
+def subcategory_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        mark_catalog_changed('subcategory', instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def product_category_changed(sender, instance, created, raw=False, **kwargs):
+    """Product counts in the category tree only move when a product changes category"""
+    if raw:
+        return
+    current = (instance.category_id, instance.subcategory_id)
+    if created or getattr(instance, '_loaded_categories', None) != current:
+        mark_category_tree_changed()
+    instance._loaded_categories = current
+
+
+@receiver(post_delete, sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SubCategory)
+def category_tree_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        mark_category_tree_changed()
@@ -0,0 +1,198 @@
+"""Slow-query log.
+
+Every database connection gets an execute wrapper (installed from
+StoreConfig.ready()) that times each query. Queries slower than SLOW_QUERY_MS
+are written as JSON lines to the 'store.slow_queries' logger, which LOGGING
+sends to a rotating file. Each record has:
+
+  fingerprint  hash of the normalized SQL (literals and IN lists collapsed)
+  sql          the SQL template, params  the parameter types, not values
+  ms           duration
+  plan         EXPLAIN output for SELECTs, computed once per fingerprint and
+               process (a plan only changes with the schema or the data shape)
+  site         the code that issued it, see query_budget.call_site()
+
+/admin/slow-queries/ reads the log files back and groups them by fingerprint,
+flagging plans that scan a whole table.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .query_budget import call_site, ignore_in_call_sites, query_shape
+
+logger = logging.getLogger('store.slow_queries')
+ignore_in_call_sites(__file__)
+
+DEFAULT_THRESHOLD_MS = 100
+PLAN_CACHE_SIZE = 500
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE = re.compile(r'\s+')
+# SQLite "SCAN <table>" without an index, PostgreSQL "Seq Scan"
+_FULL_SCAN = re.compile(r'\bSCAN (?!.*\b(?:USING (?:COVERING )?INDEX|VIRTUAL TABLE|CONSTANT ROW)\b)|\bSeq Scan\b')
+
+_plans = OrderedDict()
+_plans_lock = threading.Lock()
+
+
+def normalize(sql):
+    """The SQL with literals and IN lists collapsed, so queries differing only in values group together"""
+    sql = query_shape(sql)
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize(sql).encode()).hexdigest()[:12]
+
+
+def params_shape(params):
+    """Parameter types (and lengths of sequences and strings), never the values"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: params_shape(value) for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [_param_type(value) for value in params]
+    return _param_type(params)
+
+
+def _param_type(value):
+    name = type(value).__name__
+    if isinstance(value, (str, bytes, list, tuple)):
+        return f'{name}[{len(value)}]'
+    return name
+
+
+def is_full_scan(plan):
+    return any(_FULL_SCAN.search(line) for line in plan or ())
+
+
+def uses_temp_sort(plan):
+    """SQLite sorting rows it read instead of reading them in index order"""
+    return any('USE TEMP B-TREE' in line for line in plan or ())
+
+
+def query_plan(connection, sql, params):
+    """EXPLAIN output lines for a query, run on a raw cursor so no execute wrapper sees it"""
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail): the detail is the plan step
+        return [str(row[-1]) for row in rows]
+    return [' '.join(str(column) for column in row) for row in rows]
+
+
+def explain(connection, sql, params, key):
+    """query_plan() for a SELECT, cached per fingerprint"""
+    if not sql.lstrip()[:6].upper().startswith(('SELECT', 'WITH')):
+        return None
+    with _plans_lock:
+        if key in _plans:
+            _plans.move_to_end(key)
+            return _plans[key]
+    try:
+        plan = query_plan(connection, sql, params)
+    except Exception as e:  # driver errors aren't wrapped on a raw cursor; never fail the query
+        return [f'EXPLAIN failed: {e}']
+    with _plans_lock:
+        _plans[key] = plan
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
+
+
+class SlowQueryWrapper:
+    """connection.execute_wrapper() hook for one connection"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            if elapsed >= getattr(settings, 'SLOW_QUERY_MS', DEFAULT_THRESHOLD_MS):
+                self.record(sql, params, many, elapsed)
+
+    def record(self, sql, params, many, elapsed):
+        key = fingerprint(sql)
+        plan = None if many else explain(self.connection, sql, params, key)
+        logger.warning(json.dumps({
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'fingerprint': key,
+            'ms': round(elapsed, 2),
+            'sql': sql,
+            'params': 'executemany' if many else params_shape(params),
+            'plan': plan,
+            'site': call_site(),
+        }))
+
+
+def install(sender, connection, **kwargs):
+    """connection_created receiver: time this connection's queries (once per connection wrapper)"""
+    if not getattr(settings, 'SLOW_QUERY_LOG_ENABLED', True):
+        return
+    if not any(isinstance(wrapper, SlowQueryWrapper) for wrapper in connection.execute_wrappers):
+        # At the bottom: execute_wrapper() blocks that are open while the
+        # connection is (re)made pop the last wrapper when they exit
+        connection.execute_wrappers.insert(0, SlowQueryWrapper(connection))
+
+
+def read_records(paths):
+    """Records from slow-query log files, skipping lines that aren't ours"""
+    for path in paths:
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(record, dict) and 'fingerprint' in record:
+                        yield record
+        except OSError:
+            continue
+
+
+def group_records(records):
+    """Records grouped by fingerprint, most total time first"""
+    groups = {}
+    for record in records:
+        group = groups.get(record['fingerprint'])
+        if group is None:
+            group = groups[record['fingerprint']] = {
+                'fingerprint': record['fingerprint'],
+                'sql': normalize(record['sql']),
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'first_seen': record['time'], 'last_seen': record['time'],
+                'sites': set(), 'plan': None,
+            }
+        group['count'] += 1
+        group['total_ms'] += record['ms']
+        group['max_ms'] = max(group['max_ms'], record['ms'])
+        group['first_seen'] = min(group['first_seen'], record['time'])
+        group['last_seen'] = max(group['last_seen'], record['time'])
+        group['sites'].add(record.get('site') or '<unknown>')
+        if record.get('plan'):
+            group['plan'] = record['plan']
+    for group in groups.values():
+        group['avg_ms'] = group['total_ms'] / group['count']
+        group['sites'] = sorted(group['sites'])
+        group['full_scan'] = is_full_scan(group['plan'])
+    return sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
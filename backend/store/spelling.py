@@ -0,0 +1,164 @@
+"""Spelling corrections ("did you mean") for searches that find nothing.
+
+The vocabulary is the set of words in product, category and subcategory names,
+read from the FTS5 vocabulary table over the search index (store.search) so it
+never drifts from what search can actually match. It is held per process in a
+trigram index: candidates for a misspelled word are the terms sharing enough
+trigrams with it, and only those are checked with a bounded edit distance.
+Lookups never touch the database.
+"""
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.db import connection
+
+from .catalog import catalog_version
+from .models import Category, Product, SubCategory
+from .search import FTS_TABLE, fts_available
+
+VOCAB_TABLE = f'{FTS_TABLE}_vocab'
+CREATE_VOCAB_SQL = f"CREATE VIRTUAL TABLE IF NOT EXISTS {VOCAB_TABLE} USING fts5vocab({FTS_TABLE}, 'col')"
+DROP_VOCAB_SQL = f'DROP TABLE IF EXISTS {VOCAB_TABLE}'
+
+MIN_TERM_LENGTH = 3
+MATCH_LIMIT = 5
+# Vocabulary rebuilds are a single query but not free; don't redo them on every write
+MIN_REBUILD_SECONDS = 60
+
+
+def max_distance(word):
+    return 1 if len(word) <= 4 else 2
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance (a swap counts as one edit), or limit + 1 if above limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            cost = 0 if char_a == char_b else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1
+                    and char_a == b[j - 2] and a[i - 2] == char_b):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class SpellingIndex:
+    def __init__(self, frequencies):
+        self.frequencies = frequencies
+        self.terms = list(frequencies)
+        self.by_trigram = defaultdict(list)
+        for term_id, term in enumerate(self.terms):
+            for gram in trigrams(term):
+                self.by_trigram[gram].append(term_id)
+
+    def matches(self, word, limit=MATCH_LIMIT):
+        """Vocabulary terms within the edit-distance bound, closest and most frequent first"""
+        word = word.lower()
+        bound = max_distance(word)
+        grams = trigrams(word)
+        # Each edit changes at most three trigrams
+        needed = max(1, len(grams) - 3 * bound)
+
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.by_trigram.get(gram, ()))
+
+        found = []
+        for term_id, count in shared.items():
+            if count < needed:
+                continue
+            term = self.terms[term_id]
+            distance = edit_distance(word, term, bound)
+            if distance <= bound:
+                found.append((distance, -self.frequencies[term], term))
+        found.sort()
+        return [term for _, _, term in found[:limit]]
+
+    def correct(self, query):
+        """
+        Return (corrected query or None, fuzzy matches). Words that are already in
+        the vocabulary are kept; each unknown word is replaced by its best match.
+        """
+        words = re.findall(r'\w+', query.lower())
+        corrected, matches, changed = [], [], False
+        for word in words:
+            if word in self.frequencies or len(word) < MIN_TERM_LENGTH or not word.isalpha():
+                corrected.append(word)
+                continue
+            candidates = self.matches(word)
+            matches.extend(term for term in candidates if term not in matches)
+            if candidates:
+                corrected.append(candidates[0])
+                changed = True
+            else:
+                corrected.append(word)
+        return (' '.join(corrected) if changed else None), matches[:MATCH_LIMIT]
+
+
+def load_vocabulary():
+    """{term: number of names containing it} for product, category and subcategory names"""
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT term, SUM(doc) FROM {VOCAB_TABLE} WHERE col IN ('name', 'category') GROUP BY term"
+            )
+            rows = cursor.fetchall()
+        frequencies = {term: count for term, count in rows}
+    else:
+        frequencies = Counter()
+        names = list(Product.objects.values_list('name', flat=True))
+        names += list(Category.objects.values_list('name', flat=True))
+        names += list(SubCategory.objects.values_list('name', flat=True))
+        for name in names:
+            frequencies.update(set(re.findall(r'\w+', name.lower())))
+
+    return {
+        term: count for term, count in frequencies.items()
+        if len(term) >= MIN_TERM_LENGTH and term.isalpha()
+    }
+
+
+class SpellingService:
+    def __init__(self):
+        self.index = None
+        self.version = None
+        self.built_at = 0
+        self.lock = threading.Lock()
+
+    def current_index(self):
+        version = catalog_version()
+        stale = self.index is None or (
+            version != self.version and time.monotonic() - self.built_at >= MIN_REBUILD_SECONDS
+        )
+        if stale:
+            with self.lock:
+                if self.index is None or version != self.version:
+                    self.rebuild(version)
+        return self.index
+
+    def rebuild(self, version=None):
+        self.index = SpellingIndex(load_vocabulary())
+        self.version = catalog_version() if version is None else version
+        self.built_at = time.monotonic()
+        return self.index
+
+    def did_you_mean(self, query):
+        return self.current_index().correct(query)
+
+
+spelling = SpellingService()
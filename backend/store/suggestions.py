@@ -0,0 +1,200 @@
+"""Per-process autocomplete index for /api/products/search-suggestions/.
+
+Product, category and subcategory names are indexed under every word start
+("Men's Classic T-Shirt" is found by "men", "clas" and "t-sh"), in one sorted
+list searched with bisect. The index is built lazily on first use and refreshed
+from the catalog version (store.catalog): touched products are re-read on their
+own, anything else triggers a full rebuild. In steady state a suggestion costs
+one cache read and no DB queries.
+"""
+import bisect
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Sum
+
+from .catalog import catalog_version, changes_between
+from .models import Category, OrderItem, Product, SubCategory
+
+PRODUCT = 'product'
+CATEGORY = 'category'
+
+PRODUCT_LIMIT = 5
+CATEGORY_LIMIT = 3
+MIN_QUERY_LENGTH = 2
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+def word_starts(name):
+    """Every suffix of the normalized name that begins at a word"""
+    text = normalize(name)
+    return [text[match.start():] for match in re.finditer(r'(?:^|(?<=[\s\-/]))\w', text)]
+
+
+class SuggestionIndex:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = []          # sorted (key, kind, owner_id)
+        self.names = {}            # (kind, owner_id) -> (display name, popularity)
+        self.results = OrderedDict()  # memoized prefix -> suggestions
+        self.lock = threading.Lock()
+
+    # Building
+
+    def add(self, kind, owner_id, name, popularity):
+        keys = word_starts(name)
+        if not keys or len(self.entries) + len(keys) > self.max_entries:
+            return False
+        self.names[(kind, owner_id)] = (name, popularity)
+        for key in keys:
+            bisect.insort(self.entries, (key, kind, owner_id))
+        return True
+
+    def remove(self, kind, owner_id):
+        existing = self.names.pop((kind, owner_id), None)
+        if existing is None:
+            return
+        for key in word_starts(existing[0]):
+            entry = (key, kind, owner_id)
+            position = bisect.bisect_left(self.entries, entry)
+            if position < len(self.entries) and self.entries[position] == entry:
+                del self.entries[position]
+
+    @classmethod
+    def build(cls, max_entries):
+        index = cls(max_entries)
+        rows = []
+        ordered = dict(
+            OrderItem.objects.order_by().values('product_id')
+            .annotate(units=Sum('quantity')).values_list('product_id', 'units')
+        )
+        for product_id, name, review_count in Product.objects.values_list('id', 'name', 'review_count'):
+            rows.append((PRODUCT, product_id, name, (ordered.get(product_id) or 0) + review_count))
+        for category_id, name in Category.objects.values_list('id', 'name'):
+            rows.append((CATEGORY, f'c{category_id}', name, 0))
+        for subcategory_id, name in SubCategory.objects.values_list('id', 'name'):
+            rows.append((CATEGORY, f's{subcategory_id}', name, 0))
+
+        # Most popular first so the memory cap drops the long tail, then one sort
+        rows.sort(key=lambda row: row[3], reverse=True)
+        entries = []
+        for kind, owner_id, name, popularity in rows:
+            keys = word_starts(name)
+            if not keys:
+                continue
+            if len(entries) + len(keys) > max_entries:
+                break
+            index.names[(kind, owner_id)] = (name, popularity)
+            entries.extend((key, kind, owner_id) for key in keys)
+        entries.sort()
+        index.entries = entries
+        return index
+
+    # Querying
+
+    def suggest(self, query):
+        prefix = normalize(query)
+        with self.lock:
+            cached = self.results.get(prefix)
+            if cached is not None:
+                self.results.move_to_end(prefix)
+                return cached
+
+        best = {PRODUCT: {}, CATEGORY: {}}
+        position = bisect.bisect_left(self.entries, (prefix,))
+        while position < len(self.entries):
+            key, kind, owner_id = self.entries[position]
+            if not key.startswith(prefix):
+                break
+            name, popularity = self.names[(kind, owner_id)]
+            # Distinct display names, keeping the most popular owner of each
+            if popularity > best[kind].get(name, -1):
+                best[kind][name] = popularity
+            position += 1
+
+        suggestions = []
+        for kind, limit in ((PRODUCT, PRODUCT_LIMIT), (CATEGORY, CATEGORY_LIMIT)):
+            ranked = sorted(best[kind].items(), key=lambda item: (-item[1], item[0]))
+            suggestions.extend(name for name, _ in ranked[:limit])
+
+        with self.lock:
+            self.results[prefix] = suggestions
+            if len(self.results) > 1024:
+                self.results.popitem(last=False)
+        return suggestions
+
+
+class SuggestionService:
+    """Owns the process-wide index and keeps it in step with the catalog version"""
+
+    def __init__(self):
+        self.index = None
+        self.version = None
+        self.built_at = 0
+        self.lock = threading.Lock()
+
+    @property
+    def max_entries(self):
+        return getattr(settings, 'SEARCH_SUGGESTIONS_MAX_ENTRIES', 500_000)
+
+    @property
+    def rebuild_interval(self):
+        # Order counts (part of popularity) don't bump the catalog version
+        return getattr(settings, 'SEARCH_SUGGESTIONS_REBUILD_SECONDS', 60 * 60)
+
+    def suggest(self, query):
+        if len(normalize(query)) < MIN_QUERY_LENGTH:
+            return []
+        return self.current_index().suggest(query)
+
+    def current_index(self):
+        version = catalog_version()
+        if self.index is not None and version == self.version:
+            if time.monotonic() - self.built_at < self.rebuild_interval:
+                return self.index
+
+        with self.lock:
+            if self.index is None or time.monotonic() - self.built_at >= self.rebuild_interval:
+                self._rebuild(version)
+            elif version != self.version:
+                self._refresh(version)
+            return self.index
+
+    def _rebuild(self, version):
+        self.index = SuggestionIndex.build(self.max_entries)
+        self.version = version
+        self.built_at = time.monotonic()
+
+    def _refresh(self, version):
+        changes = changes_between(self.version, version)
+        if changes is None or any(kind != PRODUCT for kind, _ in changes):
+            self._rebuild(version)
+            return
+
+        product_ids = {object_id for _, object_id in changes}
+        ordered = dict(
+            OrderItem.objects.filter(product_id__in=product_ids).order_by().values('product_id')
+            .annotate(units=Sum('quantity')).values_list('product_id', 'units')
+        )
+        products = Product.objects.filter(id__in=product_ids).values_list('id', 'name', 'review_count')
+
+        # Copy-on-write so concurrent readers keep a consistent index
+        index = SuggestionIndex(self.max_entries)
+        index.entries = list(self.index.entries)
+        index.names = dict(self.index.names)
+        for product_id in product_ids:
+            index.remove(PRODUCT, product_id)
+        for product_id, name, review_count in products:
+            index.add(PRODUCT, product_id, name, (ordered.get(product_id) or 0) + review_count)
+
+        self.index = index
+        self.version = version
+
+
+suggestions = SuggestionService()
@@ -0,0 +1,85 @@
+"""Product sizes/colors and their ProductAttribute mirror (store.attributes)."""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from store.models import Category, Product, ProductAttribute
+
+
+class SizeNormalizationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.women = Category.objects.create(name='Women', slug='women')
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'secret-pass-1', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def test_api_writes_store_the_canonical_format(self):
+        # ProductManagement.jsx sends the sizes as a JSON array string
+        response = self.client.post('/api/products/', {
+            'name': 'Shirt', 'slug': 'shirt', 'description': 'Cotton', 'price': '20.00',
+            'category': self.women.pk, 'sizes': '["S", " M", "S"]',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['sizes'], ['S', 'M'])
+        self.assertEqual(Product.objects.get(slug='shirt').sizes, 'S,M')
+
+        # Older bulk uploads stored Python list reprs
+        product = Product.objects.get(slug='shirt')
+        product.sizes = "['L', 'XL']"
+        product.save()
+        self.assertEqual(Product.objects.get(slug='shirt').sizes, 'L,XL')
+
+    def test_blank_sizes_stay_blank(self):
+        product = Product.objects.create(name='Scarf', slug='scarf', description='Wool', price=15, category=self.women)
+        self.assertIsNone(product.sizes)
+        self.assertEqual(self.client.get('/api/products/scarf/').data['sizes'], [])
+
+
+class AttributeFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        women = Category.objects.create(name='Women', slug='women')
+
+        def product(slug, sizes, colors):
+            return Product.objects.create(
+                name=slug.title(), slug=slug, description='', price=20, category=women, sizes=sizes, colors=colors,
+            )
+
+        cls.shirt = product('shirt', 'S,M', ['Black', 'White'])
+        cls.dress = product('dress', 'M,L', ['Red'])
+        cls.scarf = product('scarf', None, [])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def attributes(self, product):
+        return set(ProductAttribute.objects.filter(product=product).values_list('kind', 'value'))
+
+    def listed(self, **params):
+        response = self.client.get('/api/products/', params)
+        self.assertEqual(response.status_code, 200)
+        return {product['slug'] for product in response.json()['results']}
+
+    def test_saves_mirror_sizes_and_colors(self):
+        self.assertEqual(self.attributes(self.shirt), {
+            ('size', 's'), ('size', 'm'), ('color', 'black'), ('color', 'white'),
+        })
+        self.assertEqual(self.attributes(self.scarf), set())
+
+        self.shirt.sizes = 'M,XL'
+        self.shirt.colors = ['Black']
+        self.shirt.save()
+        self.assertEqual(self.attributes(self.shirt), {('size', 'm'), ('size', 'xl'), ('color', 'black')})
+
+    def test_filters_or_values_and_and_attributes(self):
+        self.assertEqual(self.listed(size='m'), {'shirt', 'dress'})
+        self.assertEqual(self.listed(size='S, l'), {'shirt', 'dress'})
+        self.assertEqual(self.listed(size='M', color='RED'), {'dress'})
+        self.assertEqual(self.listed(color='black,red'), {'shirt', 'dress'})
+        self.assertEqual(self.listed(size='XS'), set())
@@ -0,0 +1,37 @@
+"""The regression rules of the benchmark_endpoints baseline comparison."""
+from django.test import SimpleTestCase
+
+from store.benchmarks import percentiles
+from store.management.commands.benchmark_endpoints import compare
+
+
+def stats(p50=2.0, p95=3.0, p99=4.0, queries=2, size=1000, status=200):
+    return {'status': status, 'p50': p50, 'p95': p95, 'p99': p99, 'queries': queries, 'bytes': size}
+
+
+class CompareTests(SimpleTestCase):
+    def test_within_tolerance(self):
+        baseline = {'products': stats()}
+        self.assertEqual(compare(baseline, {'products': stats(p95=3.6, size=1200, p99=40.0)}, 0.25), [])
+
+    def test_latency_noise_below_the_slack_is_ignored(self):
+        baseline = {'suggestions': stats(p50=0.2, p95=0.3)}
+        self.assertEqual(compare(baseline, {'suggestions': stats(p50=0.6, p95=0.7)}, 0.25), [])
+
+    def test_regressions(self):
+        baseline = {'products': stats()}
+        regressions = compare(baseline, {'products': stats(p95=5.0, queries=3, size=2000, status=500)}, 0.25)
+        self.assertEqual(len(regressions), 4)
+        self.assertTrue(all(message.startswith('products: ') for message in regressions))
+
+    def test_new_routes_are_not_regressions(self):
+        self.assertEqual(compare({}, {'checkout': stats()}, 0.25), [])
+
+
+class PercentileTests(SimpleTestCase):
+    def test_percentiles(self):
+        result = percentiles([float(ms) for ms in range(1, 101)])
+        self.assertAlmostEqual(result['p50'], 50.5)
+        self.assertAlmostEqual(result['p95'], 95.05)
+        self.assertAlmostEqual(result['p99'], 99.01)
+        self.assertEqual(percentiles([3.0]), {'p50': 3.0, 'p95': 3.0, 'p99': 3.0})
@@ -0,0 +1,112 @@
+"""One-round-trip checkout through POST /api/checkout/ and its Idempotency-Key."""
+from decimal import Decimal
+from unittest import mock
+
+import stripe
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from store.models import Category, Order, OrderItem, Product, ProductVariant
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'secret-pass-1')
+        category = Category.objects.create(name='Women', slug='women')
+        cls.shirt = Product.objects.create(
+            name='Shirt', slug='shirt', description='Cotton', price=20, category=category, sizes='M', colors=['Black'],
+        )
+        cls.variant = ProductVariant.objects.create(product=cls.shirt, size='M', color='Black', stock=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        self.body = {'items': [{'product_id': self.shirt.pk, 'quantity': 2, 'size': 'M'}], 'shipping_country': 'US'}
+
+    def checkout(self, key='attempt-1', body=None, create_error=None):
+        intent = mock.Mock(id='pi_1', client_secret='pi_1_secret')
+        with mock.patch('stripe.PaymentIntent.create', return_value=intent, side_effect=create_error) as create, \
+                mock.patch('stripe.PaymentIntent.retrieve', return_value=intent) as retrieve:
+            headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+            response = self.client.post('/api/checkout/', body or self.body, format='json', **headers)
+        return response, create, retrieve
+
+    def stock(self):
+        self.variant.refresh_from_db()
+        return self.variant.stock
+
+    def test_places_the_order_and_starts_the_payment(self):
+        response, create, _ = self.checkout()
+        self.assertEqual(response.status_code, 201, response.data)
+        order = Order.objects.get(pk=response.data['order']['id'])
+        # 40.00 + 10.00 shipping + 3.20 tax
+        self.assertEqual(order.total, Decimal('53.20'))
+        self.assertEqual(OrderItem.objects.get(order=order).variant, self.variant)
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(response.data['payment'], {'payment_intent': 'pi_1', 'client_secret': 'pi_1_secret'})
+        self.assertEqual(create.call_args.kwargs['amount'], 5320)
+        self.assertEqual(create.call_args.kwargs['metadata'], {'user_id': self.customer.pk, 'order_id': order.pk})
+        self.assertEqual(order.payment_details['payment_intent'], 'pi_1')
+
+    def test_retries_with_the_same_key_get_the_same_order(self):
+        first, _, _ = self.checkout()
+        retry, create, retrieve = self.checkout()
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.data['order']['id'], first.data['order']['id'])
+        self.assertEqual(retry.data['payment']['client_secret'], 'pi_1_secret')
+        create.assert_not_called()
+        retrieve.assert_called_once_with('pi_1')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.stock(), 0)
+
+        # Keys belong to their user: another shopper's same key is a new checkout
+        other = User.objects.create_user('other', 'other@example.com', 'secret-pass-2')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.checkout()[0].status_code, 409)
+
+    def test_a_reused_key_must_carry_the_same_checkout(self):
+        self.assertEqual(self.checkout()[0].status_code, 201)
+        # The same content in another key order is the same checkout
+        reordered = {'shipping_country': 'US', 'items': [{'size': 'M', 'quantity': 2, 'product_id': self.shirt.pk}]}
+        self.assertEqual(self.checkout(body=reordered)[0].status_code, 200)
+
+        changed = {**self.body, 'items': [{'product_id': self.shirt.pk, 'quantity': 1, 'size': 'M'}]}
+        response, create, retrieve = self.checkout(body=changed)
+        self.assertEqual(response.status_code, 422)
+        create.assert_not_called()
+        retrieve.assert_not_called()
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.checkout('attempt-2', body=changed)[0].status_code, 409)
+
+    def test_requires_a_key(self):
+        for key in ('', 'k' * 101):
+            self.assertEqual(self.checkout(key)[0].status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_failed_checkout_writes_nothing_and_can_be_retried(self):
+        short = {**self.body, 'items': [{'product_id': self.shirt.pk, 'quantity': 3, 'size': 'M'}]}
+        response, create, _ = self.checkout(body=short)
+        self.assertEqual(response.status_code, 409)
+        create.assert_not_called()
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock(), 2)
+        self.assertEqual(self.checkout()[0].status_code, 201)
+
+    def test_stripe_failure_keeps_the_order_for_a_retry(self):
+        response, _, _ = self.checkout(create_error=stripe.error.APIConnectionError('down'))
+        self.assertEqual(response.status_code, 502)
+        self.assertIsNone(response.data['payment'])
+        order = Order.objects.get()
+        self.assertEqual((order.status, self.stock()), ('pending', 0))
+
+        retry, create, _ = self.checkout()
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.data['order']['id'], order.pk)
+        self.assertEqual(retry.data['payment']['payment_intent'], 'pi_1')
+        # Stripe gets the same key for the order both times, so an intent it did create isn't doubled
+        self.assertEqual(create.call_args.kwargs['idempotency_key'], f'store-order-{order.pk}-payment')
+        self.assertEqual(Order.objects.count(), 1)
@@ -0,0 +1,63 @@
+"""ETag / Last-Modified revalidation of catalog responses (store.conditional, store.catalog)."""
+from django.core.cache import cache
+from django.db.models import F
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from store.catalog import VERSION, catalog_version
+from store.models import CatalogCounter, Category, Product
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.women = Category.objects.create(name='Women', slug='women')
+        cls.shirt = Product.objects.create(name='Shirt', slug='shirt', description='Cotton', price=20, category=cls.women)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def revalidate(self, path, etag):
+        return self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+
+    def test_product_detail_answers_304_until_the_product_changes(self):
+        response = self.client.get('/api/products/shirt/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.revalidate('/api/products/shirt/', etag).status_code, 304)
+
+        self.shirt.refresh_from_db()
+        self.shirt.price = 25
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirt.save()
+        response = self.revalidate('/api/products/shirt/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['price'], '25.00')
+
+    def test_renaming_the_category_changes_the_product_etag(self):
+        etag = self.client.get('/api/products/shirt/')['ETag']
+        self.women.name = 'Womenswear'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.women.save()
+        response = self.revalidate('/api/products/shirt/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['category_name'], 'Womenswear')
+
+    def test_each_fieldset_has_its_own_etag(self):
+        full = self.client.get('/api/products/shirt/')['ETag']
+        sparse = self.client.get('/api/products/shirt/?fields=id')
+        self.assertEqual(sparse.data, {'id': self.shirt.pk})
+        self.assertNotEqual(sparse['ETag'], full)
+        self.assertEqual(self.revalidate('/api/products/shirt/?fields=id', full).status_code, 200)
+
+    @override_settings(CATALOG_VERSION_CACHE_SECONDS=0)
+    def test_versions_bumped_by_other_processes_are_seen(self):
+        etag = self.client.get('/api/categories/')['ETag']
+        self.assertEqual(self.revalidate('/api/categories/', etag).status_code, 304)
+
+        # Another worker's bump goes to the shared counter row, not to this process's cache
+        version = catalog_version()
+        CatalogCounter.objects.filter(name=VERSION).update(value=F('value') + 1)
+        self.assertEqual(catalog_version(), version + 1)
+        self.assertEqual(self.revalidate('/api/categories/', etag).status_code, 200)
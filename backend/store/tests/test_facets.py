@@ -0,0 +1,69 @@
+"""Filter sidebar counts from /api/products/facets/ (store.facets)."""
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from store.facets import filter_signature
+from store.models import Category, Product, SubCategory
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.women = Category.objects.create(name='Women', slug='women')
+        cls.men = Category.objects.create(name='Men', slug='men')
+        cls.dresses = SubCategory.objects.create(name='Dresses', slug='dresses', category=cls.women)
+
+        def product(slug, category, price, sizes, colors, subcategory=None):
+            return Product.objects.create(
+                name=slug.title(), slug=slug, description='', price=price, category=category,
+                subcategory=subcategory, sizes=sizes, colors=colors,
+            )
+
+        product('red-dress', cls.women, 30, 'S,M', ['Red'], cls.dresses)
+        product('blue-dress', cls.women, 60, 'M', ['Blue'], cls.dresses)
+        product('blouse', cls.women, 20, 'S', ['Red'])
+        cls.coat = product('coat', cls.men, 250, 'L', ['Black'])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def facets(self, **params):
+        response = self.client.get('/api/products/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def counts(self, items, key='slug'):
+        return {item[key]: item['count'] for item in items}
+
+    def test_counts_every_facet(self):
+        facets = self.facets()
+        self.assertEqual(facets['count'], 4)
+        self.assertEqual(self.counts(facets['categories']), {'women': 3, 'men': 1})
+        self.assertEqual(self.counts(facets['subcategories']), {'dresses': 2})
+        self.assertEqual(self.counts(facets['sizes'], 'value'), {'s': 2, 'm': 2, 'l': 1})
+        self.assertEqual(self.counts(facets['colors'], 'value'), {'red': 2, 'blue': 1, 'black': 1})
+        self.assertEqual(
+            [(bucket['min'], bucket['max'], bucket['count']) for bucket in facets['price_ranges']],
+            [(0, 25, 1), (25, 50, 1), (50, 100, 1), (100, 200, 0), (200, None, 1)],
+        )
+
+    def test_counts_follow_the_filters(self):
+        facets = self.facets(category=self.women.pk, color='red')
+        self.assertEqual(facets['count'], 2)
+        self.assertEqual(self.counts(facets['sizes'], 'value'), {'s': 2, 'm': 1})
+        self.assertEqual(self.counts(facets['categories']), {'women': 2})
+
+    def test_cached_counts_change_with_the_catalog(self):
+        self.assertEqual(self.counts(self.facets()['categories']), {'women': 3, 'men': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.coat.delete()
+        self.assertEqual(self.counts(self.facets()['categories']), {'women': 3})
+
+    def test_signature_ignores_order_case_and_unrelated_params(self):
+        self.assertEqual(
+            filter_signature({'size': 'M, s', 'color': 'Red', 'page': '2', 'sort_by': 'price_asc'}),
+            filter_signature({'color': 'red', 'size': 's,m'}),
+        )
+        self.assertNotEqual(filter_signature({'size': 's'}), filter_signature({'size': 'm'}))
@@ -0,0 +1,84 @@
+"""Sparse fieldsets: ?fields= / ?omit= on API responses (store.fieldsets)."""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from store.fieldsets import Fieldset, trim_queryset
+from store.models import Category, Product, WishlistItem
+from store.serializers import ProductSerializer
+
+
+class FieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.women = Category.objects.create(name='Women', slug='women')
+        cls.shirt = Product.objects.create(
+            name='Shirt', slug='shirt', description='Cotton', price=20, category=cls.women, sizes='S,M',
+        )
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'secret-pass-1')
+        WishlistItem.objects.create(user=cls.customer, product=cls.shirt)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def product_select(self, **params):
+        """The SQL loading the product for /api/products/shirt/ (after the ETag lookup)"""
+        with CaptureQueriesContext(connection) as queries:
+            self.get('/api/products/shirt/', **params)
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        return [sql for sql in selects if 'FROM "store_product"' in sql][-1]
+
+    def test_fields_and_omit_shape_the_detail(self):
+        self.assertEqual(self.get('/api/products/shirt/', fields='id,name'), {'id': self.shirt.pk, 'name': 'Shirt'})
+        product = self.get('/api/products/shirt/', omit='description,rating_histogram')
+        self.assertNotIn('description', product)
+        self.assertNotIn('rating_histogram', product)
+        self.assertEqual(product['sizes'], ['S', 'M'])
+
+    def test_fields_shape_list_rows(self):
+        [row] = self.get('/api/products/', fields='id,category_name')['results']
+        self.assertEqual(row, {'id': self.shirt.pk, 'category_name': 'Women'})
+
+    def test_dotted_names_reach_nested_serializers(self):
+        self.client.force_authenticate(self.customer)
+        [item] = self.get('/api/wishlist/', fields='id,product.name,product.price')['results']
+        self.assertEqual(set(item), {'id', 'product'})
+        self.assertEqual(item['product'], {'name': 'Shirt', 'price': '20.00'})
+
+    def test_sql_reads_only_the_selected_columns(self):
+        full = self.product_select()
+        sparse = self.product_select(fields='id,name')
+        self.assertIn('"description"', full)
+        self.assertNotIn('"description"', sparse)
+        self.assertNotIn('"store_category"', sparse)
+        # A method field's declared sources are joined in
+        self.assertIn('"store_category"."name"', self.product_select(fields='id,category_name'))
+
+    def test_trim_queryset_defers_the_unread_columns(self):
+        serializer = ProductSerializer(fieldset=Fieldset({'id', 'price', 'category_name'}))
+        queryset = trim_queryset(Product.objects.select_related('category'), serializer)
+        product = queryset.get()
+        self.assertEqual(
+            product.get_deferred_fields() & {'name', 'description', 'price', 'category_id'}, {'name', 'description'}
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(product.category.name, 'Women')
+
+    def test_writes_answer_with_the_full_representation(self):
+        staff = User.objects.create_user('staff', 'staff@example.com', 'secret-pass-2', is_staff=True)
+        self.client.force_authenticate(staff)
+        response = self.client.post('/api/products/?fields=id', {
+            'name': 'Dress', 'slug': 'dress', 'description': 'Linen', 'price': '40.00', 'category': self.women.pk,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['name'], 'Dress')
+        self.assertEqual(response.data['description'], 'Linen')
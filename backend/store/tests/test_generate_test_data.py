@@ -0,0 +1,74 @@
+"""generate_test_data fills every model, consistently and reproducibly."""
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import Count
+from django.test import TestCase
+from django.utils import timezone
+
+from store.inventory import release_expired
+from store.models import (
+    Address, Category, Order, OrderItem, Product, ProductAttribute, ProductImage, ProductVariant, Review,
+    ReviewImage, ShippingAddress, SubCategory, UserProfile, WishlistItem,
+)
+
+
+def generate(seed, *options):
+    call_command('generate_test_data', '60', '--users', '30', '--seed', str(seed), *options, stdout=StringIO())
+
+
+class GenerateTestDataTests(TestCase):
+    def test_fills_every_model(self):
+        generate(1)
+        self.assertEqual(Product.objects.count(), 60)
+        self.assertEqual(User.objects.count(), 30)
+        for model in (Category, SubCategory, ProductAttribute, ProductImage, ProductVariant, Review, ReviewImage,
+                      ShippingAddress, Address, UserProfile, Order, OrderItem, WishlistItem):
+            self.assertTrue(model.objects.exists(), model.__name__)
+
+    def test_stored_rating_aggregates_match_reviews(self):
+        generate(2)
+        counts = dict(Review.objects.values_list('product').annotate(n=Count('id')).order_by())
+        for product_id, review_count in Product.objects.values_list('id', 'review_count'):
+            self.assertEqual(review_count, counts.get(product_id, 0))
+
+    def test_stock_follows_the_variants(self):
+        generate(4)
+        for product in Product.objects.filter(variants__isnull=False).distinct().prefetch_related('variants'):
+            self.assertEqual(product.in_stock, any(variant.stock for variant in product.variants.all()), product.pk)
+        lines = OrderItem.objects.filter(variant__isnull=False).select_related('variant')
+        self.assertTrue(lines.exists())
+        for line in lines:
+            self.assertEqual(
+                (line.variant.product_id, line.variant.size, line.variant.color), (line.product_id, line.size, line.color)
+            )
+        self.assertFalse(OrderItem.objects.filter(product_name='').exists())
+
+    def test_pending_orders_hold_their_stock(self):
+        def stock():
+            return list(ProductVariant.objects.order_by('id').values_list('stock', flat=True))
+
+        # Over two days most orders are still pending; the same seed without orders gives the stock before them
+        generate(5, '--days', '2', '--orders-per-user', '0')
+        shelf = stock()
+        Product.objects.all().delete()
+        User.objects.all().delete()
+        generate(5, '--days', '2')
+        self.assertTrue(OrderItem.objects.filter(order__status='pending', variant__isnull=False).exists())
+        self.assertNotEqual(stock(), shelf)
+
+        # Releasing every pending order gives back exactly what it took
+        release_expired(timezone.now())
+        self.assertEqual(stock(), shelf)
+
+    def test_same_seed_same_catalog(self):
+        def catalog():
+            return list(Product.objects.order_by('id').values_list('name', 'price', 'sizes', 'review_count'))
+
+        generate(3)
+        first = catalog()
+        Product.objects.all().delete()
+        User.objects.all().delete()
+        generate(3)
+        self.assertEqual(catalog(), first)
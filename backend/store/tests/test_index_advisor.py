@@ -0,0 +1,35 @@
+"""Every canonical API query shape must be served by an index (see advise_indexes)."""
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from store.models import Category, Order, OrderItem, Product, Review, WishlistItem
+
+
+class IndexAdvisorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = User.objects.create_user('customer', 'customer@example.com', 'secret-pass-1')
+        other = User.objects.create_user('other', 'other@example.com', 'secret-pass-2')
+        categories = [Category.objects.create(name=name, slug=name.lower()) for name in ('Women', 'Men')]
+        products = [
+            Product.objects.create(
+                name=f'Shirt {number}', slug=f'shirt-{number}', description='Cotton', price=10 + number,
+                category=categories[number % 2], featured=number % 3 == 0, in_stock=number % 5 != 0,
+            )
+            for number in range(12)
+        ]
+        for user in (customer, other):
+            Review.objects.create(product=products[0], user=user, rating=4, title='Nice', content='Good')
+            WishlistItem.objects.create(user=user, product=products[1])
+        for _ in range(2):
+            order = Order.objects.create(user=customer)
+            OrderItem.objects.create(order=order, product=products[2], quantity=1, price=products[2].price)
+
+    def test_no_query_shape_scans_or_sorts(self):
+        out = StringIO()
+        call_command('advise_indexes', '--check', stdout=out)
+        self.assertIn('Every query shape is served by an index', out.getvalue())
+        self.assertNotIn('FIX', out.getvalue())
@@ -0,0 +1,231 @@
+"""Per-variant stock: reservation at checkout, sold-out handling and the expired-reservation sweep."""
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+import stripe
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from store.inventory import release_expired
+from store.models import Category, Order, OrderItem, Product, ProductVariant
+
+
+class ReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'secret-pass-1')
+        category = Category.objects.create(name='Women', slug='women')
+        cls.shirt = Product.objects.create(
+            name='Shirt', slug='shirt', description='Cotton', price=20, category=category, sizes='S,M', colors=['Black'],
+        )
+        cls.small = ProductVariant.objects.create(product=cls.shirt, size='S', color='Black', stock=3)
+        cls.medium = ProductVariant.objects.create(product=cls.shirt, size='M', color='Black', stock=1)
+        cls.scarf = Product.objects.create(name='Scarf', slug='scarf', description='Wool', price=15, category=category)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def order(self, *items):
+        return self.client.post('/api/orders/', {'items': list(items)}, format='json')
+
+    def stock(self):
+        return dict(ProductVariant.objects.values_list('size', 'stock'))
+
+    def test_takes_stock_for_the_variant_ordered(self):
+        response = self.order({'product_id': self.shirt.pk, 'quantity': 2, 'size': 's', 'color': 'black'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.stock(), {'S': 1, 'M': 1})
+        self.assertEqual(OrderItem.objects.get().variant, self.small)
+
+    def test_short_line_rolls_the_order_back(self):
+        response = self.order(
+            {'product_id': self.shirt.pk, 'quantity': 1, 'size': 'S'},
+            {'product_id': self.shirt.pk, 'quantity': 2, 'size': 'M'},
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('(M/Black)', response.data['detail'])
+        self.assertNotIn('(S/Black)', response.data['detail'])
+        self.assertEqual(self.stock(), {'S': 3, 'M': 1})
+        self.assertFalse(Order.objects.exists())
+
+    def test_in_stock_follows_the_last_unit(self):
+        self.order({'product_id': self.shirt.pk, 'quantity': 3, 'size': 'S'})
+        self.shirt.refresh_from_db()
+        self.assertTrue(self.shirt.in_stock)
+        self.order({'product_id': self.shirt.pk, 'quantity': 1, 'size': 'M'})
+        self.shirt.refresh_from_db()
+        self.assertFalse(self.shirt.in_stock)
+
+        # Restocking in the admin puts it back on sale
+        self.medium.refresh_from_db()
+        self.medium.stock = 5
+        self.medium.save()
+        self.shirt.refresh_from_db()
+        self.assertTrue(self.shirt.in_stock)
+
+    def test_lines_must_name_a_variant_of_tracked_products(self):
+        self.assertEqual(self.order({'product_id': self.shirt.pk, 'quantity': 1}).status_code, 400)
+        self.assertEqual(self.order({'product_id': self.shirt.pk, 'quantity': 1, 'size': 'XL'}).status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_untracked_products_stay_sellable(self):
+        response = self.order({'product_id': self.scarf.pk, 'quantity': 50})
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(OrderItem.objects.get().variant)
+
+    def test_sweep_releases_only_expired_pending_orders(self):
+        ids = [
+            self.order({'product_id': self.shirt.pk, 'quantity': 1, 'size': 'S'}).data['id'] for _ in range(3)
+        ]
+        expired, paid, fresh = ids
+        Order.objects.filter(pk__in=[expired, paid]).update(created_at=timezone.now() - timedelta(hours=2))
+        Order.objects.filter(pk=paid).update(status='paid')
+        self.assertEqual(self.stock()['S'], 0)
+
+        out = StringIO()
+        call_command('release_expired_reservations', '--minutes', '30', stdout=out)
+        self.assertIn('Cancelled 1 expired orders and released 1 units', out.getvalue())
+        self.assertEqual(
+            dict(Order.objects.values_list('id', 'status')), {expired: 'cancelled', paid: 'paid', fresh: 'pending'}
+        )
+        self.assertEqual(self.stock()['S'], 1)
+
+        # Running again finds nothing left to release
+        call_command('release_expired_reservations', '--minutes', '30', stdout=out)
+        self.assertEqual(self.stock()['S'], 1)
+
+
+class LatePaymentTests(TestCase):
+    """A Stripe payment racing the sweep that cancels its order"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'secret-pass-1')
+        category = Category.objects.create(name='Women', slug='women')
+        cls.shirt = Product.objects.create(
+            name='Shirt', slug='shirt', description='Cotton', price=20, category=category, sizes='M', colors=['Black'],
+        )
+        cls.variant = ProductVariant.objects.create(product=cls.shirt, size='M', color='Black', stock=1)
+
+    def setUp(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        response = client.post('/api/orders/', {'items': [{'product_id': self.shirt.pk, 'quantity': 1}]}, format='json')
+        self.order = Order.objects.get(pk=response.data['id'])
+        Order.objects.filter(pk=self.order.pk).update(
+            created_at=timezone.now() - timedelta(hours=2), payment_details={'payment_intent': 'pi_1'},
+        )
+
+    def sweep(self, cancel_error=None, intent_status='canceled'):
+        with mock.patch('stripe.PaymentIntent.cancel', side_effect=cancel_error) as cancel, \
+                mock.patch('stripe.PaymentIntent.retrieve', return_value=mock.Mock(status=intent_status)):
+            result = release_expired(timezone.now() - timedelta(minutes=30))
+        cancel.assert_called_once_with('pi_1')
+        return result
+
+    def pay(self):
+        card = SimpleNamespace(last4='4242', brand='visa')
+        intent = SimpleNamespace(
+            id='pi_1', amount=2000, metadata={'order_id': self.order.pk},
+            payment_method_details=SimpleNamespace(card=card),
+        )
+        event = SimpleNamespace(type='payment_intent.succeeded', data=SimpleNamespace(object=intent))
+        with mock.patch('stripe.Webhook.construct_event', return_value=event), \
+                mock.patch('stripe.Refund.create', return_value=mock.Mock(id='re_1')) as refund:
+            response = APIClient().post('/api/payment/webhook/', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return refund
+
+    def state(self):
+        self.order.refresh_from_db()
+        self.variant.refresh_from_db()
+        return self.order.status, self.variant.stock
+
+    def test_sweep_cancels_the_payment_intent(self):
+        self.assertEqual(self.sweep(), (1, 1))
+        self.assertEqual(self.state(), ('cancelled', 1))
+
+    def test_an_intent_that_already_succeeded_keeps_the_order(self):
+        error = stripe.error.InvalidRequestError('already succeeded', 'intent')
+        with self.assertLogs('store.inventory', 'WARNING'):
+            self.assertEqual(self.sweep(cancel_error=error, intent_status='succeeded'), (0, 0))
+        self.assertEqual(self.state(), ('pending', 0))
+        self.pay().assert_not_called()
+        self.assertEqual(self.state(), ('paid', 0))
+
+    def test_payment_after_the_sweep_takes_the_stock_again(self):
+        self.sweep()
+        self.pay().assert_not_called()
+        self.assertEqual(self.state(), ('paid', 0))
+        self.assertEqual(self.order.payment_details['payment_intent'], 'pi_1')
+
+    def test_payment_after_the_stock_was_resold_is_refunded(self):
+        self.sweep()
+        ProductVariant.objects.filter(pk=self.variant.pk).update(stock=0)
+        refund = self.pay()
+        refund.assert_called_once_with(payment_intent='pi_1', idempotency_key=f'store-order-{self.order.pk}-refund')
+        self.assertEqual(self.state(), ('cancelled', 0))
+        self.assertEqual(self.order.payment_details['refund'], 're_1')
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Many shoppers racing for the last units of one variant: none is sold twice"""
+
+    def test_no_oversell(self):
+        category = Category.objects.create(name='Women', slug='women')
+        product = Product.objects.create(
+            name='Dress', slug='dress', description='Linen', price=50, category=category, sizes='M', colors=['Red'],
+        )
+        variant = ProductVariant.objects.create(product=product, size='M', color='Red', stock=10)
+        users = [User.objects.create_user(f'shopper{n}', password='secret-pass-1') for n in range(16)]
+        body = {'items': [{'product_id': product.pk, 'quantity': 1, 'size': 'M', 'color': 'Red'}]}
+        statuses, lock = Counter(), threading.Lock()
+
+        def checkout(user, attempts):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                for _ in range(attempts):
+                    # The shared-cache in-memory test database reports lock contention at once
+                    # instead of waiting like a file database: try again, as a client would.
+                    # A failure as the transaction commits can hide a 201 behind a retried 409,
+                    # so what was sold is counted in the database below.
+                    while True:
+                        try:
+                            status = client.post('/api/orders/', body, format='json').status_code
+                            break
+                        except OperationalError as error:
+                            if 'locked' not in str(error):
+                                raise
+                            time.sleep(0.001)
+                    with lock:
+                        statuses[status] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(user, 12)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(set(statuses), {201, 409}, statuses)
+        self.assertIn(409, statuses)
+        self.assertEqual(sum(statuses.values()), 16 * 12)
+        self.assertEqual(Order.objects.count(), 10)
+        variant.refresh_from_db()
+        self.assertEqual(variant.stock, 0)
+        self.assertEqual(OrderItem.objects.filter(variant=variant).count(), 10)
+        product.refresh_from_db()
+        self.assertFalse(product.in_stock)
@@ -0,0 +1,63 @@
+"""Access to the Prometheus endpoint at /metrics and the slow query log's directory."""
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from store.log import LazyRotatingFileHandler
+
+
+class MetricsAccessTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'secret-pass-1', is_staff=True)
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'secret-pass-2')
+
+    def scrape(self, user=None, remote_addr='203.0.113.7'):
+        client = APIClient()
+        if user:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        return client.get('/metrics', REMOTE_ADDR=remote_addr)
+
+    def test_the_scraper_address_needs_no_login(self):
+        response = self.scrape(remote_addr='127.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    def test_staff_tokens_are_accepted_from_anywhere(self):
+        self.assertEqual(self.scrape(self.staff).status_code, 200)
+        self.assertEqual(self.scrape(self.customer).status_code, 403)
+        self.assertEqual(self.scrape().status_code, 401)
+
+
+class SlowQueryLogTests(TestCase):
+    def test_importing_settings_creates_no_directory(self):
+        with tempfile.TemporaryDirectory() as root:
+            # A fresh interpreter, with the project copied where it has no logs/ yet
+            backend = Path(root) / 'backend'
+            backend.mkdir()
+            (backend / 'settings.py').write_text(Path(settings.BASE_DIR, 'backend', 'settings.py').read_text())
+            (backend / '__init__.py').touch()
+            subprocess.run(
+                [sys.executable, '-c', 'import backend.settings'], cwd=root, check=True,
+                env={**os.environ, 'PYTHONPATH': root},
+            )
+            self.assertFalse((Path(root) / 'logs').exists())
+
+    def test_handler_creates_the_directory_on_first_record(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = Path(root, 'logs', 'slow_queries.log')
+            handler = LazyRotatingFileHandler(path, maxBytes=1024, backupCount=1)
+            self.assertFalse(path.parent.exists())
+            handler.emit(logging.LogRecord('store.slow_queries', logging.WARNING, __file__, 0, 'slow', None, None))
+            handler.close()
+            self.assertEqual(path.read_text(), 'slow\n')
+
@@ -0,0 +1,117 @@
+"""Order creation through POST /api/orders/ and the order history."""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from store.models import Category, Order, OrderItem, Product
+from store.query_budget import expect_queries
+
+
+class OrderCreateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'secret-pass-1')
+        category = Category.objects.create(name='Women', slug='women')
+        cls.shirt = Product.objects.create(name='Shirt', slug='shirt', description='Cotton', price=20, category=category)
+        cls.dress = Product.objects.create(
+            name='Dress', slug='dress', description='Linen', price=50, sale_price=40, category=category,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def order(self, items, **fields):
+        return self.client.post('/api/orders/', {'items': items, **fields}, format='json')
+
+    def test_prices_lines_from_the_catalog(self):
+        response = self.order([
+            {'product_id': self.shirt.pk, 'quantity': 2, 'size': 'M'},
+            {'product_id': self.shirt.pk, 'quantity': 1, 'size': 'L'},
+            {'product_id': self.dress.pk, 'quantity': 1},
+        ], total='0.01', subtotal='0.01', shipping_country='US')
+        self.assertEqual(response.status_code, 201)
+
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(order.user, self.customer)
+        self.assertEqual(order.subtotal, Decimal('100.00'))  # 3 x 20 + the dress on sale at 40
+        # US shipping is free only above 100, US tax is 8%
+        self.assertEqual((order.shipping_cost, order.tax, order.total), (Decimal('10.00'), Decimal('8.00'), Decimal('118.00')))
+        self.assertEqual(
+            sorted(OrderItem.objects.filter(order=order).values_list('product_id', 'size', 'quantity', 'price')),
+            sorted([(self.shirt.pk, 'M', 2, Decimal('20.00')), (self.shirt.pk, 'L', 1, Decimal('20.00')),
+                    (self.dress.pk, '', 1, Decimal('40.00'))]),
+        )
+        self.assertEqual({item['product_name'] for item in response.data['items']}, {'Shirt', 'Dress'})
+
+    def test_rejects_unknown_products_without_writing(self):
+        response = self.order([{'product_id': self.shirt.pk, 'quantity': 1}, {'product_id': 999, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('999', str(response.data['items']))
+        self.assertFalse(Order.objects.exists())
+
+    def test_rejects_duplicate_lines(self):
+        response = self.order([{'product_id': self.shirt.pk, 'quantity': 1, 'size': 'M'}] * 2)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_rejects_empty_orders_and_bad_quantities(self):
+        self.assertEqual(self.order([]).status_code, 400)
+        self.assertEqual(self.order([{'product_id': self.shirt.pk, 'quantity': 0}]).status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'secret-pass-1')
+        category = Category.objects.create(name='Women', slug='women')
+        cls.products = [
+            Product.objects.create(
+                name=f'Shirt {n}', slug=f'shirt-{n}', description='Cotton', price=20 + n, category=category,
+                image=f'products/shirt-{n}.jpg',
+            )
+            for n in range(5)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def place(self, lines):
+        response = self.client.post('/api/orders/', {'items': [
+            {'product_id': product.pk, 'quantity': 1} for product in self.products[:lines]
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def test_lines_keep_what_was_bought(self):
+        order_id = self.place(1)
+        Product.objects.filter(pk=self.products[0].pk).update(name='Renamed', price=99, image='products/new.jpg')
+
+        item = self.client.get(f'/api/orders/{order_id}/').data['items'][0]
+        self.assertEqual(item['product_name'], 'Shirt 0')
+        self.assertEqual(item['product_price'], '20.00')
+        self.assertTrue(item['product_image'].endswith('products/shirt-0.jpg'))
+        self.assertEqual(Order.objects.get(pk=order_id).total_price, Decimal('20.00'))
+
+    def test_history_queries_do_not_grow_with_orders_or_lines(self):
+        self.place(1)
+        with expect_queries(exact=2):
+            self.client.get('/api/orders/')
+        for lines in range(1, 6):
+            for _ in range(5):
+                self.place(lines)
+        with expect_queries(exact=2):
+            self.client.get('/api/orders/')
+
+    def test_history_pages_by_keyset_newest_first(self):
+        placed = [self.place(1) for _ in range(15)]
+        first = self.client.get('/api/orders/').data
+        self.assertNotIn('count', first)
+        self.assertTrue(first['has_next'])
+        second = self.client.get('/api/orders/', {'cursor': first['next_cursor']}).data
+        self.assertFalse(second['has_next'])
+        self.assertEqual([order['id'] for order in first['results'] + second['results']], placed[::-1])
@@ -0,0 +1,73 @@
+"""Keyset (?cursor=) pagination of product listings (store.pagination)."""
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from rest_framework.exceptions import NotFound
+from rest_framework.test import APIClient
+
+from store.models import Category, Product
+from store.pagination import decode_cursor, encode_cursor
+
+
+class CursorCodingTests(SimpleTestCase):
+    ordering = ['price', 'id']
+
+    def test_round_trip(self):
+        cursor = encode_cursor({'price': 19.5, 'id': 7}, self.ordering)
+        self.assertEqual(decode_cursor(cursor, self.ordering), ['19.5', '7'])
+
+    def test_garbled_cursors_are_not_found(self):
+        cursor = encode_cursor({'price': 19.5, 'id': 7}, self.ordering)
+        for garbled in ('nonsense', cursor[:-3], cursor[1:], 'e30'):
+            with self.subTest(cursor=garbled), self.assertRaises(NotFound):
+                decode_cursor(garbled, self.ordering)
+
+    def test_cursors_only_fit_their_ordering(self):
+        cursor = encode_cursor({'price': 19.5, 'id': 7}, self.ordering)
+        with self.assertRaisesMessage(NotFound, 'does not match'):
+            decode_cursor(cursor, ['-price', '-id'])
+
+
+class KeysetListingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Women', slug='women')
+        # Repeated prices, so pages must break ties on id
+        cls.products = [
+            Product.objects.create(
+                name=f'Shirt {n}', slug=f'shirt-{n}', description='', price=10 + n % 3, category=category,
+            )
+            for n in range(7)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def page(self, **params):
+        response = self.client.get('/api/products/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def walk(self, **params):
+        walked, cursor = [], ''
+        for _ in self.products:
+            page = self.page(cursor=cursor, limit=3, **params)
+            self.assertNotIn('count', page)
+            walked += [product['id'] for product in page['results']]
+            if not page['has_next']:
+                return walked
+            cursor = page['next_cursor']
+        self.fail('Pages never ran out')
+
+    def test_walks_every_product_once_in_order(self):
+        by_price = sorted(self.products, key=lambda product: (product.price, product.pk))
+        self.assertEqual(self.walk(sort_by='price_asc'), [product.pk for product in by_price])
+        newest = sorted(self.products, key=lambda product: (product.created_at, product.pk), reverse=True)
+        self.assertEqual(self.walk(), [product.pk for product in newest])
+
+    def test_a_cursor_from_another_sort_order_is_refused(self):
+        cursor = self.page(cursor='', limit=3, sort_by='price_asc')['next_cursor']
+        response = self.client.get('/api/products/', {'cursor': cursor, 'sort_by': 'price_desc'})
+        self.assertEqual(response.status_code, 404)
+        tampered = cursor[:-4] + ('AAAA' if cursor[-4:] != 'AAAA' else 'BBBB')
+        self.assertEqual(self.client.get('/api/products/', {'cursor': tampered, 'sort_by': 'price_asc'}).status_code, 404)
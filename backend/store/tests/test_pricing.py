@@ -0,0 +1,168 @@
+"""Cart pricing (store.pricing): the quote endpoint and payment intents."""
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from store.models import Category, Order, Product
+from store.pricing import CURRENCY, load_products, price_lines
+from store.query_budget import expect_queries
+
+ZONES = {
+    'domestic': {'countries': ['US'], 'rate': '10.00', 'free_over': '100.00'},
+    'europe': {'countries': ['FR', 'DE'], 'rate': '15.00', 'free_over': None},
+    'international': {'countries': ['*'], 'rate': '25.00', 'free_over': '250.00'},
+}
+TAX_RATES = {'US': '0.08', 'FR': '0.2', '*': '0'}
+
+
+@override_settings(SHIPPING_ZONES=ZONES, TAX_RATES=TAX_RATES)
+class CartQuoteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Women', slug='women')
+        cls.shirt = Product.objects.create(name='Shirt', slug='shirt', description='Cotton', price='19.99', category=category)
+        cls.dress = Product.objects.create(
+            name='Dress', slug='dress', description='Linen', price=50, sale_price='39.95', category=category,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def quote(self, items, country='US'):
+        response = self.client.post('/api/cart/quote/', {'items': items, 'country': country}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_prices_with_sale_prices_shipping_and_tax(self):
+        quote = self.quote([{'product_id': self.shirt.pk, 'quantity': 3}, {'product_id': self.dress.pk, 'quantity': 1}])
+        self.assertEqual(
+            [(line['product_id'], line['unit_price'], line['line_total']) for line in quote['lines']],
+            [(self.shirt.pk, '19.99', '59.97'), (self.dress.pk, '39.95', '39.95')],
+        )
+        # 99.92 is not above the free-shipping threshold; 8% tax rounds half up
+        self.assertEqual(
+            (quote['subtotal'], quote['shipping'], quote['tax'], quote['total'], quote['shipping_zone']),
+            ('99.92', '10.00', '7.99', '117.91', 'domestic'),
+        )
+
+    def test_zones_and_rates_by_country(self):
+        items = [{'product_id': self.dress.pk, 'quantity': 10}]
+        self.assertEqual(self.quote(items, 'us')['shipping'], '0.00')
+        france = self.quote(items, 'FR')
+        self.assertEqual((france['shipping_zone'], france['shipping'], france['tax']), ('europe', '15.00', '79.90'))
+        elsewhere = self.quote([{'product_id': self.dress.pk, 'quantity': 2}], 'JP')
+        self.assertEqual((elsewhere['shipping_zone'], elsewhere['shipping'], elsewhere['tax']), ('international', '25.00', '0.00'))
+
+    def test_countries_are_read_as_iso_codes(self):
+        items = [{'product_id': self.shirt.pk, 'quantity': 1}]
+        for country in ('United States', 'usa', ' us '):
+            quote = self.quote(items, country)
+            self.assertEqual((quote['country'], quote['shipping_zone'], quote['tax']), ('US', 'domestic', '1.60'))
+        self.assertEqual(self.quote(items, 'Côte d’Ivoire')['country'], 'CI')
+        # Not silently priced as "anywhere else"
+        for country in ('Atlantis', 'U.S. of A', 'XX'):
+            response = self.client.post('/api/cart/quote/', {'items': items, 'country': country}, format='json')
+            self.assertEqual(response.status_code, 400, country)
+            self.assertIn('country', response.data)
+
+    def test_missing_products_are_listed_not_priced(self):
+        quote = self.quote([{'product_id': self.shirt.pk, 'quantity': 1}, {'product_id': 999, 'quantity': 1}])
+        self.assertEqual(quote['missing'], [999])
+        self.assertEqual(quote['subtotal'], '19.99')
+
+    def test_rejects_bad_carts(self):
+        for body in ({'items': []}, {'items': [{'product_id': self.shirt.pk, 'quantity': 0}]}, {}):
+            self.assertEqual(self.client.post('/api/cart/quote/', body, format='json').status_code, 400)
+
+    def test_identical_carts_are_memoized_until_the_catalog_changes(self):
+        items = [{'product_id': self.shirt.pk, 'quantity': 2}, {'product_id': self.dress.pk, 'quantity': 1}]
+        # The catalog version and the products
+        with expect_queries(exact=2):
+            self.quote(items)
+        with expect_queries(exact=0):
+            self.assertEqual(self.quote(items[::-1])['subtotal'], '79.93')
+
+        shirt = Product.objects.get(pk=self.shirt.pk)
+        shirt.price = Decimal('10.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            shirt.save()
+        self.assertEqual(self.quote(items)['subtotal'], '59.95')
+
+    def test_changed_rules_are_applied(self):
+        items = [{'product_id': self.shirt.pk, 'quantity': 1}]
+        self.assertEqual(self.quote(items)['tax'], '1.60')
+        with override_settings(TAX_RATES={'US': '0.1', '*': '0'}):
+            self.assertEqual(self.quote(items)['tax'], '2.00')
+
+    def test_orders_are_priced_by_the_same_engine(self):
+        customer = User.objects.create_user('customer', 'customer@example.com', 'secret-pass-1')
+        self.client.force_authenticate(customer)
+        items = [{'product_id': self.shirt.pk, 'quantity': 3}, {'product_id': self.dress.pk, 'quantity': 1}]
+        response = self.client.post('/api/orders/', {'items': items, 'shipping_country': 'FR'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data['id'])
+        quote = self.quote(items, 'FR')
+        self.assertEqual(
+            [str(order.subtotal), str(order.shipping_cost), str(order.tax), str(order.total)],
+            [quote['subtotal'], quote['shipping'], quote['tax'], quote['total']],
+        )
+
+    def test_orders_store_the_country_code(self):
+        customer = User.objects.create_user('customer', 'customer@example.com', 'secret-pass-1')
+        self.client.force_authenticate(customer)
+        items = [{'product_id': self.shirt.pk, 'quantity': 1}]
+        response = self.client.post('/api/orders/', {'items': items, 'shipping_country': 'France'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get().shipping_country, 'FR')
+        response = self.client.post('/api/orders/', {'items': items, 'shipping_country': 'Narnia'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('shipping_country', response.data)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_price_lines_keeps_decimals_exact(self):
+        quote = price_lines([{'product_id': self.shirt.pk, 'quantity': 3}], load_products([self.shirt.pk]), 'JP')
+        self.assertEqual(quote['total'], Decimal('59.97') + Decimal('25.00'))
+
+
+@override_settings(SHIPPING_ZONES=ZONES, TAX_RATES=TAX_RATES)
+class PaymentIntentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'secret-pass-1')
+        category = Category.objects.create(name='Women', slug='women')
+        cls.shirt = Product.objects.create(name='Shirt', slug='shirt', description='Cotton', price='19.99', category=category)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def intent(self, body):
+        with mock.patch('stripe.PaymentIntent.create', return_value=mock.Mock(client_secret='secret')) as create:
+            response = self.client.post('/api/payment/create-payment-intent/', body, format='json')
+        return response, create
+
+    def test_charges_the_quote_not_the_client_amount(self):
+        response, create = self.intent({
+            'items': [{'product_id': self.shirt.pk, 'quantity': 2}], 'country': 'US', 'amount': '0.50',
+        })
+        self.assertEqual(response.status_code, 200)
+        # 39.98 + 10.00 shipping + 3.20 tax
+        self.assertEqual(create.call_args.kwargs['amount'], 5318)
+        self.assertEqual(create.call_args.kwargs['currency'], CURRENCY)
+
+    def test_charges_the_stored_total_of_own_orders_only(self):
+        order = Order.objects.create(user=self.customer, subtotal='12.34', total='12.34')
+        response, create = self.intent({'order_id': order.pk})
+        self.assertEqual(create.call_args.kwargs['amount'], 1234)
+
+        other = User.objects.create_user('other', 'other@example.com', 'secret-pass-2')
+        foreign = Order.objects.create(user=other, subtotal=99, total=99)
+        response, create = self.intent({'order_id': foreign.pk})
+        self.assertEqual(response.status_code, 400)
+        create.assert_not_called()
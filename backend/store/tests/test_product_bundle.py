@@ -0,0 +1,41 @@
+"""The product detail bundle at /api/products/<slug>/bundle/."""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from store.models import Category, Product, ProductImage, Review
+
+
+@override_settings(ALLOWED_HOSTS=['shop.example.com', 'localhost'])
+class ProductBundleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Women', slug='women')
+        cls.shirt = Product.objects.create(name='Shirt', slug='shirt', description='Cotton', price=20, category=category)
+        ProductImage.objects.create(product=cls.shirt, image='products/shirt.jpg', is_feature=True)
+        reviewer = User.objects.create_user('reviewer', 'reviewer@example.com', 'secret-pass-1')
+        Review.objects.create(product=cls.shirt, user=reviewer, title='Nice', content='Fits well', rating=4)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def gallery(self, **request):
+        response = self.client.get('/api/products/shirt/bundle/', **request)
+        self.assertEqual(response.status_code, 200)
+        return [image['image'] for image in response.data['images']]
+
+    def test_image_urls_follow_the_requesting_host_and_scheme(self):
+        [local] = self.gallery(HTTP_HOST='localhost')
+        [public] = self.gallery(HTTP_HOST='shop.example.com', secure=True)
+        self.assertTrue(local.startswith('http://localhost/'), local)
+        self.assertTrue(public.startswith('https://shop.example.com/'), public)
+        # Each answered from its own cache entry from then on
+        self.assertEqual(self.gallery(HTTP_HOST='localhost'), [local])
+
+    def test_a_sparse_request_does_not_narrow_the_cached_bundle(self):
+        self.assertEqual(self.client.get('/api/products/shirt/bundle/?fields=id', HTTP_HOST='localhost').status_code, 200)
+        bundle = self.client.get('/api/products/shirt/bundle/', HTTP_HOST='localhost').data
+        self.assertEqual(bundle['product']['name'], 'Shirt')
+        self.assertEqual(bundle['reviews']['results'][0]['title'], 'Nice')
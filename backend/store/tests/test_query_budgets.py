@@ -0,0 +1,257 @@
+"""Pinned query counts for every route in store/urls.py and store/api_urls.py.
+
+Each request runs through QueryBudgetMiddleware with QUERY_BUDGET_RAISE on, so
+a route that goes over its declared viewset budget or repeats a query from one
+call site fails here too. Counts are for a cold process (per-process caches and
+the shared cache are cleared before each request). When a count changes on
+purpose, update it here together with the view's `query_budgets`.
+"""
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import get_resolver
+from rest_framework.test import APIClient
+
+from store.category_tree import category_tree
+from store.fragments import product_fragments
+from store.models import (
+    Address, Category, Order, OrderItem, Product, ProductVariant, Review, ShippingAddress,
+    SubCategory, UserProfile, WishlistItem,
+)
+from store.query_budget import expect_queries
+from store.spelling import spelling
+from store.suggestions import suggestions
+
+API_APP = 'api-app/'
+
+
+def reset_process_caches():
+    cache.clear()
+    product_fragments.clear()
+    category_tree.tree = category_tree.version = None
+    suggestions.index = suggestions.version = None
+    spelling.index = spelling.version = None
+
+
+def leaf_routes(urlconf, prefix=''):
+    """Every route pattern in `urlconf`, without DRF's format-suffix duplicates"""
+    def walk(patterns, base):
+        for pattern in patterns:
+            if hasattr(pattern, 'url_patterns'):
+                yield from walk(pattern.url_patterns, base + str(pattern.pattern))
+            elif '(?P<format>' not in str(pattern.pattern):
+                yield base + str(pattern.pattern)
+    return set(walk(get_resolver(urlconf).url_patterns, prefix))
+
+
+@override_settings(
+    ROOT_URLCONF='store.tests.urls',
+    QUERY_BUDGET_ENABLED=True,
+    QUERY_BUDGET_RAISE=True,
+)
+class RouteQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', 'customer@example.com', 'secret-pass-1')
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'secret-pass-2', is_staff=True)
+        UserProfile.objects.create(user=cls.customer, bio='Hi')
+
+        cls.women = Category.objects.create(name='Women', slug='women')
+        cls.men = Category.objects.create(name='Men', slug='men')
+        cls.dresses = SubCategory.objects.create(name='Dresses', slug='dresses', category=cls.women)
+        SubCategory.objects.create(name='Shirts', slug='shirts', category=cls.men)
+
+        cls.products = [
+            Product.objects.create(
+                name=f'{color.title()} Cotton Shirt {number}', slug=f'{color}-shirt-{number}',
+                description='A soft cotton shirt', price=20 + number, sale_price=None if number % 2 else 15,
+                category=cls.women if number % 2 else cls.men, subcategory=cls.dresses if number % 2 else None,
+                sizes='S,M,L', colors=[color], featured=number < 2,
+            )
+            for number, color in enumerate(['black', 'white', 'red', 'blue', 'green', 'navy'])
+        ]
+        cls.product = cls.products[0]
+        # Stock-tracked in every size, so order creation reserves stock for one of the lines
+        for size in ('S', 'M', 'L'):
+            ProductVariant.objects.create(product=cls.product, size=size, color='black', stock=100)
+
+        other = User.objects.create_user('other', 'other@example.com', 'secret-pass-3')
+        cls.review = Review.objects.create(product=cls.product, user=cls.customer, rating=5, title='Great', content='Fits well')
+        for user, product in ((other, cls.product), (other, cls.products[1]), (cls.customer, cls.products[2])):
+            Review.objects.create(product=product, user=user, rating=4, title='Nice', content='Good')
+
+        cls.order = None
+        for _ in range(2):
+            order = Order.objects.create(user=cls.customer, subtotal=60, total=60)
+            for product in cls.products[:3]:
+                OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+            cls.order = cls.order or order
+
+        cls.wishlist_item = WishlistItem.objects.create(user=cls.customer, product=cls.product)
+        for product in cls.products[1:4]:
+            WishlistItem.objects.create(user=cls.customer, product=product)
+
+        cls.shipping_address = ShippingAddress.objects.create(
+            user=cls.customer, first_name='Ada', last_name='L', address='1 Main St',
+            city='Paris', postal_code='75001', country='FR',
+        )
+        cls.address = Address.objects.create(
+            user=cls.customer, address_line1='1 Main St', city='Paris', postal_code='75001', country='FR',
+        )
+
+    def setUp(self):
+        reset_process_caches()
+
+    def routes(self):
+        """(route pattern, method, path, user, data, expected status, expected queries)"""
+        product, order, review = self.product, self.order, self.review
+        customer, staff = self.customer, self.staff
+        return [
+            # --- store/urls.py: explicit product routes
+            ('api/products/search/', 'get', '/api/products/search/?q=shirt', None, None, 200, 4),
+            ('api/products/search-suggestions/', 'get', '/api/products/search-suggestions/?q=sh', None, None, 200, 5),
+            ('api/products/facets/', 'get', '/api/products/facets/', None, None, 200, 3),
+            ('api/products/<slug:slug>/bundle/', 'get', f'/api/products/{product.slug}/bundle/', customer, None, 200, 6),
+            # --- store/urls.py: router
+            ('api/^$', 'get', '/api/', None, None, 200, 0),
+            ('api/^categories/$', 'get', '/api/categories/', None, None, 200, 4),
+            ('api/^categories/(?P<pk>[^/.]+)/$', 'get', f'/api/categories/{self.women.pk}/', None, None, 200, 3),
+            ('api/^products/$', 'get', '/api/products/', None, None, 200, 4),
+            ('api/^products/$', 'get', '/api/products/?featured=true&size=m&color=black', None, None, 200, 4),
+            ('api/^products/$', 'get', '/api/products/?cursor=&sort_by=price_asc', None, None, 200, 3),
+            ('api/^products/(?P<slug>[-\\w]+)/bundle/$', 'get', f'/api/products/{product.slug}/bundle/', None, None, 200, 5),
+            ('api/^products/facets/$', 'get', '/api/products/facets/?category=1', None, None, 200, 3),
+            ('api/^products/(?P<slug>[-\\w]+)/$', 'get', f'/api/products/{product.slug}/', None, None, 200, 3),
+            ('api/^products/search/$', 'get', '/api/products/search/?q=cotton', None, None, 200, 4),
+            ('api/^products/search-suggestions/$', 'get', '/api/products/search-suggestions/?q=co', None, None, 200, 5),
+            # Shadowed by the slug route above: /api/products/<pk>/ is looked up as a slug
+            ('api/^products/(?P<pk>[^/.]+)/$', 'get', f'/api/products/{product.pk}/', None, None, 404, 2),
+            ('api/^orders/$', 'get', '/api/orders/', customer, None, 200, 2),
+            ('api/^orders/(?P<pk>[^/.]+)/$', 'get', f'/api/orders/{order.pk}/', customer, None, 200, 2),
+            # Products and their variants in two IN queries, stock for every line in one UPDATE and
+            # the in_stock check, the order and all its lines in two INSERTs (plus the savepoint pair)
+            ('api/^orders/$', 'post', '/api/orders/', customer, {'items': [
+                {'product_id': product.pk, 'quantity': 2, 'size': 'M'} for product in self.products
+            ]}, 201, 8),
+            ('api/^reviews/$', 'get', '/api/reviews/', None, None, 200, 2),
+            ('api/^reviews/$', 'get', f'/api/reviews/?product={product.pk}', None, None, 200, 2),
+            ('api/^reviews/(?P<pk>[^/.]+)/$', 'get', f'/api/reviews/{review.pk}/', None, None, 200, 1),
+            ('api/^shipping-addresses/$', 'get', '/api/shipping-addresses/', customer, None, 200, 2),
+            ('api/^shipping-addresses/(?P<pk>[^/.]+)/$', 'get', f'/api/shipping-addresses/{self.shipping_address.pk}/', customer, None, 200, 1),
+            ('api/^wishlist/$', 'get', '/api/wishlist/', customer, None, 200, 4),
+            ('api/^wishlist/check/(?P<product_pk>[^/.]+)/$', 'get', f'/api/wishlist/check/{product.pk}/', customer, None, 200, 2),
+            ('api/^wishlist/(?P<pk>[^/.]+)/$', 'get', f'/api/wishlist/{self.wishlist_item.pk}/', customer, None, 200, 1),
+            # UserProfileViewSet has no queryset, and its PUT-only `me` replaced the GET one
+            ('api/^users/profile/$', 'get', '/api/users/profile/', customer, None, 500, 0),
+            ('api/^users/profile/me/$', 'get', '/api/users/profile/me/', customer, None, 405, 0),
+            ('api/^users/profile/(?P<pk>[^/.]+)/$', 'get', f'/api/users/profile/{customer.profile.pk}/', customer, None, 500, 0),
+            ('api/^addresses/$', 'get', '/api/addresses/', customer, None, 200, 2),
+            ('api/^addresses/(?P<pk>[^/.]+)/$', 'get', f'/api/addresses/{self.address.pk}/', customer, None, 200, 1),
+            # Shadowed by reviews/<pk>/: "my-reviews" is looked up as a review pk
+            ('api/^reviews/my-reviews/$', 'get', '/api/reviews/my-reviews/', customer, None, 404, 0),
+            ('api/^reviews/my-reviews/(?P<pk>[^/.]+)/$', 'get', f'/api/reviews/my-reviews/{review.pk}/', customer, None, 200, 1),
+            ('api/^subcategories/$', 'get', '/api/subcategories/', None, None, 200, 3),
+            ('api/^subcategories/(?P<pk>[^/.]+)/$', 'get', f'/api/subcategories/{self.dresses.pk}/', None, None, 200, 2),
+            # --- store/urls.py: template views and payments
+            ('products/', 'get', '/products/', None, None, 200, 0),
+            ('products/<slug:slug>/', 'get', f'/products/{product.slug}/', None, None, 200, 1),
+            # Shadowed by the admin site, which is mounted at admin/ first
+            ('admin/products/fancy-upload/', 'get', '/admin/products/fancy-upload/', staff, None, 404, 2),
+            ('admin/products/create/', 'get', '/admin/products/create/', staff, None, 404, 2),
+            # Products in one IN query; the shared cache answers the repeat of the same cart
+            ('api/cart/quote/', 'post', '/api/cart/quote/', None, {'items': [
+                {'product_id': product.pk, 'quantity': 2} for product in self.products
+            ], 'country': 'US'}, 200, 2),
+            # The key lookup, the order as POST /api/orders/ places it and the payment intent recorded on it
+            ('api/checkout/', 'post', '/api/checkout/', customer, {'items': [
+                {'product_id': product.pk, 'quantity': 1, 'size': 'M'} for product in self.products
+            ]}, 201, 10),
+            ('api/payment/create-payment-intent/', 'post', '/api/payment/create-payment-intent/', customer, {'order_id': order.pk}, 200, 1),
+            ('api/payment/webhook/', 'post', '/api/payment/webhook/', None, {}, 400, 0),
+            ('metrics', 'get', '/metrics', None, None, 200, 0),
+            # --- store/api_urls.py
+            # The `me` action saves the profile even on GET
+            ('users/profile/', 'get', f'/{API_APP}users/profile/', customer, None, 200, 1),
+            ('bulk-upload/', 'post', f'/{API_APP}bulk-upload/', staff, {'products': '[]'}, 400, 2),
+            # profile_picture is returned as a file object, which doesn't encode
+            ('users/me/', 'get', f'/{API_APP}users/me/', customer, None, 500, 0),
+            ('^$', 'get', f'/{API_APP}', None, None, 200, 0),
+            ('^categories/$', 'get', f'/{API_APP}categories/', None, None, 200, 4),
+            ('^categories/(?P<pk>[^/.]+)/$', 'get', f'/{API_APP}categories/{self.women.pk}/', None, None, 200, 3),
+            ('^products/$', 'get', f'/{API_APP}products/', None, None, 200, 4),
+            ('^products/(?P<slug>[-\\w]+)/bundle/$', 'get', f'/{API_APP}products/{product.slug}/bundle/', None, None, 200, 5),
+            ('^products/facets/$', 'get', f'/{API_APP}products/facets/', None, None, 200, 3),
+            ('^products/(?P<slug>[-\\w]+)/$', 'get', f'/{API_APP}products/{product.slug}/', None, None, 200, 3),
+            # Without the explicit paths of store/urls.py, search and suggestions are looked up as slugs
+            ('^products/search/$', 'get', f'/{API_APP}products/search/?q=shirt', None, None, 404, 2),
+            ('^products/search-suggestions/$', 'get', f'/{API_APP}products/search-suggestions/?q=sh', None, None, 404, 2),
+            ('^products/(?P<pk>[^/.]+)/$', 'get', f'/{API_APP}products/{product.pk}/', None, None, 404, 2),
+            ('^orders/$', 'get', f'/{API_APP}orders/', customer, None, 200, 2),
+            ('^orders/(?P<pk>[^/.]+)/$', 'get', f'/{API_APP}orders/{order.pk}/', customer, None, 200, 2),
+            ('^reviews/$', 'get', f'/{API_APP}reviews/', None, None, 200, 2),
+            ('^reviews/(?P<pk>[^/.]+)/$', 'get', f'/{API_APP}reviews/{review.pk}/', None, None, 200, 1),
+            ('^shipping-addresses/$', 'get', f'/{API_APP}shipping-addresses/', customer, None, 200, 2),
+            ('^shipping-addresses/(?P<pk>[^/.]+)/$', 'get', f'/{API_APP}shipping-addresses/{self.shipping_address.pk}/', customer, None, 200, 1),
+            ('^wishlist/$', 'get', f'/{API_APP}wishlist/', customer, None, 200, 4),
+            ('^wishlist/check/(?P<product_pk>[^/.]+)/$', 'get', f'/{API_APP}wishlist/check/{product.pk}/', customer, None, 200, 2),
+            ('^wishlist/(?P<pk>[^/.]+)/$', 'get', f'/{API_APP}wishlist/{self.wishlist_item.pk}/', customer, None, 200, 1),
+            ('^users/profile/$', 'get', f'/{API_APP}users/profile/', customer, None, 200, 1),
+            ('^users/profile/me/$', 'get', f'/{API_APP}users/profile/me/', customer, None, 405, 0),
+            ('^users/profile/(?P<pk>[^/.]+)/$', 'get', f'/{API_APP}users/profile/{customer.profile.pk}/', customer, None, 500, 0),
+            ('^addresses/$', 'get', f'/{API_APP}addresses/', customer, None, 200, 2),
+            ('^addresses/(?P<pk>[^/.]+)/$', 'get', f'/{API_APP}addresses/{self.address.pk}/', customer, None, 200, 1),
+            ('^reviews/my-reviews/$', 'get', f'/{API_APP}reviews/my-reviews/', customer, None, 404, 0),
+            ('^reviews/my-reviews/(?P<pk>[^/.]+)/$', 'get', f'/{API_APP}reviews/my-reviews/{review.pk}/', customer, None, 200, 1),
+            ('^subcategories/$', 'get', f'/{API_APP}subcategories/', None, None, 200, 3),
+            ('^subcategories/(?P<pk>[^/.]+)/$', 'get', f'/{API_APP}subcategories/{self.dresses.pk}/', None, None, 200, 2),
+        ]
+
+    def client_for(self, path, user):
+        client = APIClient(raise_request_exception=False)
+        # Required by /api/checkout/, ignored everywhere else
+        client.credentials(HTTP_IDEMPOTENCY_KEY='query-budgets')
+        if user is not None:
+            if path.startswith('/admin/'):
+                client.force_login(user)
+            else:
+                client.force_authenticate(user)
+        return client
+
+    def request(self, client, method, path, data):
+        with mock.patch('stripe.PaymentIntent.create', return_value=mock.Mock(id='pi_budget', client_secret='secret')):
+            if data is None:
+                return getattr(client, method)(path)
+            return getattr(client, method)(path, data, format='json')
+
+    def test_every_route_is_pinned(self):
+        pinned = {route for route, *_ in self.routes()}
+        expected = leaf_routes('store.urls') | leaf_routes('store.api_urls')
+        self.assertEqual(expected - pinned, set(), 'routes without a pinned query count')
+
+    def test_route_query_counts(self):
+        for route, method, path, user, data, expected_status, expected_queries in self.routes():
+            with self.subTest(route=route, path=path):
+                client = self.client_for(path, user)
+                reset_process_caches()
+                with expect_queries(exact=expected_queries):
+                    response = self.request(client, method, path, data)
+                self.assertEqual(response.status_code, expected_status)
+
+    def test_warm_catalog_reads_skip_the_database(self):
+        # Cached trees, suggestion indexes and product fragments leave only the page/key queries;
+        # cold, the catalog version is read from the database too
+        for path, cold, warm in (
+            ('/api/categories/', 4, 0),
+            ('/api/products/search-suggestions/?q=sh', 5, 0),
+            ('/api/products/', 4, 2),
+            (f'/api/products/{self.product.slug}/bundle/', 5, 0),
+        ):
+            with self.subTest(path=path):
+                client = self.client_for(path, None)
+                reset_process_caches()
+                with expect_queries(exact=cold):
+                    self.request(client, 'get', path, None)
+                with expect_queries(exact=warm):
+                    self.request(client, 'get', path, None)
@@ -0,0 +1,64 @@
+"""Stored product rating aggregates (store.ratings) kept in step with reviews."""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from store.models import Category, Product, Review
+from store.ratings import rebuild_rating_aggregates
+
+
+class RatingAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Women', slug='women')
+        cls.shirt = Product.objects.create(name='Shirt', slug='shirt', description='Cotton', price=20, category=category)
+        cls.dress = Product.objects.create(name='Dress', slug='dress', description='Linen', price=40, category=category)
+        cls.users = [
+            User.objects.create_user(f'reviewer-{n}', f'reviewer-{n}@example.com', 'secret-pass-1') for n in range(3)
+        ]
+
+    def review(self, user, rating, product=None):
+        return Review.objects.create(
+            product=product or self.shirt, user=user, title='Review', content='Text', rating=rating,
+        )
+
+    def aggregates(self, product=None):
+        product = Product.objects.get(pk=(product or self.shirt).pk)
+        return product.review_count, product.average_rating, product.rating_histogram
+
+    def test_reviews_shift_the_aggregates(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 4)
+        first = self.review(self.users[2], 2)
+        self.assertEqual(self.aggregates(), (3, Decimal('3.67'), {'1': 0, '2': 1, '3': 0, '4': 1, '5': 1}))
+
+        first.rating = 3
+        first.save()
+        self.assertEqual(self.aggregates(), (3, Decimal('4.00'), {'1': 0, '2': 0, '3': 1, '4': 1, '5': 1}))
+
+        # Saving without a rating change leaves them alone
+        first.title = 'Edited'
+        first.save()
+        self.assertEqual(self.aggregates()[:2], (3, Decimal('4.00')))
+
+        first.delete()
+        self.assertEqual(self.aggregates(), (2, Decimal('4.50'), {'1': 0, '2': 0, '3': 0, '4': 1, '5': 1}))
+
+    def test_moving_a_review_updates_both_products(self):
+        review = self.review(self.users[0], 1)
+        review.product = self.dress
+        review.save()
+        self.assertEqual(self.aggregates(), (0, Decimal('0.00'), {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0}))
+        self.assertEqual(self.aggregates(self.dress)[:2], (1, Decimal('1.00')))
+
+    def test_rebuild_matches_the_incremental_updates(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 2)
+        self.review(self.users[2], 4, product=self.dress)
+        expected = [self.aggregates(), self.aggregates(self.dress)]
+
+        # Drift the stored values, then recompute them from the reviews table
+        Product.objects.update(review_count=9, average_rating=1, rating_5_count=9)
+        self.assertEqual(rebuild_rating_aggregates(batch_size=1), 2)
+        self.assertEqual([self.aggregates(), self.aggregates(self.dress)], expected)
@@ -0,0 +1,65 @@
+"""Full-text product search through /api/products/search/."""
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from store.models import Category, Product
+
+
+class SearchPagingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Women', slug='women')
+        # Name matches rank above description matches; the identical descriptions tie on rank
+        names = ['Cotton shirt', 'Cotton dress', 'Linen shirt', 'Linen dress', 'Wool scarf', 'Silk scarf', 'Cotton tee']
+        cls.products = [
+            Product.objects.create(
+                name=name, slug=f'product-{n}', price=20 + n, category=category,
+                description='Soft cotton blend' if not name.startswith('Cotton') else 'Everyday basics',
+            )
+            for n, name in enumerate(names)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def search(self, q='cotton', **params):
+        response = self.client.get('/api/products/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_relevance_cursor_walks_every_page(self):
+        everything = [product['id'] for product in self.search(cursor='', limit=48)['results']]
+        self.assertEqual(len(everything), len(self.products))
+
+        walked, page, cursor = [], None, ''
+        for _ in range(len(self.products)):
+            page = self.search(cursor=cursor, limit=2)
+            walked += [product['id'] for product in page['results']]
+            if not page['has_next']:
+                break
+            cursor = page['next_cursor']
+        self.assertFalse(page['has_next'])
+        self.assertEqual(walked, everything)
+        # Name matches first
+        self.assertEqual(
+            {product.name for product in self.products if product.pk in everything[:3]},
+            {'Cotton shirt', 'Cotton dress', 'Cotton tee'},
+        )
+
+    def test_rejects_garbled_cursors(self):
+        self.assertEqual(self.client.get('/api/products/search/', {'q': 'cotton', 'cursor': 'nonsense'}).status_code, 404)
+
+    def test_corrected_searches_page_on_the_correction(self):
+        everything = [product['id'] for product in self.search(limit=48)['results']]
+
+        first = self.search('cottn', limit=2)
+        self.assertEqual(first['did_you_mean']['query'], 'cotton')
+        second = self.search('cottn', limit=2, page=2)
+        self.assertEqual(second['did_you_mean']['query'], 'cotton')
+        self.assertEqual([product['id'] for product in first['results'] + second['results']], everything[:4])
+
+        page = self.search('cottn', cursor='', limit=2)
+        page = self.search('cottn', cursor=page['next_cursor'], limit=2)
+        self.assertEqual([product['id'] for product in page['results']], everything[2:4])
@@ -0,0 +1,8 @@
+"""The site URLs plus store.api_urls (not mounted by backend.urls) under api-app/"""
+from django.urls import include, path
+
+from backend.urls import urlpatterns as site_urlpatterns
+
+urlpatterns = site_urlpatterns + [
+    path('api-app/', include('store.api_urls')),
+]
@@ -30,12 +30,16 @@ router.register(r'subcategories', views.SubCategoryViewSet, basename='subcategor
 # Explicitly add the search routes
 product_search = ProductViewSet.as_view({'get': 'search'})
 product_suggestions = ProductViewSet.as_view({'get': 'search_suggestions'})
+product_facets = ProductViewSet.as_view({'get': 'facets'})
+product_bundle = ProductViewSet.as_view({'get': 'bundle'})
 
 # Define URL patterns
 urlpatterns = [
     # IMPORTANT: Place explicit routes BEFORE the router.urls include
     path('api/products/search/', product_search, name='product-search'),
     path('api/products/search-suggestions/', product_suggestions, name='product-suggestions'),
+    path('api/products/facets/', product_facets, name='product-facets'),
+    path('api/products/<slug:slug>/bundle/', product_bundle, name='product-bundle'),
     
     # REST API endpoints (now after the explicit routes)
     path('api/', include(router.urls)),
@@ -48,7 +52,14 @@ urlpatterns = [
     path('admin/products/fancy-upload/', views.fancy_product_upload, name='fancy_product_upload'),
     path('admin/products/create/', views.product_create, name='product_create'),
 
+    # Cart pricing
+    path('api/cart/quote/', views.cart_quote, name='cart-quote'),
+
     # Payment URLs
+    path('api/checkout/', views.CheckoutView.as_view(), name='checkout'),
     path('api/payment/create-payment-intent/', views.create_payment_intent, name='create-payment-intent'),
     path('api/payment/webhook/', views.stripe_webhook, name='stripe-webhook'),
+
+    # Prometheus metrics
+    path('metrics', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
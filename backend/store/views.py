@@ -1,17 +1,33 @@
 from django.contrib.auth.models import User
 from django.contrib.auth import get_user_model
 from rest_framework import viewsets, status, filters, permissions
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser, BasePermission
 from rest_framework.authtoken.models import Token
 from django.utils.text import slugify
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
-from .models import Review, Product, Category, Order, OrderItem, ShippingAddress, WishlistItem, UserProfile, Address, SubCategory, ProductImage
+from django.utils.cache import patch_cache_control
+from .models import Review, Product, Category, Order, OrderItem, ShippingAddress, WishlistItem, UserProfile, Address, SubCategory, ProductImage, ProductAttribute
+from .attributes import filter_by_attributes, parse_colors, parse_filter_values
+from .category_tree import category_tree, with_absolute_images
+from .conditional import catalog_validators, conditional_get, product_slug_validators
+from .facets import get_facets
+from .fieldsets import Fieldset, SparseFieldsetViewMixin
+from .fragments import FragmentJSONRenderer, fragment_keys, product_fragments
+from .inventory import OutOfStock, reserve_again
+from .metrics import TimedTokenAuthentication, phase, registry
+from .pricing import CURRENCY, quote_cart, quote_data
+from .product_bundle import get_public_bundle, get_viewer_state
+from .search import search_products
+from .spelling import spelling
+from .suggestions import suggestions
 from .serializers import (
     RegisterSerializer, 
     CategorySerializer, 
@@ -22,88 +38,106 @@ from .serializers import (
     WishlistItemSerializer,
     UserProfileSerializer,
     AddressSerializer,
-    SubCategorySerializer
+    SubCategorySerializer,
+    CartQuoteSerializer
 )
+import hashlib
 import json
+import logging
 import os
 import uuid
-import traceback
 import stripe
-from django.db.models import Q
-from .pagination import CustomPagination
+from django.db.models import F
+from django.db.models.functions import Now
+from .pagination import CustomPagination, OrderHistoryPagination
+from django.http import HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from rest_framework import filters
 from django_filters.rest_framework import DjangoFilterBackend
 
+logger = logging.getLogger(__name__)
+
 # Initialize Stripe
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
-def calculate_order_total(order_data):
-    """Calculate the total amount for an order including shipping and tax"""
-    # If the client sends the pre-calculated amount, use that
-    if 'amount' in order_data and order_data['amount']:
-        return float(order_data['amount'])
-    
-    # Otherwise calculate from order_id
-    if 'order_id' in order_data:
+def calculate_order_total(order_data, user):
+    """
+    The amount to charge, from store.pricing: the stored total of one of the user's
+    orders (priced by it at creation) or a quote for the cart sent. Amounts sent by
+    the client are never trusted.
+    """
+    if order_data.get('order_id'):
         try:
-            order = Order.objects.get(id=order_data['order_id'])
-            return float(order.total)
-        except Order.DoesNotExist:
+            return Order.objects.only('total').get(pk=order_data['order_id'], user=user).total
+        except (Order.DoesNotExist, ValueError):
             raise ValueError(f"Order with ID {order_data['order_id']} not found")
-    
-    # If neither amount nor order_id provided, calculate from items
-    subtotal = 0
-    items = order_data.get('items', [])
-    
-    for item in items:
-        product_id = item.get('product_id') or item.get('product')
-        quantity = item.get('quantity', 1)
-        
-        try:
-            product = Product.objects.get(id=product_id)
-            price = float(product.sale_price or product.price)
-            subtotal += price * quantity
-        except Product.DoesNotExist:
-            print(f"Product {product_id} not found")
-    
-    # Add shipping and tax
-    shipping = 0.00  # Free shipping
-    tax = subtotal * 0.1  # 10% tax
-    
-    return subtotal + shipping + tax
+
+    cart = CartQuoteSerializer(data=order_data)
+    if not cart.is_valid():
+        raise ValueError(cart.errors)
+    quote = quote_cart(cart.validated_data['items'], cart.validated_data['country'])
+    if quote['missing']:
+        raise ValueError(f"Unknown product ids: {', '.join(map(str, quote['missing']))}")
+    return quote['total']
+
+def search_highlights(fieldset=None):
+    """Per-row extra keys for product fragments: the FTS highlight/snippet annotations"""
+    names = [name for name in ('search_highlight', 'search_snippet') if fieldset is None or fieldset.includes(name)]
+    return lambda row: {name: row.get(name) for name in names}
 
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    # Queries allowed per action (store.query_budget); room is left for session auth
+    query_budgets = {'list': 5, 'retrieve': 4}
     permission_classes = [permissions.AllowAny]
     
+    @conditional_get(catalog_validators)
+    def list(self, request, *args, **kwargs):
+        """Served from the cached category tree (with product counts) - no DB queries"""
+        nodes = category_tree.get()
+        
+        # Add slug filtering
+        slug = request.query_params.get('slug')
+        if slug:
+            nodes = [node for node in nodes if node['slug'] == slug]
+        nodes = with_absolute_images(nodes, request)
+        
+        page = self.paginate_queryset(nodes)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(nodes)
+    
+    @conditional_get(catalog_validators)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     def get_queryset(self):
-        queryset = Category.objects.all()
+        queryset = Category.objects.prefetch_related('subcategories')
         
         # Add slug filtering
         slug = self.request.query_params.get('slug')
         if slug:
             queryset = queryset.filter(slug=slug)
-            print(f"Filtering categories by slug: {slug}")
-    
-        # Debug information
-        print(f"Returning {queryset.count()} categories")
-        for cat in queryset:
-            print(f"  - {cat.name} (ID: {cat.id}, slug: {cat.slug})")
-            
         return queryset
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for products
     """
     serializer_class = ProductSerializer
+    # List and search responses are assembled from pre-encoded product fragments
+    renderer_classes = [FragmentJSONRenderer, BrowsableAPIRenderer]
+    query_budgets = {
+        'list': 5, 'retrieve': 4, 'get_by_slug': 4, 'bundle': 7,
+        'facets': 4, 'search': 5, 'search_suggestions': 6,
+    }
     filter_backends = [filters.OrderingFilter, DjangoFilterBackend, filters.SearchFilter] 
     ordering_fields = ['created_at', 'price', 'name'] 
-    ordering = ['-created_at'] 
+    # No default `ordering` here: OrderingFilter would apply it on top of get_queryset
+    # and silently override sort_by. get_queryset falls back to newest-first itself.
 
     # CONSOLIDATED get_permissions (ensure the other definition is removed from your file)
     def get_permissions(self):
@@ -114,59 +148,57 @@ class ProductViewSet(viewsets.ModelViewSet):
         return [permissions.AllowAny()]
     
     def get_queryset(self):
-        queryset = Product.objects.all() \
-                                 .select_related('category') \
-                                 .prefetch_related('images')
+        # No images prefetch: the product serializers only use the main image column
+        queryset = Product.objects.all().select_related('category')
         
         # Get category parameter and apply filtering by category ID
         category_param = self.request.query_params.get('category')
         if category_param:
             try:
                 category_id = int(category_param)
-                print(f"Filtering products by category ID: {category_id}")
+                logger.debug("Filtering products by category ID: %s", category_id)
                 queryset = queryset.filter(category_id=category_id)
-                print(f"Found {queryset.count()} products in category {category_id}")
             except (ValueError, TypeError):
-                print(f"Invalid category ID: {category_param}")
+                logger.debug("Invalid category ID: %s", category_param)
                 return Product.objects.none()
         
-        # Size filtering - FIXED VERSION
-        size_param = self.request.query_params.get('size')
-        if size_param:
-            print(f"Filtering products by size: {size_param}")
-            
-            # Use a more flexible approach with Q objects to handle different data formats
-            from django.db.models import Q
-            
-            size_query = (
-                Q(sizes__contains=[size_param]) |  # For JSONField/ArrayField with exact array items
-                Q(sizes__contains=size_param) |     # For JSONField with string within JSON
-                Q(sizes__icontains=f'"{size_param}"') |  # For JSONField with quoted strings
-                Q(sizes__icontains=f',{size_param},') |  # For comma-separated list in the middle
-                Q(sizes__istartswith=f'{size_param},') | # For comma-separated list at start
-                Q(sizes__iendswith=f',{size_param}') |   # For comma-separated list at end
-                Q(sizes__iexact=size_param)              # For exact match (single size)
-            )
-            
-            queryset = queryset.filter(size_query)
-            print(f"Found {queryset.count()} products with size {size_param}")
+        subcategory_param = self.request.query_params.get('subcategory')
+        if subcategory_param:
+            try:
+                queryset = queryset.filter(subcategory_id=int(subcategory_param))
+            except (ValueError, TypeError):
+                logger.debug("Invalid subcategory ID: %s", subcategory_param)
+                return Product.objects.none()
+        
+        # Size/color filtering through the indexed ProductAttribute table.
+        # Several values are ORed (?size=S,M), different attributes are ANDed.
+        sizes = parse_filter_values(self.request.query_params.get('size'))
+        if sizes:
+            logger.debug("Filtering products by size: %s", sizes)
+            queryset = filter_by_attributes(queryset, ProductAttribute.SIZE, sizes)
+        
+        colors = parse_filter_values(self.request.query_params.get('color'))
+        if colors:
+            logger.debug("Filtering products by color: %s", colors)
+            queryset = filter_by_attributes(queryset, ProductAttribute.COLOR, colors)
     
         # Filter by featured status
         featured_param = self.request.query_params.get('featured')
         if featured_param and featured_param.lower() == 'true':
             queryset = queryset.filter(featured=True)
             
-        # Handle sorting
+        # Handle sorting. Every order ends on id so it is total, which keyset
+        # pagination (?cursor=) relies on; each one has a matching composite index.
         sort_by_param = self.request.query_params.get('sort_by')
         if sort_by_param == 'newest':
-            queryset = queryset.order_by('-created_at') 
+            queryset = queryset.order_by('-created_at', '-id') 
         elif sort_by_param == 'price_asc':
-            queryset = queryset.order_by('price')
+            queryset = queryset.order_by('price', 'id')
         elif sort_by_param == 'price_desc':
-            queryset = queryset.order_by('-price')
+            queryset = queryset.order_by('-price', '-id')
         elif not sort_by_param and not self.request.query_params.get('ordering'):
             # Default ordering if no specific sort_by or DRF 'ordering' param is provided
-            queryset = queryset.order_by('-created_at')
+            queryset = queryset.order_by('-created_at', '-id')
         # Note: If 'rest_framework.filters.OrderingFilter' is active (which it is in your filter_backends),
         # it will also look for an 'ordering' query parameter. The logic here for 'sort_by'
         # can coexist or you might choose to rely solely on OrderingFilter.
@@ -178,16 +210,27 @@ class ProductViewSet(viewsets.ModelViewSet):
             try:
                 queryset = queryset.filter(price__gte=float(min_price_param))
             except ValueError:
-                print(f"Invalid min_price parameter: {min_price_param}")
+                logger.debug("Invalid min_price parameter: %s", min_price_param)
         if max_price_param:
             try:
                 queryset = queryset.filter(price__lte=float(max_price_param))
             except ValueError:
-                print(f"Invalid max_price parameter: {max_price_param}")
+                logger.debug("Invalid max_price parameter: %s", max_price_param)
         
-        print(f"Final queryset count before pagination: {queryset.count()}")
         return queryset
         
+    # Conditional GET: 304 before any queryset work when the client copy is current
+    @conditional_get(catalog_validators)
+    def list(self, request, *args, **kwargs):
+        # Page through (id, updated_at) keys only; the products come from the fragment cache
+        queryset = fragment_keys(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        rows = queryset if page is None else page
+        data = product_fragments.render(rows, request)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+    
     # Add explicit delete method to ensure it works
     def destroy(self, request, *args, **kwargs):
         try:
@@ -201,10 +244,11 @@ class ProductViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=False, methods=['get'], url_path=r'(?P<slug>[-\w]+)', permission_classes=[permissions.AllowAny])
+    @conditional_get(product_slug_validators)
     def get_by_slug(self, request, slug=None):
         """Get a product by its slug"""
         try:
-            product = Product.objects.get(slug=slug)
+            product = self.trim_to_fieldset(Product.objects.select_related('category')).get(slug=slug)
             serializer = self.get_serializer(product)
             return Response(serializer.data)
         except Product.DoesNotExist:
@@ -251,53 +295,92 @@ class ProductViewSet(viewsets.ModelViewSet):
         # ProductImage.objects.create(product=product_instance, image=img_file)
 
 
+    @action(detail=False, methods=['get'], url_path=r'(?P<slug>[-\w]+)/bundle', permission_classes=[permissions.AllowAny])
+    def bundle(self, request, slug=None):
+        """
+        Product detail page in one round trip: product, gallery, rating summary,
+        first page of reviews, related products, and the viewer's wishlist state.
+        """
+        public = get_public_bundle(slug, request)
+        if public is None:
+            return Response({"detail": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+        
+        response = Response(dict(public, viewer=get_viewer_state(public['product']['id'], request.user)))
+        # The viewer block is per user, so only the client may keep this response
+        patch_cache_control(response, private=True, max_age=0)
+        return response
+
+    @action(detail=False, methods=['get'], url_path='facets')
+    def facets(self, request):
+        """Filter sidebar counts (category, subcategory, size, color, price range) for the current filters"""
+        return Response(get_facets(self.get_queryset(), request.query_params))
+
     @action(detail=False, methods=['get'], url_path='search')
     def search(self, request):
-        """Search products by query term"""
+        """
+        Full-text product search ranked by relevance.
+        
+        Combines with the regular listing filters (category, size, color, price...).
+        Results are ordered by BM25 rank unless an explicit sort_by is given.
+        When nothing matches, the query is spell-corrected and the corrected
+        results are returned with a `did_you_mean` block, saving the client a retry.
+        Later pages (?page=, ?cursor=) keep the original q and are corrected the same way.
+        """
         q = request.query_params.get('q', '')
         if not q:
             return Response({"detail": "Search query is required"}, status=status.HTTP_400_BAD_REQUEST)
         
-        queryset = Product.objects.filter(
-            Q(name__icontains=q) | 
-            Q(description__icontains=q) |
-            Q(category__name__icontains=q)
-        ).select_related('category').prefetch_related('images')
+        queryset = self.get_queryset()
+        ranked = self.rank_search(queryset, q)
+        page = rows = None
+        if not request.query_params.get('page') and not request.query_params.get('cursor'):
+            page = self.paginate_queryset(ranked)
+            rows = ranked if page is None else page
+            misspelled = not rows
+        else:
+            # Paging the original q past its (empty) first page would only 404
+            misspelled = not ranked.exists()
+        
+        did_you_mean = None
+        if misspelled:
+            corrected, matches = spelling.did_you_mean(q)
+            did_you_mean = {'query': corrected, 'matches': matches}
+            if corrected:
+                ranked = self.rank_search(queryset, corrected)
+                rows = None
+        if rows is None:
+            page = self.paginate_queryset(ranked)
+            rows = ranked if page is None else page
         
-        # Apply regular pagination
-        page = self.paginate_queryset(queryset)
+        data = product_fragments.render(rows, request, extra=search_highlights(Fieldset.from_request(request)))
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            response = self.get_paginated_response(data)
+            if did_you_mean is not None:
+                response.data['did_you_mean'] = did_you_mean
+            return response
         
-        # Return non-paginated response if pagination is disabled
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        # Non-paginated response if pagination is disabled
+        if did_you_mean is not None:
+            return Response({'results': data, 'did_you_mean': did_you_mean})
+        return Response(data)
+    
+    def rank_search(self, queryset, q):
+        ranked = search_products(queryset, q)
+        if self.request.query_params.get('sort_by'):
+            # Keep the ordering get_queryset chose for this sort_by
+            ranked = ranked.order_by(*queryset.query.order_by)
+        # Fragment keys, keeping rank/highlight/snippet when FTS added them
+        return fragment_keys(ranked, *ranked.query.extra_select)
 
     @action(detail=False, methods=['get'], url_path='search-suggestions')
     def search_suggestions(self, request):
-        """Get search suggestions for autocomplete"""
+        """Get search suggestions for autocomplete (served from the in-memory index)"""
         q = request.query_params.get('q', '')
         if not q or len(q) < 2:  # Require at least 2 characters for suggestions
             return Response([])
         
-        # Get product name suggestions
-        product_suggestions = Product.objects.filter(
-            name__icontains=q
-        ).values_list('name', flat=True).distinct()[:5]
-        
-        # Get category suggestions
-        category_suggestions = Category.objects.filter(
-            name__icontains=q
-        ).values_list('name', flat=True).distinct()[:3]
-        
-        # Combine suggestions
-        suggestions = list(product_suggestions) + list(category_suggestions)
-        
-        # Limit to top 8 suggestions
-        suggestions = suggestions[:8]
-        
-        return Response(suggestions)
+        # Up to 5 product names then 3 category/subcategory names, most popular first
+        return Response(suggestions.suggest(q))
 
 class RegisterView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -367,13 +450,21 @@ class RegisterView(APIView):
 
 # DELETE your entire old OrderViewSet and REPLACE it with this:
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderHistoryPagination
+    query_budgets = {'list': 4, 'retrieve': 3, 'create': 9}
 
     def get_queryset(self):
         # Only return orders for the current user!
-        return Order.objects.filter(user=self.request.user)
+        # Lines carry snapshots of their products, so one prefetch of the items is all the
+        # serializer needs. Newest first, served by store_order_user_created_idx
+        return (
+            Order.objects.filter(user=self.request.user)
+            .order_by('-created_at', '-id')
+            .prefetch_related('items')
+        )
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -388,39 +479,35 @@ class BulkProductUploadView(APIView):
     @transaction.atomic
     def post(self, request):
         try:
-            # Debug the request data
-            print("Request data keys:", request.data.keys())
-            print("User:", request.user.username)
-            print("Is staff:", request.user.is_staff)
-            print("Auth:", request.auth)
+            logger.debug(
+                "Bulk upload by %s (staff=%s), fields: %s",
+                request.user.username, request.user.is_staff, list(request.data.keys()),
+            )
             
             # Get product data
             products_data = json.loads(request.data.get('products', '[]'))
-            print(f"Parsed {len(products_data)} products")
+            logger.debug("Parsed %d products", len(products_data))
             
             if not products_data:
                 return Response({'detail': 'No product data provided'}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Debug the image files
-            print("Files:", request.FILES.keys())
             images = request.FILES.getlist('images')
-            print(f"Found {len(images)} images")
+            logger.debug("Found %d images", len(images))
             
             created_products = []
             
             # Make sure we have at least one category
             if not Category.objects.exists():
                 category = Category.objects.create(name="Default Category", slug="default-category")
-                print(f"Created default category: {category.name}")
+                logger.info("Created default category: %s", category.name)
             
             for i, product_data in enumerate(products_data):
                 try:
-                    # Debug current product
-                    print(f"Processing product {i+1}: {product_data.get('name')}")
+                    logger.debug("Processing product %d: %s", i + 1, product_data.get('name'))
                     
                     # Validate required fields
                     if not product_data.get('name') or not product_data.get('price'):
-                        print(f"Skipping product {i+1}: Missing name or price")
+                        logger.info("Skipping product %d: missing name or price", i + 1)
                         continue
                     
                     # Generate slug if not provided
@@ -444,7 +531,7 @@ class BulkProductUploadView(APIView):
                             category = Category.objects.first()
                     except Category.DoesNotExist:
                         category = Category.objects.first()
-                        print(f"Category not found, using: {category.name}")
+                        logger.info("Category not found, using: %s", category.name)
                     
                     # Get subcategory if provided
                     subcategory = None
@@ -468,24 +555,23 @@ class BulkProductUploadView(APIView):
                         sale_price=product_data.get('sale_price'),
                         category=category,
                         subcategory=subcategory,  # Add subcategory
-                        sizes=product_data.get('sizes', []),
-                        colors=product_data.get('colors', []),
+                        sizes=product_data.get('sizes'),
+                        colors=parse_colors(product_data.get('colors')),
                         featured=product_data.get('featured', False),
                         in_stock=product_data.get('in_stock', True),
                         sku=product_data.get('sku', '')
                     )
-                    print(f"Created product: {product.name} (ID: {product.id})")
+                    logger.debug("Created product: %s (ID: %s)", product.name, product.id)
                     
                     # Assign image to product if available
                     if i < len(images):
                         product.image = images[i]
                         product.save()
-                        print(f"Assigned image to product: {product.name}")
+                        logger.debug("Assigned image to product: %s", product.name)
                     
                     created_products.append(product.id)
                 except Exception as e:
-                    print(f"Error creating product {product_data.get('name', f'product_{i}')}: {str(e)}")
-                    print(traceback.format_exc())
+                    logger.exception("Error creating product %s", product_data.get('name', f'product_{i}'))
             
             return Response({
                 'message': f'Successfully created {len(created_products)} products',
@@ -493,13 +579,14 @@ class BulkProductUploadView(APIView):
             }, status=status.HTTP_201_CREATED)
             
         except Exception as e:
-            print(f"Bulk upload error: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception("Bulk upload error")
             return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class ReviewViewSet(viewsets.ModelViewSet):
-    queryset = Review.objects.all()
+class ReviewViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
+    # user_name is read for every review
+    queryset = Review.objects.select_related('user')
     serializer_class = ReviewSerializer
+    query_budgets = {'list': 4, 'retrieve': 3}
     permission_classes = [permissions.IsAuthenticatedOrReadOnly] # Or appropriate permissions
 
     def perform_create(self, serializer):
@@ -517,6 +604,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
 
 class ShippingAddressViewSet(viewsets.ModelViewSet):
     serializer_class = ShippingAddressSerializer
+    query_budgets = {'list': 4, 'retrieve': 3}
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
@@ -525,16 +613,47 @@ class ShippingAddressViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class WishlistViewSet(viewsets.ModelViewSet):
+class WishlistViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     serializer_class = WishlistItemSerializer
     permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [FragmentJSONRenderer, BrowsableAPIRenderer]
+    query_budgets = {'list': 5, 'retrieve': 3, 'check_product_in_wishlist': 4}
+
+    def list(self, request, *args, **kwargs):
+        """Wishlist items with the product blocks taken from the product fragment cache"""
+        fieldset = Fieldset.from_request(request)
+        if not fieldset.includes('product'):
+            return super().list(request, *args, **kwargs)
+        
+        # Serialize the items without their product, then splice in the product fragments
+        context = self.get_serializer_context()
+        names = list(WishlistItemSerializer(context=context, fieldset=fieldset).fields)
+        item_fieldset = Fieldset(fieldset.fields, fieldset.omit | {'product'})
+        queryset = self.get_queryset().select_related(None).annotate(product_updated_at=F('product__updated_at'))
+        page = self.paginate_queryset(queryset)
+        items = list(queryset if page is None else page)
+        
+        fragments = product_fragments.render_aligned(
+            [{'id': item.product_id, 'updated_at': item.product_updated_at} for item in items],
+            request, fieldset.nested('product'),
+        )
+        data = []
+        for item, fragment in zip(items, fragments):
+            if fragment is None:
+                continue
+            row = WishlistItemSerializer(item, context=context, fieldset=item_fieldset).data
+            data.append({name: fragment if name == 'product' else row[name] for name in names})
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
 
     def get_queryset(self):
         """
         This view should return a list of all the wishlist items
         for the currently authenticated user.
         """
-        return WishlistItem.objects.filter(user=self.request.user).select_related('product')
+        # The nested product serializer reads the category name too
+        return WishlistItem.objects.filter(user=self.request.user).select_related('product__category')
 
     def perform_create(self, serializer):
         """
@@ -579,8 +698,7 @@ class WishlistViewSet(viewsets.ModelViewSet):
         except Product.DoesNotExist:
             return Response({'detail': 'Product not found.'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
-            # Log the exception e for debugging
-            print(f"Error in check_product_in_wishlist: {str(e)}")
+            logger.exception("Error in check_product_in_wishlist")
             return Response({'detail': 'An error occurred.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class UserProfileViewSet(viewsets.ModelViewSet):
@@ -611,16 +729,18 @@ class UserProfileViewSet(viewsets.ModelViewSet):
 class AddressViewSet(viewsets.ModelViewSet):
     serializer_class = AddressSerializer
     permission_classes = [IsAuthenticated]
+    query_budgets = {'list': 4, 'retrieve': 3}
     
     def get_queryset(self):
         return Address.objects.filter(user=self.request.user)
 
-class UserReviewViewSet(viewsets.ReadOnlyModelViewSet):
+class UserReviewViewSet(SparseFieldsetViewMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
+    query_budgets = {'list': 4, 'retrieve': 3}
     
     def get_queryset(self):
-        return Review.objects.filter(user=self.request.user)
+        return Review.objects.filter(user=self.request.user).select_related('user')
 
 def is_staff(user):
     return user.is_staff or user.is_superuser
@@ -634,11 +754,7 @@ def product_create(request):
         form = ProductForm(request.POST, request.FILES)
         image_formset = ProductImageFormSet(request.POST, request.FILES, prefix='images')
         if form.is_valid() and image_formset.is_valid():
-            product = form.save(commit=False)
-            # Process sizes if entered as comma-separated string
-            if isinstance(form.cleaned_data['sizes'], str):
-                product.sizes = [size.strip() for size in form.cleaned_data['sizes'].split(',') if size.strip()]
-            product.save()
+            product = form.save()
             # Save the additional images
             instances = image_formset.save(commit=False)
             for instance in instances:
@@ -674,7 +790,7 @@ def fancy_product_upload(request):
     })
 def product_list(request):
     """View function for listing all products"""
-    products = Product.objects.filter(in_stock=True)
+    products = Product.objects.filter(in_stock=True).order_by('-created_at', '-id')
     return render(request, 'store/product_list.html', {'products': products})
 def product_detail(request, slug):
     """View function for displaying a single product"""
@@ -716,6 +832,15 @@ class SubCategoryViewSet(viewsets.ModelViewSet):
     """API endpoint for subcategories"""
     serializer_class = SubCategorySerializer
     permission_classes = [permissions.AllowAny]  # Public access
+    query_budgets = {'list': 4, 'retrieve': 3}
+    
+    @conditional_get(catalog_validators)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @conditional_get(catalog_validators)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def get_queryset(self):
         queryset = SubCategory.objects.all()
@@ -734,8 +859,7 @@ class SubCategoryViewSet(viewsets.ModelViewSet):
 @permission_classes([IsAuthenticated])
 def create_review(request):
     try:
-        # Log the incoming data for debugging
-        print("Review data received:", request.data)
+        logger.debug("Review data received: %s", request.data)
         
         # Create a modified version with the current user
         data = request.data.copy()
@@ -746,13 +870,24 @@ def create_review(request):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
-            print("Validation errors:", serializer.errors)
+            logger.info("Review validation errors: %s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
-        # Log the exception for debugging
-        print("Error creating review:", str(e))
+        logger.exception("Error creating review")
         return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def cart_quote(request):
+    """
+    Price a cart with store.pricing: {"items": [{"product_id", "quantity"}], "country"}.
+    Products that no longer exist are listed under "missing" instead of failing the quote.
+    """
+    serializer = CartQuoteSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    quote = quote_cart(serializer.validated_data['items'], serializer.validated_data['country'])
+    return Response(quote_data(quote))
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_payment_intent(request):
@@ -762,18 +897,19 @@ def create_payment_intent(request):
         order_data = request.data
         
         # Calculate amount in the smallest currency unit (cents for USD)
-        amount = calculate_order_total(order_data)
+        amount = calculate_order_total(order_data, request.user)
         amount_cents = int(amount * 100)
         
         # Create a PaymentIntent
-        intent = stripe.PaymentIntent.create(
-            amount=amount_cents,
-            currency='usd',
-            metadata={
-                'user_id': request.user.id,
-                'order_id': order_data.get('order_id')
-            },
-        )
+        with phase('stripe'):
+            intent = stripe.PaymentIntent.create(
+                amount=amount_cents,
+                currency=CURRENCY,
+                metadata={
+                    'user_id': request.user.id,
+                    'order_id': order_data.get('order_id')
+                },
+            )
         
         return Response({
             'client_secret': intent.client_secret
@@ -782,6 +918,88 @@ def create_payment_intent(request):
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+def payment_intent_for(order):
+    """
+    The Stripe PaymentIntent for `order.total`, created once per order: later calls
+    retrieve the one recorded on the order, and Stripe's own idempotency key covers
+    a failure between creating it and recording it.
+    """
+    intent_id = (order.payment_details or {}).get('payment_intent')
+    with phase('stripe'):
+        if intent_id:
+            return stripe.PaymentIntent.retrieve(intent_id)
+        intent = stripe.PaymentIntent.create(
+            amount=int(order.total * 100),
+            currency=CURRENCY,
+            metadata={'user_id': order.user_id, 'order_id': order.pk},
+            idempotency_key=f'store-order-{order.pk}-payment',
+        )
+    order.payment_details = {**(order.payment_details or {}), 'payment_intent': intent.id}
+    Order.objects.filter(pk=order.pk).update(payment_details=order.payment_details)
+    return intent
+
+def request_fingerprint(data):
+    """SHA-256 of a request body, the same for the same content whatever its key order"""
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+class CheckoutView(APIView):
+    """
+    POST /api/checkout/ with an Idempotency-Key header and the body of POST /api/orders/:
+    validates and prices the cart, reserves its stock and writes the order and its lines
+    in one transaction, then starts the Stripe payment, all in one round trip.
+
+    A retry with the same key gets the same order back (200 instead of 201) and the same
+    payment intent; the key reused with a different body is refused with 422. Stripe is called after the commit so no database lock is held over
+    the network; if that call fails the order stays pending (its stock goes back through
+    release_expired_reservations if it's never paid) and a retry picks up from there.
+    """
+    permission_classes = [IsAuthenticated]
+    query_budgets = {'post': 11}
+
+    def post(self, request):
+        key = request.headers.get('Idempotency-Key', '').strip()
+        if not key or len(key) > Order._meta.get_field('idempotency_key').max_length:
+            return Response(
+                {'detail': 'An Idempotency-Key header of at most 100 characters is required.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        fingerprint = request_fingerprint(request.data)
+        order, created = self.placed_order(request.user, key), False
+        if order is None:
+            serializer = OrderSerializer(data=request.data, context={'request': request})
+            serializer.is_valid(raise_exception=True)
+            try:
+                order, created = serializer.save(idempotency_key=key, request_fingerprint=fingerprint), True
+            except IntegrityError:
+                # A concurrent request with the same key placed the order first
+                order = self.placed_order(request.user, key)
+                if order is None:
+                    raise
+        if order.request_fingerprint != fingerprint:
+            return Response(
+                {'detail': 'This Idempotency-Key was already used for a different checkout.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+
+        payment, error = None, None
+        if order.payment_method == 'credit_card' and order.status == 'pending':
+            try:
+                intent = payment_intent_for(order)
+                payment = {'payment_intent': intent.id, 'client_secret': intent.client_secret}
+            except stripe.error.StripeError:
+                logger.exception("Payment intent for order %s failed", order.pk)
+                error = 'The payment could not be started. Retry with the same Idempotency-Key.'
+
+        data = {'order': OrderSerializer(order, context={'request': request}).data, 'payment': payment}
+        if error:
+            return Response({**data, 'detail': error}, status=status.HTTP_502_BAD_GATEWAY)
+        return Response(data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    def placed_order(self, user, key):
+        return Order.objects.filter(user=user, idempotency_key=key).prefetch_related('items').first()
+
 @api_view(['POST'])
 def stripe_webhook(request):
     """Handle Stripe webhook events"""
@@ -804,39 +1022,70 @@ def stripe_webhook(request):
         payment_intent = event.data.object
         order_id = payment_intent.metadata.get('order_id')
         
-        # Update order status
-        try:
-            order = Order.objects.get(id=order_id)
-            order.status = 'paid'
-            
-            # Save payment details
-            order.payment_method = 'credit_card'
-            order.payment_details = {
+        order = Order.objects.filter(id=order_id).first()
+        if order is None:
+            return Response({'error': f'Order {order_id} not found'}, status=status.HTTP_404_NOT_FOUND)
+        paid = {
+            'status': 'paid',
+            'payment_method': 'credit_card',
+            'payment_details': {
+                **(order.payment_details or {}),
                 'payment_id': payment_intent.id,
                 'amount': payment_intent.amount / 100,  # Convert cents to dollars
                 'last_four': payment_intent.payment_method_details.card.last4,
                 'brand': payment_intent.payment_method_details.card.brand,
-            }
-            
-            order.save()
-        except Order.DoesNotExist:
-            return Response({'error': f'Order {order_id} not found'}, status=status.HTTP_404_NOT_FOUND)
-    
+            },
+            'updated_at': Now(),
+        }
+
+        # Only a pending order becomes paid; the expiry sweep claims orders the same way
+        if not Order.objects.filter(pk=order.pk, status='pending').update(**paid) and order.status == 'cancelled':
+            # Paid after the sweep gave its stock back: take the stock again, or refund
+            try:
+                with transaction.atomic():
+                    if Order.objects.filter(pk=order.pk, status='cancelled').update(**paid):
+                        reserve_again(order.pk)
+            except OutOfStock:
+                with phase('stripe'):
+                    refund = stripe.Refund.create(
+                        payment_intent=payment_intent.id, idempotency_key=f'store-order-{order.pk}-refund',
+                    )
+                Order.objects.filter(pk=order.pk).update(
+                    payment_details={**(order.payment_details or {}), 'refund': refund.id}
+                )
+                return Response({'status': 'refunded'})
+
     return Response({'status': 'success'})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_order(request):
     try:
-        print("Received order data:", request.data)
+        logger.debug("Received order data: %s", request.data)
         # Your existing code...
         serializer = OrderSerializer(data=request.data)
         if serializer.is_valid():
             order = serializer.save(user=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
-            print("Serializer errors:", serializer.errors)  # Add this for debugging
+            logger.info("Order validation errors: %s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
-        print("Order creation error:", str(e))  # Add this for debugging
-        return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        logger.exception("Order creation error")
+        return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class FromMetricsAddress(BasePermission):
+    """Requests from METRICS_ALLOWED_IPS, i.e. the Prometheus scraper"""
+
+    def has_permission(self, request, view):
+        return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+
+
+@api_view(['GET'])
+# Staff send their API token, or their admin session from a browser
+@authentication_classes([TimedTokenAuthentication, SessionAuthentication])
+@permission_classes([FromMetricsAddress | IsAdminUser])
+def metrics_view(request):
+    """Prometheus scrape endpoint, for METRICS_ALLOWED_IPS and staff users"""
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
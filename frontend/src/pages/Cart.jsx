@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import { useCart } from '../context/CartContext';
 import { showToast } from '../utils/toast';
+import { fetchCartQuote } from '../utils/api';
 
 function Cart() {
   const { cartItems, updateQuantity, removeFromCart } = useCart();
@@ -10,17 +11,24 @@ function Cart() {
   const [couponCode, setCouponCode] = useState('');
   const [couponApplied, setCouponApplied] = useState(false);
   const [discount, setDiscount] = useState(0);
+  const [quote, setQuote] = useState(null);
   
-  // Calculate cart totals
-  const subtotal = cartItems.reduce((total, item) => {
-    const price = item.sale_price && item.sale_price < item.price 
-      ? item.sale_price 
-      : item.price;
-    return total + (price * item.quantity);
-  }, 0);
+  // Totals are priced by the server, as the order will be
+  useEffect(() => {
+    if (cartItems.length === 0) {
+      setQuote(null);
+      return;
+    }
+    let cancelled = false;
+    fetchCartQuote(cartItems).then(({ data }) => {
+      if (!cancelled && data) setQuote(data);
+    });
+    return () => { cancelled = true; };
+  }, [cartItems]);
   
-  const shipping = subtotal > 100 ? 0 : 10;
-  const tax = subtotal * 0.08; // 8% tax rate
+  const subtotal = quote ? parseFloat(quote.subtotal) : 0;
+  const shipping = quote ? parseFloat(quote.shipping) : 0;
+  const tax = quote ? parseFloat(quote.tax) : 0;
   const total = subtotal + shipping + tax - discount;
   
   const handleRemoveItem = (itemId, itemSize) => {
@@ -231,7 +239,7 @@ function Cart() {
             
             {/* Tax */}
             <div className="flex justify-between mb-2">
-              <span className="text-gray-600">Tax (8%)</span>
+              <span className="text-gray-600">Tax</span>
               <span>{tax.toFixed(2)} MAD</span>
             </div>
             
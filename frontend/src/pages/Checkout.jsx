@@ -1,7 +1,8 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useCart } from '../context/CartContext';
 import { showToast } from '../utils/toast';
+import { fetchCartQuote } from '../utils/api';
 import {loadStripe} from '@stripe/stripe-js';
 import {Elements, CardElement, useStripe, useElements} from '@stripe/react-stripe-js';
 
@@ -24,6 +25,11 @@ function Checkout() {
   const [addresses, setAddresses] = useState([]);
   const [selectedAddressId, setSelectedAddressId] = useState(null);
   const [showAddAddressForm, setShowAddAddressForm] = useState(false);
+  // One Idempotency-Key per checkout: resubmitting (a double click, a retry after a
+  // network error) gets the same order back instead of placing another
+  const checkoutKey = useRef(crypto.randomUUID());
+  // An order that was placed but whose payment couldn't be started yet
+  const [placedOrder, setPlacedOrder] = useState(null);
   
   // Form states
   const [shippingFormData, setShippingFormData] = useState({
@@ -151,12 +157,17 @@ function Checkout() {
     setStep(3);
   };
   
+  // A changed cart or address is a different checkout, so it gets a new key (the
+  // server refuses a key reused for different content)
+  useEffect(() => {
+    checkoutKey.current = crypto.randomUUID();
+    setPlacedOrder(null);
+  }, [cartItems, selectedAddressId, shippingFormData]);
+  
   const handlePlaceOrder = async () => {
     setLoading(true);
     
     try {
-      console.log("Starting order creation...");
-      
       // 1. Prepare order data with exact format backend expects
       const orderData = {
         items: cartItems.map(item => ({
@@ -166,6 +177,7 @@ function Checkout() {
           color: item.selectedColor || ''
         })),
         shipping_address: selectedAddressId || null,
+        shipping_country: shippingCountry(),
         shipping_address_data: !selectedAddressId ? {
           full_name: shippingFormData.fullName,
           address: shippingFormData.address,
@@ -177,21 +189,27 @@ function Checkout() {
         } : null,
       };
       
-      console.log("Order payload:", JSON.stringify(orderData, null, 2));
-      
-      // 2. Create order
-      const orderResponse = await fetch('http://localhost:8000/api/orders/', {
+      // 2. Create order and start the payment in one request
+      const orderResponse = await fetch('http://localhost:8000/api/checkout/', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Idempotency-Key': checkoutKey.current,
           'Authorization': `Token ${localStorage.getItem('authToken')}`
         },
         body: JSON.stringify(orderData)
       });
       
-      console.log("Order response status:", orderResponse.status);
-      
       // 3. Handle response
+      if (orderResponse.status === 502) {
+        // The order was placed and only starting the payment failed: sending the same
+        // checkout again with the same key retries just the payment
+        const { order } = await orderResponse.json();
+        setPlacedOrder(order);
+        showToast.error(`Order #${order.id} was placed, but the payment could not be started. Please retry the payment.`);
+        return;
+      }
+      
       if (!orderResponse.ok) {
         let errorText = 'Unknown error';
         
@@ -202,10 +220,8 @@ function Checkout() {
           if (contentType && contentType.includes('application/json')) {
             const errorJson = await orderResponse.json();
             errorText = JSON.stringify(errorJson);
-            console.error("Order error JSON:", errorJson);
           } else {
             errorText = await responseClone.text();
-            console.error("Order error text:", errorText);
           }
         } catch (e) {
           console.error("Error parsing response:", e);
@@ -215,11 +231,10 @@ function Checkout() {
         throw new Error(`Order creation failed: ${errorText}`);
       }
       
-      const createdOrder = await orderResponse.json();
-      console.log("Order created successfully:", createdOrder);
+      const { order: createdOrder } = await orderResponse.json();
       
       // Skip payment for now and just complete the order
-      showToast.success("Order created successfully!");
+      showToast.success(`Order #${createdOrder.id} created successfully!`);
       clearCart();
       navigate('/order-success');
       
@@ -248,12 +263,20 @@ function Checkout() {
     }
   };
   
-  // Calculate total price
-  const calculateTotalPrice = () => {
-    return cartItems.reduce((total, item) => {
-      return total + (parseFloat(item.price) || 0) * item.quantity;
-    }, 0);
+  // The country the order ships to, which its shipping and tax depend on
+  const shippingCountry = () => {
+    const saved = addresses.find(address => address.id === selectedAddressId);
+    return (saved ? saved.country : shippingFormData.country) || 'US';
   };
+
+  // Totals for the review step, priced by the server as the order will be
+  const [quote, setQuote] = useState(null);
+  useEffect(() => {
+    if (step !== 3 || cartItems.length === 0) return;
+    fetchCartQuote(cartItems, shippingCountry())
+      .then(({ data }) => { if (data) setQuote(data); });
+  }, [step, cartItems, addresses, selectedAddressId, shippingFormData.country]);
+  const quoted = (key) => (quote ? parseFloat(quote[key]) : 0);
   
   const getItemPrice = (item) => {
     const price = parseFloat(item.price);
@@ -645,21 +668,21 @@ function Checkout() {
         <div className="space-y-2 mb-4">
           <div className="flex justify-between">
             <span>Subtotal</span>
-            <span>${calculateTotalPrice().toFixed(2)}</span>
+            <span>${quoted('subtotal').toFixed(2)}</span>
           </div>
           <div className="flex justify-between">
             <span>Shipping</span>
-            <span>$0.00</span>
+            <span>${quoted('shipping').toFixed(2)}</span>
           </div>
           <div className="flex justify-between">
             <span>Tax</span>
-            <span>${(calculateTotalPrice() * 0.1).toFixed(2)}</span>
+            <span>${quoted('tax').toFixed(2)}</span>
           </div>
         </div>
         
         <div className="border-t border-gray-200 pt-4 flex justify-between font-medium">
           <span>Total</span>
-          <span>${(calculateTotalPrice() * 1.1).toFixed(2)}</span>
+          <span>${quoted('total').toFixed(2)}</span>
         </div>
       </div>
       
@@ -746,7 +769,7 @@ function Checkout() {
               Processing...
             </span>
           ) : (
-            'Place Order'
+            placedOrder ? 'Retry Payment' : 'Place Order'
           )}
         </button>
       </div>
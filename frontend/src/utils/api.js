@@ -81,4 +81,15 @@ export const api = {
   }),
   
   delete: (url, options = {}) => fetchData(url, { method: 'DELETE', ...options }),
-};
\ No newline at end of file
+};
+
+// Server-side cart pricing (POST /api/cart/quote/): the same subtotal, shipping and tax
+// the order and the payment will be charged with
+export const fetchCartQuote = (cartItems, country = 'US') => api.post(
+  'http://localhost:8000/api/cart/quote/',
+  {
+    items: cartItems.map(item => ({ product_id: item.id, quantity: item.quantity })),
+    country,
+  },
+  { auth: false },
+);